@@ -3,9 +3,16 @@ import subprocess
 import glob
 import json
 import logging
+import re
+import bisect
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from frame_index import dhash, HASH_WIDTH, HASH_HEIGHT
+from metrics import timed
 
 logger = logging.getLogger(__name__)
 
+@timed("probe")
 def get_video_duration(video_path):
     """Get video duration in seconds"""
     cmd = [
@@ -22,126 +29,881 @@ def get_video_duration(video_path):
         logger.error(f"❌ Error getting video duration: {e}")
         return 0
 
-def extract_scene_screenshots(video_path, output_dir, scene_start, scene_end, scene_num):
-    """Extract 3 screenshots from a scene: beginning, middle, end"""
+# Frame positions sampled from every scene, in display order
+SCREENSHOT_POSITIONS = ['beginning', 'middle', 'end']
+
+# Upper bound on seek inputs opened by a single ffmpeg process. Every input runs its own
+# decoder with its own reference frames, so peak memory grows with this times the frame
+# size; fewer inputs per session mean more sessions. Lower it further for 4K sources
+SCREENSHOT_BATCH_FRAMES = int(os.getenv("SCREENSHOT_BATCH_FRAMES", 12))
+
+def scene_screenshot_timestamps(scene_start, scene_end):
+    """Get beginning/middle/end timestamps for a scene"""
     duration = scene_end - scene_start
     
     # Adjust timestamps to avoid transition frames
     offset = min(0.5, duration * 0.1)  # 10% of scene duration or 0.5s, whichever is smaller
     
-    timestamps = [
+    return [
         scene_start + offset,           # Beginning (slightly forward)
         scene_start + duration / 2,     # Middle
         scene_end - offset              # End (slightly back)
     ]
+
+# "Model view" of each frame: a downscaled, compressed copy kept in memory for the
+# LLM payload, while the full-size PNG remains the public thumbnail
+MODEL_IMAGE_MAX_SIZE = int(os.getenv("MODEL_IMAGE_MAX_SIZE", 768))
+MODEL_IMAGE_FORMAT = os.getenv("MODEL_IMAGE_FORMAT", "jpeg").lower()
+MODEL_IMAGE_QUALITY = int(os.getenv("MODEL_IMAGE_QUALITY", 80))
+
+# Identifies the model view settings frames stored in a VideoIndex were made with
+MODEL_VIEW_KEY = f"{MODEL_IMAGE_FORMAT}:{MODEL_IMAGE_MAX_SIZE}:{MODEL_IMAGE_QUALITY}"
+
+def _model_view_args():
+    """ffmpeg encoder arguments and MIME type for the model view format"""
+    if MODEL_IMAGE_FORMAT == "webp":
+        return ["-c:v", "libwebp", "-quality", str(MODEL_IMAGE_QUALITY)], "image/webp"
+    # mjpeg qscale runs from 2 (best) to 31 (worst)
+    qscale = round(2 + (100 - MODEL_IMAGE_QUALITY) * 29 / 100)
+    return ["-c:v", "mjpeg", "-q:v", str(qscale), "-pix_fmt", "yuvj420p"], "image/jpeg"
+
+# Smaller copies of every screenshot served next to the full-size PNG, so galleries
+# don't download full-resolution frames: widths in pixels (empty disables), format and quality
+THUMBNAIL_SIZES = sorted({int(size) for size in os.getenv("THUMBNAIL_SIZES", "320,640").split(",") if size.strip()})
+THUMBNAIL_FORMAT = os.getenv("THUMBNAIL_FORMAT", "webp").lower()
+THUMBNAIL_QUALITY = int(os.getenv("THUMBNAIL_QUALITY", 80))
+
+def _thumbnail_args():
+    """ffmpeg encoder arguments and file extension for thumbnail variants"""
+    if THUMBNAIL_FORMAT == "webp":
+        return ["-c:v", "libwebp", "-quality", str(THUMBNAIL_QUALITY)], "webp"
+    qscale = round(2 + (100 - THUMBNAIL_QUALITY) * 29 / 100)
+    return ["-c:v", "mjpeg", "-q:v", str(qscale), "-pix_fmt", "yuvj420p"], "jpg"
+
+def thumbnail_path(path, width):
+    """Path of a screenshot's variant at the given width"""
+    _, extension = _thumbnail_args()
+    return f"{os.path.splitext(path)[0]}_{width}.{extension}"
+
+def _split_jpeg_stream(data):
+    """Split back-to-back JPEG images by walking their marker segments"""
+    images = []
+    start = 0
+    while data[start:start + 2] == b'\xff\xd8':
+        pos = start + 2
+        while pos + 4 <= len(data) and data[pos] == 0xFF:
+            marker = data[pos + 1]
+            if marker == 0xD9:
+                break
+            pos += 2 + int.from_bytes(data[pos + 2:pos + 4], 'big')
+            if marker == 0xDA:
+                # Entropy-coded data: 0xFF is only a marker when not followed by 0x00 or RSTn
+                while (pos := data.find(b'\xff', pos)) != -1 and pos + 1 < len(data) and \
+                        (data[pos + 1] == 0x00 or 0xD0 <= data[pos + 1] <= 0xD7):
+                    pos += 2
+                if pos == -1:
+                    return images
+        if data[pos:pos + 2] != b'\xff\xd9':
+            break
+        images.append(data[start:pos + 2])
+        start = pos + 2
+    return images
+
+def _split_webp_stream(data):
+    """Split back-to-back WebP (RIFF) images using their chunk sizes"""
+    images = []
+    start = 0
+    while data[start:start + 4] == b'RIFF':
+        end = start + 8 + int.from_bytes(data[start + 4:start + 8], 'little')
+        images.append(data[start:end])
+        start = end
+    return images
+
+def _derived_outputs(sources):
+    """
+    Filter graph and outputs producing the hash grid and model view of each source frame
     
-    positions = ['beginning', 'middle', 'end']
-    screenshots = []
+    Args:
+        sources: Filter labels (one frame each), in order
+        
+    Returns:
+        (graph parts, output args, grids fd) - grids go to a side pipe, model views to stdout
+    """
+    encoder_args, _ = _model_view_args()
+    graph = []
+    for i, source in enumerate(sources):
+        graph.append(f"[{source}]split=2[hash{i}][model{i}]")
+        graph.append(f"[hash{i}]scale={HASH_WIDTH}:{HASH_HEIGHT}:flags=area,format=gray,setsar=1[grid{i}]")
+        graph.append(f"[model{i}]scale='min(iw,{MODEL_IMAGE_MAX_SIZE})':'min(ih,{MODEL_IMAGE_MAX_SIZE})'"
+                     f":force_original_aspect_ratio=decrease:force_divisible_by=2,setsar=1[view{i}]")
+    # Concatenate so results come back in source order; setpts keeps timestamps increasing
+    graph.append("".join(f"[grid{i}]" for i in range(len(sources))) + f"concat=n={len(sources)}:v=1:a=0,setpts=N[grids]")
+    graph.append("".join(f"[view{i}]" for i in range(len(sources))) + f"concat=n={len(sources)}:v=1:a=0,setpts=N[views]")
+    
+    grids_read, grids_write = os.pipe()
+    outputs = [
+        "-map", "[grids]", "-fps_mode", "passthrough", "-f", "rawvideo", "-pix_fmt", "gray", f"pipe:{grids_write}",
+        "-map", "[views]", "-fps_mode", "passthrough", *encoder_args, "-f", "image2pipe", "pipe:1"
+    ]
+    return graph, outputs, (grids_read, grids_write)
+
+def _run_derived(cmd, pipe_fds):
+    """Run ffmpeg and collect (returncode, stderr, hash grids, model view images)"""
+    grids_read, grids_write = pipe_fds
+    try:
+        process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, pass_fds=(grids_write,))
+    finally:
+        os.close(grids_write)
+    
+    # Drain the side pipe concurrently so neither pipe can fill up and stall ffmpeg
+    grids = []
+    with os.fdopen(grids_read, "rb") as grids_pipe:
+        reader = threading.Thread(target=lambda: grids.append(grids_pipe.read()))
+        reader.start()
+        views, stderr = process.communicate()
+        reader.join()
+    
+    grid_data = grids[0] if grids else b''
+    grid_size = HASH_WIDTH * HASH_HEIGHT
+    grid_list = [grid_data[i:i + grid_size] for i in range(0, len(grid_data) - grid_size + 1, grid_size)]
+    split = _split_webp_stream if MODEL_IMAGE_FORMAT == "webp" else _split_jpeg_stream
+    return process.returncode, stderr.decode(errors='replace'), grid_list, split(views)
+
+def _frame_info(grids, views, index, count):
+    """Per-frame hash and model view, or None for both when the outputs don't line up"""
+    _, mime = _model_view_args()
+    return {
+        'phash': dhash(grids[index]) if len(grids) == count else None,
+        'model_image': {'data': views[index], 'mime': mime} if len(views) == count else None
+    }
+
+def _run_frame_session(video_path, batch):
+    """Run one ffmpeg session writing a frame per (timestamp, output_path); returns info for those written"""
+    cmd = ["ffmpeg", "-hide_banner", "-loglevel", "error", "-y"]
+    for timestamp, _ in batch:
+        cmd += ["-ss", f"{max(timestamp, 0):.3f}", "-i", video_path]
+    
+    # One frame per input, split into the full-size screenshot and the derived outputs
+    graph = [f"[{i}:v]trim=end_frame=1,split=2[shot{i}][frame{i}]" for i in range(len(batch))]
+    derived_graph, derived_outputs, pipe_fds = _derived_outputs([f"frame{i}" for i in range(len(batch))])
+    cmd += ["-filter_complex", ";".join(graph + derived_graph)]
+    for i, (_, filepath) in enumerate(batch):
+        cmd += ["-map", f"[shot{i}]", "-frames:v", "1", filepath]
+    cmd += derived_outputs
+    
+    returncode, stderr, grids, views = _run_derived(cmd, pipe_fds)
+    if returncode != 0:
+        logger.error(f"❌ Frame extraction failed: {stderr[-500:]}")
     
-    for i, (timestamp, position) in enumerate(zip(timestamps, positions)):
-        filename = f"scene_{scene_num:03d}_{position}.png"
-        filepath = os.path.join(output_dir, filename)
+    # Inputs that produced no frame contribute nothing to the concatenated outputs
+    produced = [filepath for _, filepath in batch if os.path.exists(filepath) and os.path.getsize(filepath) > 0]
+    return {filepath: _frame_info(grids, views, index, len(produced)) for index, filepath in enumerate(produced)}
+
+def _derive_from_images(paths):
+    """Hash grids and model views for screenshots already on disk, in one ffmpeg session"""
+    cmd = ["ffmpeg", "-hide_banner", "-loglevel", "error"]
+    for path in paths:
+        cmd += ["-i", path]
+    derived_graph, derived_outputs, pipe_fds = _derived_outputs([f"{i}:v" for i in range(len(paths))])
+    cmd += ["-filter_complex", ";".join(derived_graph)] + derived_outputs
+    
+    _, _, grids, views = _run_derived(cmd, pipe_fds)
+    return {path: _frame_info(grids, views, index, len(paths)) for index, path in enumerate(paths)}
+
+@timed("thumbnails")
+def write_thumbnails(paths):
+    """
+    Write the THUMBNAIL_SIZES variants of screenshots already on disk
+    
+    Screenshots are decoded once per batch and scaled to every width in the
+    same ffmpeg session (never upscaled); variants that already exist, e.g.
+    restored from the result cache, are kept as they are.
+    
+    Args:
+        paths: Screenshot paths
         
-        cmd = [
-            "ffmpeg", "-i", video_path, "-ss", str(timestamp),
-            "-vframes", "1", filepath, "-y"
-        ]
+    Returns:
+        Dict of screenshot path -> {width: variant path} for the variants on disk
+    """
+    if not THUMBNAIL_SIZES:
+        return {}
+    
+    encoder_args, _ = _thumbnail_args()
+    pending = [path for path in paths if not all(os.path.exists(thumbnail_path(path, width)) for width in THUMBNAIL_SIZES)]
+    for batch_start in range(0, len(pending), SCREENSHOT_BATCH_FRAMES):
+        batch = pending[batch_start:batch_start + SCREENSHOT_BATCH_FRAMES]
+        cmd = ["ffmpeg", "-hide_banner", "-loglevel", "error", "-y"]
+        graph = []
+        outputs = []
+        for i, path in enumerate(batch):
+            cmd += ["-i", path]
+            graph.append(f"[{i}:v]split={len(THUMBNAIL_SIZES)}" + "".join(f"[in{i}_{width}]" for width in THUMBNAIL_SIZES))
+            for width in THUMBNAIL_SIZES:
+                graph.append(f"[in{i}_{width}]scale='min(iw,{width})':-2:flags=lanczos,setsar=1[thumb{i}_{width}]")
+                outputs += ["-map", f"[thumb{i}_{width}]", "-frames:v", "1", *encoder_args, thumbnail_path(path, width)]
+        cmd += ["-filter_complex", ";".join(graph)] + outputs
         
-        logger.info(f"🎞️ Extracting scene {scene_num} {position} at {timestamp:.1f}s")
-        subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        result = subprocess.run(cmd, capture_output=True, text=True)
+        if result.returncode != 0:
+            logger.error(f"❌ Thumbnail generation failed: {result.stderr[-500:]}")
+    
+    variants = {}
+    for path in paths:
+        variants[path] = {}
+        for width in THUMBNAIL_SIZES:
+            variant = thumbnail_path(path, width)
+            if os.path.exists(variant) and os.path.getsize(variant) > 0:
+                variants[path][width] = variant
+    return variants
+
+def extract_frames(video_path, frames, video_index=None):
+    """
+    Extract single frames at the given timestamps in one ffmpeg session
+    
+    Every timestamp becomes its own input with `-ss` placed before `-i`, so
+    the demuxer seeks to the nearest keyframe and only decodes from there
+    instead of decoding the video from the start for every frame. Each frame
+    is also shrunk to a tiny grayscale grid for perceptual hashing and to a
+    compressed model view for the LLM, both piped back into memory so no
+    image has to be read back from disk.
+    
+    Args:
+        video_path: Path to input video file
+        frames: List of (timestamp, output_path) tuples
+        video_index: Optional VideoIndex; frames it already holds are linked instead
+            of decoded, and newly extracted frames are added to it
         
-        if os.path.exists(filepath):
-            screenshots.append({
-                'path': filepath,
-                'timestamp': timestamp,
-                'position': position,
-                'scene_start': scene_start,
-                'scene_end': scene_end
-            })
+    Returns:
+        Dict of written output path -> {'phash': hex dHash, 'model_image': {'data', 'mime'}}
+    """
+    written = {}
+    if video_index is not None:
+        remaining = []
+        for timestamp, path in frames:
+            stored = video_index.load_frame(timestamp, path, MODEL_VIEW_KEY)
+            if stored:
+                written[path] = stored
+            else:
+                remaining.append((timestamp, path))
+        if len(remaining) < len(frames):
+            logger.info(f"⚡ Reusing {len(frames) - len(remaining)} indexed frames")
+        frames = remaining
     
-    return screenshots
+    for batch_start in range(0, len(frames), SCREENSHOT_BATCH_FRAMES):
+        batch = frames[batch_start:batch_start + SCREENSHOT_BATCH_FRAMES]
+        logger.info(f"🎞️ Extracting {len(batch)} frames in one ffmpeg session")
+        written.update(_run_frame_session(video_path, batch))
+        
+        # A seek past the last decodable frame aborts the whole session, so retry stragglers alone
+        missing = [frame for frame in batch if frame[1] not in written]
+        if missing and len(batch) > 1:
+            logger.info(f"🔁 Retrying {len(missing)} frames individually")
+            for frame in missing:
+                written.update(_run_frame_session(video_path, [frame]))
+    
+    # An aborted session leaves its derived outputs misaligned; rebuild those from the screenshots
+    incomplete = [path for path, info in written.items() if info['phash'] is None or info['model_image'] is None]
+    if incomplete:
+        written.update(_derive_from_images(incomplete))
+    
+    if video_index is not None:
+        for timestamp, path in frames:
+            if path in written:
+                video_index.add_frame(timestamp, path, written[path], MODEL_VIEW_KEY)
+    
+    return written
 
-def extract_scenes(video_path, output_dir, scene_threshold=0.06, max_scenes=10, min_scenes=2):
+def _scene_frame_plan(output_dir, scene_start, scene_end, scene_num):
+    """Build (timestamp, position, path) entries for one scene"""
+    timestamps = scene_screenshot_timestamps(scene_start, scene_end)
+    return [
+        (timestamp, position, os.path.join(output_dir, f"scene_{scene_num:03d}_{position}.png"))
+        for timestamp, position in zip(timestamps, SCREENSHOT_POSITIONS)
+    ]
+
+@timed("screenshots")
+def extract_screenshots_batch(video_path, output_dir, scenes, video_index=None):
     """
-    Extract scene changes from video using ffmpeg with intelligent fallback
+    Extract beginning/middle/end screenshots for many scenes at once
     
     Args:
         video_path: Path to input video file
-        output_dir: Directory to save scene thumbnails
-        scene_threshold: Sensitivity for scene detection (0.1-1.0)
-        max_scenes: Maximum number of scenes to extract
-        min_scenes: Minimum number of scenes for longer videos
+        output_dir: Directory to save screenshots
+        scenes: List of (scene_start, scene_end, scene_num) tuples
+        video_index: Optional VideoIndex of previously extracted frames (see extract_frames)
         
     Returns:
-        List of paths to extracted scene images
+        List of screenshot dicts in scene order
     """
-    os.makedirs(output_dir, exist_ok=True)
+    plans = [(scene, _scene_frame_plan(output_dir, *scene)) for scene in scenes]
+    for (scene_start, scene_end, scene_num), plan in plans:
+        logger.info(f"🎬 Scene {scene_num}: {scene_start:.1f}s - {scene_end:.1f}s, "
+                    f"frames at {', '.join(f'{ts:.1f}s' for ts, _, _ in plan)}")
     
-    # Get video duration
-    duration = get_video_duration(video_path)
+    written = extract_frames(video_path, [(ts, path) for _, plan in plans for ts, _, path in plan], video_index)
+    thumbnails = write_thumbnails(list(written))
+    
+    screenshots = []
+    for (scene_start, scene_end, _), plan in plans:
+        for timestamp, position, filepath in plan:
+            if filepath in written:
+                screenshots.append({
+                    'path': filepath,
+                    'timestamp': timestamp,
+                    'position': position,
+                    'scene_start': scene_start,
+                    'scene_end': scene_end,
+                    'phash': written[filepath]['phash'],
+                    'model_image': written[filepath]['model_image'],
+                    'thumbnails': thumbnails.get(filepath, {})
+                })
+    return screenshots
+
+def extract_scene_screenshots(video_path, output_dir, scene_start, scene_end, scene_num):
+    """Extract 3 screenshots from a scene: beginning, middle, end"""
+    return extract_screenshots_batch(video_path, output_dir, [(scene_start, scene_end, scene_num)])
+
+_DURATION_RE = re.compile(r'Duration:\s*(\d+):(\d+):(\d+(?:\.\d+)?)')
+_START_RE = re.compile(r'Duration:.*?, start: (-?\d+(?:\.\d+)?)')
+_STATS_TIME_RE = re.compile(r'time=\s*(-?\d+):(\d+):(\d+(?:\.\d+)?)')
+_VIDEO_STREAM_RE = re.compile(r'Stream #\d+:\d+.*?: Video: (\w+)')
+_RESOLUTION_RE = re.compile(r', (\d{2,5})x(\d{2,5})[ ,]')
+_FPS_RE = re.compile(r', ([\d.]+) fps')
+
+def _hms_to_seconds(match):
+    hours, minutes, seconds = match.groups()
+    return int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+
+class InputStreamError(Exception):
+    """Raised when the stream feeding scene detection fails (e.g. an interrupted download)"""
+
+# Bytes handed to ffmpeg's stdin per write when detection reads from a stream
+STREAM_CHUNK_SIZE = 1024 * 1024
+
+def _feed_stdin(source, stdin, errors):
+    """Copy a blocking readable source into ffmpeg's stdin, recording any read failure"""
+    try:
+        while chunk := source.read(STREAM_CHUNK_SIZE):
+            stdin.write(chunk)
+    except BrokenPipeError:
+        pass  # ffmpeg exited early; its return code tells why
+    except Exception as e:
+        errors.append(e)
+    finally:
+        try:
+            stdin.close()
+        except BrokenPipeError:
+            pass
+
+def _parse_input_header(line, probe):
+    """Fill probe from one line of ffmpeg's input description"""
+    if not probe['duration'] and (match := _DURATION_RE.search(line)):
+        probe['duration'] = _hms_to_seconds(match)
+    elif probe['codec'] is None and (match := _VIDEO_STREAM_RE.search(line)):
+        probe['codec'] = match.group(1)
+        if resolution := _RESOLUTION_RE.search(line):
+            probe['width'], probe['height'] = int(resolution.group(1)), int(resolution.group(2))
+        if fps := _FPS_RE.search(line):
+            probe['fps'] = float(fps.group(1))
+
+def _empty_probe():
+    return {'duration': 0, 'codec': None, 'width': None, 'height': None, 'fps': None}
+
+@timed("probe")
+def probe_video(video_path):
+    """Duration and video stream metadata from ffmpeg's input description (no decoding)"""
+    result = subprocess.run(["ffmpeg", "-hide_banner", "-nostdin", "-i", video_path],
+                            capture_output=True, text=True, errors='replace')
+    probe = _empty_probe()
+    for line in result.stderr.splitlines():
+        _parse_input_header(line, probe)
+    return probe
+
+def list_keyframes(video_path):
+    """
+    Presentation times of the video stream's keyframes, read without decoding
+    
+    Times are seconds from the container's probed start time, the origin
+    ffmpeg uses for -ss seeks and for the pts_time of decoded frames, so
+    they line up with scene scores even when the video stream starts later
+    than the container (e.g. after leading audio).
+    """
+    # Packet timestamps as stored; the start time is subtracted below
+    cmd = ["ffmpeg", "-hide_banner", "-nostdin", "-i", video_path, "-map", "0:v:0", "-c", "copy", "-copyts", "-f", "framecrc", "-"]
+    result = subprocess.run(cmd, capture_output=True, text=True, errors='replace')
+    if result.returncode != 0:
+        raise RuntimeError(f"ffmpeg keyframe listing exited with {result.returncode}")
+    
+    start = _START_RE.search(result.stderr)
+    time_base = None
+    pts_values = []
+    for line in result.stdout.splitlines():
+        if line.startswith('#tb 0:'):
+            numerator, denominator = line.split(':', 1)[1].strip().split('/')
+            time_base = int(numerator) / int(denominator)
+        elif line and not line.startswith('#'):
+            fields = [field.strip() for field in line.split(',')]
+            # Packets carry "F=0x.." only when their flags differ from a plain keyframe
+            flags = int(fields[6][2:], 16) if len(fields) > 6 and fields[6].startswith('F=') else 1
+            if flags & 1:
+                pts_values.append(int(fields[2]))
+    
+    if time_base is None or not pts_values:
+        return []
+    start_time = float(start.group(1)) if start else min(pts_values) * time_base
+    return sorted(pts * time_base - start_time for pts in pts_values)
+
+def _scene_pass(cmd, on_time=None, source=None):
+    """
+    Run one ffmpeg scene-scoring command and parse its stderr while it decodes
+    
+    Returns:
+        (probe, scores) where scores is a list of (pts_time, score) for every frame
+    """
+    probe = _empty_probe()
+    scores = []
+    pending_time = None
+    in_input_header = True
+    tail = []
+    
+    # Text mode translates the \r-terminated stats updates into separate lines
+    process = subprocess.Popen(cmd, stdin=subprocess.PIPE if source else subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+                               stderr=subprocess.PIPE, text=True, errors='replace')
+    feed_errors = []
+    if source:
+        # Binary handle on the same pipe; the text wrapper is never written to
+        feeder = threading.Thread(target=_feed_stdin, args=(source, process.stdin.buffer, feed_errors), daemon=True)
+        feeder.start()
+    try:
+        for line in process.stderr:
+            line = line.rstrip()
+            if not line:
+                continue
+            tail = (tail + [line])[-5:]
+        
+            if 'pts_time:' in line:
+                try:
+                    pending_time = float(line.split('pts_time:')[1].split()[0])
+                except (IndexError, ValueError):
+                    pending_time = None
+                continue
+        
+            if 'lavfi.scene_score=' in line:
+                if pending_time is not None:
+                    try:
+                        scores.append((pending_time, float(line.split('lavfi.scene_score=')[1].split()[0])))
+                    except (IndexError, ValueError):
+                        pass
+                pending_time = None
+                continue
+        
+            if in_input_header:
+                if line.startswith(('Stream mapping:', 'Output #')):
+                    in_input_header = False
+                else:
+                    _parse_input_header(line, probe)
+                continue
+        
+            if on_time and (match := _STATS_TIME_RE.search(line)):
+                on_time(_hms_to_seconds(match), probe)
+    
+    except BaseException:
+        process.kill()
+        process.wait()
+        raise
+    
+    returncode = process.wait()
+    if source:
+        feeder.join()
+        if feed_errors:
+            raise InputStreamError(f"Video stream failed during scene detection: {feed_errors[0]}")
+    if returncode != 0:
+        raise RuntimeError(f"ffmpeg scene detection exited with {returncode}: {' | '.join(tail)}")
+    return probe, scores
+
+_SCENE_SCORE_FILTER = "select='gte(scene,0)',metadata=print:key=lavfi.scene_score"
+
+# Parallel detection: ffmpeg processes scoring separate stretches of one video at once
+DETECT_PARALLELISM = int(os.getenv("DETECT_PARALLELISM", os.cpu_count() or 1))
+# Shortest stretch worth its own process; shorter videos use fewer segments
+DETECT_SEGMENT_MIN_SECONDS = float(os.getenv("DETECT_SEGMENT_MIN_SECONDS", 60))
+
+def _segment_plan(duration, keyframes, segments):
+    """
+    Split the timeline at keyframes into (decode_start, own_start, own_end) segments
+    
+    Each segment owns the frames in [own_start, own_end) and starts decoding
+    at the keyframe before own_start, so the scene scores of its first owned
+    frames are computed against the real preceding frames and cuts on a
+    segment edge are scored exactly as in a single pass.
+    
+    Keyframe times and the returned offsets share the origin of list_keyframes
+    (the probed start time), so they go to -ss as they are; the first keyframe
+    need not be at 0.
+    """
+    boundaries = [0.0]
+    for i in range(1, segments):
+        index = bisect.bisect_right(keyframes, duration * i / segments) - 1
+        if index > 0 and keyframes[index] > boundaries[-1]:
+            boundaries.append(keyframes[index])
+    
+    plan = []
+    for i, own_start in enumerate(boundaries):
+        own_end = boundaries[i + 1] if i + 1 < len(boundaries) else None
+        previous = bisect.bisect_left(keyframes, own_start) - 1
+        decode_start = keyframes[previous] if previous >= 0 else 0.0
+        plan.append((decode_start, own_start, own_end))
+    return plan
+
+def _detect_segmented(video_path, probe, segments, progress_callback=None):
+    """Score a local video's frames with one ffmpeg process per keyframe-aligned segment"""
+    plan = _segment_plan(probe['duration'], list_keyframes(video_path), segments)
+    if len(plan) < 2:
+        return None
+    
+    logger.info(f"🧩 Scoring {len(plan)} segments in parallel: "
+                f"{', '.join(f'{own_start:.1f}s' for _, own_start, _ in plan)}")
+    decoder_threads = max(1, (os.cpu_count() or 1) // len(plan))
+    decoded = [0.0] * len(plan)
+    last_reported = [-1]
+    lock = threading.Lock()
+    
+    def on_time(index, decode_start, own_end):
+        span = (own_end if own_end is not None else probe['duration']) - decode_start
+        
+        def update(seconds, _):
+            with lock:
+                decoded[index] = min(max(seconds, 0.0), span)
+                fraction = min(sum(decoded) / probe['duration'], 1.0)
+                if int(fraction * 100) <= last_reported[0]:
+                    return
+                last_reported[0] = int(fraction * 100)
+            progress_callback(fraction, probe)
+        return update
+    
+    def run(index, decode_start, own_start, own_end):
+        cmd = ["ffmpeg", "-hide_banner", "-nostdin", "-stats_period", "0.5", "-threads", str(decoder_threads),
+               "-ss", f"{decode_start:.6f}"]
+        if own_end is not None:
+            cmd += ["-t", f"{own_end - decode_start + 0.5:.6f}"]
+        cmd += ["-i", video_path, "-filter_complex", _SCENE_SCORE_FILTER, "-f", "null", "-"]
+        _, scores = _scene_pass(cmd, on_time(index, decode_start, own_end) if progress_callback else None)
+        
+        # Timestamps restart at the seek point; offset by it they are on the single pass's origin.
+        # Keep only the frames this segment owns
+        owned = []
+        for pts_time, score in scores:
+            timestamp = decode_start + pts_time
+            if timestamp >= own_start - 1e-6 and (own_end is None or timestamp < own_end - 1e-6):
+                owned.append((timestamp, score))
+        return owned
+    
+    with ThreadPoolExecutor(max_workers=len(plan)) as pool:
+        futures = [pool.submit(run, index, *segment) for index, segment in enumerate(plan)]
+        scores = [score for future in futures for score in future.result()]
+    return scores
+
+def detect_scene_changes(video_path, progress_callback=None, source=None):
+    """
+    Probe and score every frame for scene changes while ffmpeg decodes
+    
+    ffmpeg's stderr is read line by line while decoding, so the container
+    duration, video stream metadata and scene scores are collected without
+    a separate ffprobe run or buffering the whole log in memory. The score
+    of every frame is kept (not only those above a threshold) so boundaries
+    can be chosen afterwards for any threshold or scene count.
+    
+    Local videos longer than DETECT_SEGMENT_MIN_SECONDS are split into
+    keyframe-aligned segments scored by up to DETECT_PARALLELISM ffmpeg
+    processes at once; the merged curve matches a single pass.
+    
+    When a source is given (a file-like whose read() blocks until more of
+    the video is available) ffmpeg decodes it from stdin in a single pass
+    instead, so detection can run while the file at video_path is still
+    being written.
+    
+    Args:
+        video_path: Path to input video file
+        progress_callback: Optional callable(fraction, probe) invoked as decoding advances
+        source: Optional readable stream of the video's bytes
+        
+    Returns:
+        Dict with duration, stream metadata and a list of (pts_time, score) for every frame
+    """
+    if source is None and DETECT_PARALLELISM > 1:
+        probe = probe_video(video_path)
+        segments = min(DETECT_PARALLELISM, int(probe['duration'] // DETECT_SEGMENT_MIN_SECONDS))
+        if segments > 1:
+            scores = _detect_segmented(video_path, probe, segments, progress_callback)
+            if scores is not None:
+                return _finish_detection(video_path, probe, scores, progress_callback)
     
-    # Try scene detection first to get scene boundaries
-    logger.info(f"🔍 Attempting automatic scene detection with threshold {scene_threshold}")
     cmd = [
-        "ffmpeg", "-i", video_path,
-        "-filter_complex", f"select='gt(scene,{scene_threshold})',metadata=print",
+        "ffmpeg", "-hide_banner", "-nostdin", "-stats_period", "0.5", "-i", "pipe:0" if source else video_path,
+        "-filter_complex", _SCENE_SCORE_FILTER,
         "-f", "null", "-"
     ]
-    
     logger.info(f"🔧 FFmpeg command: {' '.join(cmd)}")
     
-    scene_times = [0]  # Start with beginning of video
+    last_reported = [-1]
     
-    try:
-        result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True, text=True)
-        logger.info(f"📝 FFmpeg stderr: {result.stderr[:200]}...")
+    def on_time(seconds, probe):
+        if not probe['duration']:
+            return
+        fraction = min(max(seconds / probe['duration'], 0.0), 1.0)
+        if int(fraction * 100) > last_reported[0]:
+            last_reported[0] = int(fraction * 100)
+            progress_callback(fraction, probe)
+    
+    probe, scores = _scene_pass(cmd, on_time if progress_callback else None, source)
+    return _finish_detection(video_path, probe, scores, progress_callback)
+
+def _finish_detection(video_path, probe, scores, progress_callback):
+    if not probe['duration']:
+        probe['duration'] = get_video_duration(video_path)
+    
+    logger.info(f"📏 Video duration: {probe['duration']:.2f} seconds "
+                f"({probe['codec']}, {probe['width']}x{probe['height']} @ {probe['fps']} fps)")
+    if progress_callback:
+        progress_callback(1.0, probe)
+    
+    return {**probe, 'scores': scores}
+
+# Shortest scene (seconds) boundary selection will produce when the video allows it
+MIN_SCENE_LENGTH = float(os.getenv("MIN_SCENE_LENGTH", 1.0))
+
+# Below-threshold changes used to split long scenes must score at least this fraction
+# of scene_threshold; weaker ones are noise, and scenes are split evenly instead
+SPLIT_MIN_SCORE_RATIO = float(os.getenv("SPLIT_MIN_SCORE_RATIO", 0.5))
+
+def _fallback_scene_count(duration, min_scenes, max_scenes):
+    """Number of scenes to use for a video without detectable cuts"""
+    if duration > 15:
+        return min(max(3, min_scenes), max_scenes)
+    elif duration > 10:
+        return min(min_scenes, max_scenes)
+    return max(1, min(int(duration / 5), max_scenes))
+
+def select_scene_boundaries(scores, duration, scene_threshold=0.06, max_scenes=10, min_scenes=2, min_scene_length=MIN_SCENE_LENGTH):
+    """
+    Choose scene boundaries from a per-frame scene score curve
+    
+    Cuts scoring above the threshold are taken strongest first, skipping any
+    that would create a scene shorter than min_scene_length, until max_scenes
+    is reached. If that leaves too few scenes, the longest scene is split at
+    its strongest remaining change until the minimum scene count is met.
+    Changes weaker than SPLIT_MIN_SCORE_RATIO * scene_threshold don't count:
+    a scene without one is split at its midpoint, and a video without any is
+    divided evenly.
+    
+    Args:
+        scores: List of (pts_time, score) for every decoded frame
+        duration: Video duration in seconds
+        scene_threshold: Sensitivity for scene detection (0.1-1.0)
+        max_scenes: Maximum number of scenes to produce
+        min_scenes: Minimum number of scenes when cuts are detected
+        min_scene_length: Shortest allowed scene in seconds
         
-        # Parse scene change timestamps from stderr
-        for line in result.stderr.split('\n'):
-            if 'pts_time:' in line and 'scene_score' in line:
-                try:
-                    pts_time = float(line.split('pts_time:')[1].split()[0])
-                    scene_times.append(pts_time)
-                except:
-                    continue
+    Returns:
+        Sorted list of boundary timestamps starting at 0 and ending at duration
+    """
+    max_cuts = max(max_scenes, 1) - 1
+    
+    cuts = []
+    for pts_time, score in sorted(scores, key=lambda item: (-item[1], item[0])):
+        if score <= scene_threshold or len(cuts) >= max_cuts:
+            break
+        if pts_time < min_scene_length or duration - pts_time < min_scene_length:
+            continue
+        index = bisect.bisect_left(cuts, pts_time)
+        if index > 0 and pts_time - cuts[index - 1] < min_scene_length:
+            continue
+        if index < len(cuts) and cuts[index] - pts_time < min_scene_length:
+            continue
+        cuts.insert(index, pts_time)
+    
+    target_scenes = min(min_scenes, max_scenes) if cuts else _fallback_scene_count(duration, min_scenes, max_scenes)
+    if len(cuts) + 1 < target_scenes:
+        logger.info(f"📐 {len(cuts) + 1} scenes above threshold, splitting longest scenes to reach {target_scenes}")
+    
+    min_split_score = scene_threshold * SPLIT_MIN_SCORE_RATIO
+    ordered_scores = sorted((pts_time, score) for pts_time, score in scores if score >= min_split_score)
+    if not cuts and not ordered_scores:
+        # Static or noisy video: nothing to align the scenes with
+        return [duration * i / target_scenes for i in range(target_scenes)] + [duration]
+    
+    boundaries = [0] + cuts + [duration]
+    times = [pts_time for pts_time, _ in ordered_scores]
+    while len(boundaries) - 1 < target_scenes:
+        # Split the longest scene, keeping both halves at least min_scene_length long if possible
+        longest = max(range(len(boundaries) - 1), key=lambda i: boundaries[i + 1] - boundaries[i])
+        start, end = boundaries[longest], boundaries[longest + 1]
+        middle = (start + end) / 2
+        margin = min(min_scene_length, (end - start) / 4)
         
-        scene_times.append(duration)  # End with end of video
-        scene_times = sorted(list(set(scene_times)))  # Remove duplicates and sort
+        # Strongest change, ties going to the one nearest the middle; the middle itself when none qualifies
+        lo = bisect.bisect_left(times, start + margin)
+        hi = bisect.bisect_right(times, end - margin)
+        candidates = ordered_scores[lo:hi]
+        split = max(candidates, key=lambda item: (item[1], -abs(item[0] - middle)))[0] if candidates else middle
+        boundaries.insert(longest + 1, split)
+    
+    return boundaries
+
+# Scene scoring backends: ffmpeg's scene filter, or NumPy scoring of downscaled frames (needs numpy)
+SCENE_DETECTORS = ("ffmpeg", "numpy-fast")
+DEFAULT_SCENE_DETECTOR = os.getenv("SCENE_DETECTOR", "ffmpeg")
+
+def get_scene_detector(name):
+    """Scoring function of a detector backend, callable(video_path, progress_callback, source) -> detection dict"""
+    if name == "ffmpeg":
+        return detect_scene_changes
+    if name == "numpy-fast":
+        # Imported on first use so numpy stays optional for the default backend
+        from numpy_detector import detect_scene_changes as detect_with_numpy
+        return detect_with_numpy
+    raise ValueError(f"Unknown scene detector '{name}'")
+
+def scene_detector_settings(name, source=None):
+    """
+    Settings a detector's scores depend on, as a JSON-ready dict
+
+    Stored with indexed scores so a video scored with other settings is decoded again.
+    """
+    if name == "numpy-fast":
+        from numpy_detector import score_settings
+        return score_settings(source)
+    return {}
+
+def available_scene_detectors():
+    """Detector names usable in this environment"""
+    try:
+        import numpy  # noqa: F401
+    except ImportError:
+        return ["ffmpeg"]
+    return list(SCENE_DETECTORS)
+
+def detect_scene_boundaries(video_path, scene_threshold=0.06, max_scenes=10, min_scenes=2, progress_callback=None, source=None,
+                            detector=DEFAULT_SCENE_DETECTOR, video_index=None):
+    """
+    Detect scene boundaries from a per-frame scene score curve
+    
+    Args:
+        video_path: Path to input video file
+        scene_threshold: Sensitivity for scene detection (0.1-1.0)
+        max_scenes: Maximum number of scenes to extract
+        min_scenes: Minimum number of scenes when cuts are detected
+        progress_callback: Optional callable(fraction, probe) for detection progress
+        source: Optional readable stream of the video's bytes (see detect_scene_changes)
+        detector: Scoring backend, one of SCENE_DETECTORS
+        video_index: Optional VideoIndex; scores it holds for the detector are reused
+            instead of decoding, and fresh scores are stored in it
         
-        if len(scene_times) > 2 and len(scene_times) - 1 <= max_scenes:
-            logger.info(f"✅ Automatic scene detection found {len(scene_times) - 1} scenes")
+    Returns:
+        Sorted list of boundary timestamps starting at 0 and ending at the video duration
+    """
+    # Score every frame once, then choose boundaries from the score curve
+    logger.info(f"🔍 Attempting automatic scene detection with threshold {scene_threshold}")
+    
+    try:
+        settings = scene_detector_settings(detector, source)
+        detection = video_index.load_scores(detector, settings) if video_index is not None else None
+        if detection is not None:
+            logger.info(f"⚡ Reusing {len(detection['scores'])} indexed frame scores ({detector})")
+            if progress_callback:
+                progress_callback(1.0, detection)
         else:
-            logger.info(f"⚠️ Scene detection found {len(scene_times) - 1} scenes, using fallback")
-            raise Exception("Using fallback")
-            
+            with timed("scene_detection"):
+                detection = get_scene_detector(detector)(video_path, progress_callback, source)
+            if video_index is not None:
+                video_index.save_scores(detector, detection, settings)
+        duration = detection['duration']
+        scene_times = select_scene_boundaries(detection['scores'], duration, scene_threshold, max_scenes, min_scenes)
+        logger.info(f"✅ Automatic scene detection found {len(scene_times) - 1} scenes "
+                    f"from {len(detection['scores'])} scored frames")
+    
+    except InputStreamError:
+        # The video itself is incomplete; there is nothing sound to fall back to
+        raise
     except Exception as e:
         logger.info(f"⚠️ Scene detection failed, using fallback: {e}")
         
-        # Fallback: Create scene boundaries based on video length
-        if duration > 15:
-            min_scenes_for_long = max(3, min_scenes)
-            num_scenes = min(min_scenes_for_long, max_scenes)
-            logger.info(f"📐 Long video ({duration:.1f}s): creating {num_scenes} scenes")
-        elif duration > 10:
-            num_scenes = min(min_scenes, max_scenes)
-            logger.info(f"📐 Medium video ({duration:.1f}s): creating {num_scenes} scenes")
-        else:
-            num_scenes = max(1, min(int(duration / 5), max_scenes))
-            logger.info(f"📐 Short video ({duration:.1f}s): creating {num_scenes} scenes")
-        
-        # Create evenly spaced scene boundaries
+        # Fallback: Create evenly spaced scene boundaries based on video length
+        duration = get_video_duration(video_path)
+        num_scenes = _fallback_scene_count(duration, min_scenes, max_scenes)
+        logger.info(f"📐 Video ({duration:.1f}s): creating {num_scenes} scenes")
         scene_times = [i * duration / num_scenes for i in range(num_scenes + 1)]
     
-    # Extract 3 screenshots per scene
-    all_screenshots = []
-    for i in range(len(scene_times) - 1):
-        scene_start = scene_times[i]
-        scene_end = scene_times[i + 1]
-        scene_num = i + 1
+    return scene_times
+
+def iter_scenes(video_path, output_dir, scene_threshold=0.06, max_scenes=10, min_scenes=2, progress_callback=None, source=None,
+                detector=DEFAULT_SCENE_DETECTOR, video_index=None):
+    """
+    Detect scenes and yield each one as soon as its screenshots are written
+    
+    Screenshots are extracted in batches that start with a single scene and
+    double in size, so the first scene is available almost immediately while
+    the number of ffmpeg sessions stays small.
+    
+    Args:
+        video_path: Path to input video file
+        output_dir: Directory to save scene thumbnails
+        scene_threshold: Sensitivity for scene detection (0.1-1.0)
+        max_scenes: Maximum number of scenes to extract
+        min_scenes: Minimum number of scenes when cuts are detected
+        progress_callback: Optional callable(fraction, probe) for detection progress
+        source: Optional readable stream of the video's bytes; screenshots are
+            taken from video_path, which must be complete once the stream ends
+        detector: Scoring backend, one of SCENE_DETECTORS
+        video_index: Optional VideoIndex of this video's stored scores and frames
+        
+    Yields:
+        Scene dicts with scene_num, start, end, total_scenes and screenshots (in position order)
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    
+    scene_times = detect_scene_boundaries(video_path, scene_threshold, max_scenes, min_scenes, progress_callback, source, detector, video_index)
+    scenes = [(scene_times[i], scene_times[i + 1], i + 1) for i in range(len(scene_times) - 1)]
+    
+    batch_size = 1
+    max_batch_size = max(1, SCREENSHOT_BATCH_FRAMES // len(SCREENSHOT_POSITIONS))
+    index = 0
+    while index < len(scenes):
+        batch = scenes[index:index + batch_size]
+        screenshots = extract_screenshots_batch(video_path, output_dir, batch, video_index)
+        
+        for scene_start, scene_end, scene_num in batch:
+            yield {
+                'scene_num': scene_num,
+                'start': scene_start,
+                'end': scene_end,
+                'total_scenes': len(scenes),
+                'screenshots': [shot for shot in screenshots if shot['scene_start'] == scene_start]
+            }
+        
+        index += len(batch)
+        batch_size = min(batch_size * 2, max_batch_size)
+
+def extract_scenes(video_path, output_dir, scene_threshold=0.06, max_scenes=10, min_scenes=2, progress_callback=None):
+    """
+    Extract scene changes from video using ffmpeg's per-frame scene scores
+    
+    Args:
+        video_path: Path to input video file
+        output_dir: Directory to save scene thumbnails
+        scene_threshold: Sensitivity for scene detection (0.1-1.0)
+        max_scenes: Maximum number of scenes to extract
+        min_scenes: Minimum number of scenes when cuts are detected
+        progress_callback: Optional callable(fraction, probe) for detection progress
         
-        logger.info(f"🎬 Processing scene {scene_num}: {scene_start:.1f}s - {scene_end:.1f}s")
-        screenshots = extract_scene_screenshots(video_path, output_dir, scene_start, scene_end, scene_num)
-        all_screenshots.extend(screenshots)
+    Returns:
+        List of paths to extracted scene images
+    """
+    all_screenshots = []
+    scene_count = 0
+    for scene in iter_scenes(video_path, output_dir, scene_threshold, max_scenes, min_scenes, progress_callback):
+        all_screenshots.extend(scene['screenshots'])
+        scene_count += 1
     
-    logger.info(f"📊 Final result: {len(scene_times) - 1} scenes, {len(all_screenshots)} screenshots extracted")
+    logger.info(f"📊 Final result: {scene_count} scenes, {len(all_screenshots)} screenshots extracted")
     return all_screenshots
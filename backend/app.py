@@ -1,23 +1,36 @@
 import os
-import base64
 import logging
 import time
 import random
 import json
 import threading
+import shutil
 import re
-import requests
 from datetime import datetime
 from openai import AzureOpenAI
-from flask import Flask, request, jsonify, send_file, send_from_directory
+from flask import Flask, Response, request, jsonify, send_file
+from werkzeug.utils import send_file as send_file_with_offload
 from flask_cors import CORS
-from analyzer import extract_scenes
+from analyzer import iter_scenes, write_thumbnails, available_scene_detectors, DEFAULT_SCENE_DETECTOR
+from describer import SceneDescriber, SceneBatcher
+from cache import ResultCache, hash_file
+from score_index import ScoreIndex
+from frame_index import FrameIndex, scene_signature
+from jobs import JobScheduler, QueueFullError
+from broker import create_broker
+from store import create_job_store
+from metrics import REGISTRY, timed, track_job, JOBS_FINISHED, JOB_SECONDS, JOB_RETRIES, JOBS_QUEUED, JOBS_RUNNING
+from artifacts import OutputRetention, resolve_artifact, artifact_etag, offload_headers, remove_source_files, OUTPUT_CACHE_MAX_AGE, OUTPUT_OFFLOAD, OUTPUT_KEEP_VIDEOS
+from ingest import IngestRequest, IngestError, ingest_url, start_download, url_filename, MAX_VIDEO_BYTES, OVERLAP_DOWNLOAD, DOWNLOAD_CONNECTIONS
 from dotenv import load_dotenv
 
 # Load environment variables
 load_dotenv()
 
 app = Flask(__name__)
+# Stream uploads to disk in one pass; bodies far beyond the video limit are refused before reading
+app.request_class = IngestRequest
+app.config["MAX_CONTENT_LENGTH"] = MAX_VIDEO_BYTES + 1024 * 1024 if MAX_VIDEO_BYTES else None
 
 # Configure CORS with dynamic origin checking
 def is_allowed_origin(origin):
@@ -41,8 +54,10 @@ def is_allowed_origin(origin):
 
 def handle_cors():
     """Handle CORS headers dynamically"""
-    origin = request.headers.get('Origin')
-    
+    return cors_headers_for(request.headers.get('Origin'))
+
+def cors_headers_for(origin):
+    """CORS response headers for a request from origin (none for origins off the whitelist)"""
     if is_allowed_origin(origin):
         return {
             'Access-Control-Allow-Origin': origin,
@@ -77,21 +92,48 @@ logger = logging.getLogger(__name__)
 # Base URL for the API (used for generating full URLs)
 BASE_URL = os.getenv("BASE_URL", "https://api.clip.hurated.com")
 
+# Uploaded videos, screenshots and storyboards; with a JOB_BROKER this must be storage shared with the workers
+OUTPUT_DIR = os.getenv("OUTPUT_DIR", "output")
+
+# /stream: seconds between checks for changes made by other workers, and between keepalive comments
+STREAM_POLL_INTERVAL = float(os.getenv("STREAM_POLL_INTERVAL", 1.0))
+STREAM_KEEPALIVE = float(os.getenv("STREAM_KEEPALIVE", 15.0))
+
 # Initialize Azure OpenAI client
 client = AzureOpenAI(
     azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
     api_key=os.getenv("AZURE_OPENAI_KEY"),
-    api_version=os.getenv("AZURE_OPENAI_API_VERSION")
+    api_version=os.getenv("AZURE_OPENAI_API_VERSION"),
+    max_retries=0  # Retries and backoff are handled by the describer
 )
 
-# In-memory storage for request status (in production, use Redis or database)
-request_status = {}
-request_logs = {}
+# Shared description engine: bounded concurrency and one rate budget for all jobs
+describer = SceneDescriber(client, os.getenv("AZURE_OPENAI_DEPLOYMENT_NAME"))
+
+# Finished analyses keyed on video content hash and analysis parameters
+result_cache = ResultCache()
+
+# Per-video frame scores and extracted frames, so re-analysis with new parameters skips decoding
+score_index = ScoreIndex()
+
+# Perceptual hashes of described scenes, shared across jobs to skip near-duplicate LLM calls
+frame_index = FrameIndex()
+
+# Job status, capped logs and results (SQLite by default, shared across workers)
+job_store = create_job_store()
 
-def generate_unique_folder():
+def job_active(request_id):
+    """Whether a request's job is still queued or running, so its folder must stay"""
+    status_info = job_store.get(request_id)
+    return status_info is not None and status_info["status"] in ("queued", "processing")
+
+# Age limit and disk quota for request folders under OUTPUT_DIR, swept in the background
+output_retention = OutputRetention(OUTPUT_DIR, job_active)
+output_retention.start()
+
+def generate_unique_folder(client_ip):
     """Generate unique folder name based on timestamp, IP, and random value"""
     timestamp = int(time.time())
-    client_ip = request.environ.get('HTTP_X_FORWARDED_FOR', request.environ.get('REMOTE_ADDR', 'unknown'))
     # Clean IP for folder name (replace dots/colons with underscores)
     clean_ip = client_ip.replace('.', '_').replace(':', '_')
     random_val = random.randint(1000, 9999)
@@ -100,15 +142,12 @@ def generate_unique_folder():
 
 def log_status(request_id, message, level="INFO"):
     """Log message and store for status endpoint"""
-    if request_id not in request_logs:
-        request_logs[request_id] = []
-    
     log_entry = {
         "timestamp": datetime.now().isoformat(),
         "level": level,
         "message": message
     }
-    request_logs[request_id].append(log_entry)
+    job_store.append_log(request_id, log_entry)
     
     # Also log to console
     if level == "INFO":
@@ -116,171 +155,480 @@ def log_status(request_id, message, level="INFO"):
     elif level == "ERROR":
         logger.error(f"[{request_id}] {message}")
 
-def process_video_async(request_id, video_path, scene_dir, scene_threshold, max_scenes, response_format, video_filename, video_size):
-    """Process video asynchronously"""
+def output_url(path):
+    """Public URL of a file under OUTPUT_DIR"""
+    return f"{BASE_URL}/output/{os.path.relpath(path, OUTPUT_DIR)}"
+
+def render_markdown(scene_list, scene_descriptions):
+    """Render the storyboard markdown for described scenes"""
+    markdown = "# Storyboard\n\n"
+    for scene, desc in zip(scene_list, scene_descriptions):
+        scene_num = scene['scene_num']
+        scene_start = scene['start']
+        scene_end = scene['end']
+        
+        markdown += f"## Scene {scene_num} ({scene_start:.1f}s - {scene_end:.1f}s)\n"
+        
+        for screenshot_info in scene['screenshots']:
+            img_url = output_url(screenshot_info['path'])
+            position = screenshot_info['position']
+            timestamp = screenshot_info['timestamp']
+            markdown += f"![Scene {scene_num} - {position} @ {timestamp:.1f}s]({img_url})\n"
+        
+        markdown += f"- **Timeframe**: {scene_start:.1f}s - {scene_end:.1f}s ({scene_end - scene_start:.1f}s duration)\n"
+        markdown += f"- **Description**: {desc}\n\n"
+    return markdown
+
+def scene_payload(scene, description):
+    """JSON form of one described scene, as used in results and stream events"""
+    scene_start = scene['start']
+    scene_end = scene['end']
+    
+    return {
+        "scene_number": scene['scene_num'],
+        "timeframe": {
+            "start": round(scene_start, 1),
+            "end": round(scene_end, 1),
+            "duration": round(scene_end - scene_start, 1)
+        },
+        "screenshots": [
+            {
+                "position": shot['position'],
+                "timestamp": round(shot['timestamp'], 1),
+                "url": output_url(shot['path']),
+                "thumbnails": [
+                    {"width": width, "url": output_url(path)}
+                    for width, path in sorted(shot.get('thumbnails', {}).items())
+                ]
+            }
+            for shot in scene['screenshots']
+        ],
+        "description": description
+    }
+
+def fetch_video_url(request_id, video_url, request_dir):
+    """
+    Fetch a job's video_url into its request directory
+
+    With OVERLAP_DOWNLOAD the transfer continues in the background and the
+    returned download lets analysis read the video as it arrives; otherwise
+    the video is fully downloaded first.
+
+    Returns:
+        (ingested, video_filename, download): ingested has path, size and sha256
+        (None until a background download finishes); download is None when
+        the video is already complete
+
+    Raises:
+        IngestError or any download error, after cancelling a started download
+    """
+    reported = {"percent": -1}
+    
+    def on_download_progress(received, total):
+        percent = int(received * 100 / total)
+        if percent > reported["percent"]:
+            reported["percent"] = percent
+            job_store.update(request_id, download={"received_bytes": received, "total_bytes": total, "progress": percent})
+            if received == total:
+                log_status(request_id, f"✅ Video downloaded ({total / (1024*1024):.2f} MB)")
+    
+    download = None
+    try:
+        log_status(request_id, f"📥 Downloading video from URL: {video_url}")
+        if OVERLAP_DOWNLOAD:
+            download = start_download(video_url, request_dir, progress_callback=on_download_progress)
+        if download is not None:
+            # Analysis is queued right away and reads the video while it arrives
+            video_filename = download.filename
+            download.sniff()
+            ingested = {"path": download.path, "size": download.size, "sha256": None}
+            log_status(request_id, f"⚡ Downloading {video_filename} over {DOWNLOAD_CONNECTIONS} connections")
+        else:
+            ingested = ingest_url(video_url, request_dir)
+            video_filename = ingested["filename"]
+            log_status(request_id, f"✅ Video downloaded: {video_filename} ({ingested['size'] / (1024*1024):.2f} MB)")
+    except Exception:
+        if download is not None:
+            download.cancel()
+        raise
+    return ingested, video_filename, download
+
+@timed("render")
+def build_result(request_id, scene_list, scene_descriptions, scene_dir, response_format, video_filename, video_size):
+    """Save storyboard.md for a request and build its result payload"""
+    request_dir = os.path.dirname(scene_dir)
+    md_path = os.path.join(request_dir, "storyboard.md")
+    with open(md_path, "w") as f:
+        f.write(render_markdown(scene_list, scene_descriptions))
+    
+    if response_format != 'json':
+        return {"markdown_path": md_path}
+    
+    json_scenes = [scene_payload(scene, description) for scene, description in zip(scene_list, scene_descriptions)]
+    
+    return {
+        "status": "success",
+        "request_id": request_id,
+        "video_info": {
+            "filename": video_filename,
+            "size_mb": round(video_size / (1024*1024), 2)
+        },
+        "scenes": json_scenes,
+        "markdown_url": f"{BASE_URL}/output/{request_id}/storyboard.md",
+        "total_scenes": len(scene_list)
+    }
+
+def process_video_async(request_id, video_path, scene_dir, scene_threshold, max_scenes, response_format, video_filename, video_size, video_hash=None, download=None,
+                        detector=DEFAULT_SCENE_DETECTOR, video_url=None, final_attempt=True):
+    """
+    Process video asynchronously, collecting stage timings for /status and /metrics
+
+    Returns:
+        The job's final status
+
+    Raises:
+        The attempt's error when it failed and final_attempt is False, so the broker can retry the job
+    """
+    started = time.monotonic()
+    with track_job() as timings:
+        run_analysis(request_id, timings, video_path, scene_dir, scene_threshold, max_scenes, response_format, video_filename, video_size,
+                     video_hash, download, detector, video_url, final_attempt)
+    
+    # The job is finished for good (a retry would have raised): only its artifacts stay on disk
+    if not OUTPUT_KEEP_VIDEOS:
+        remove_source_files(os.path.dirname(scene_dir))
+    
+    status_info = job_store.get(request_id)
+    status = status_info["status"] if status_info else "unknown"
+    JOBS_FINISHED.inc(status=status)
+    JOB_SECONDS.observe(time.monotonic() - started, status=status)
+    return status
+
+def run_analysis(request_id, timings, video_path, scene_dir, scene_threshold, max_scenes, response_format, video_filename, video_size, video_hash,
+                 download, detector, video_url=None, final_attempt=True):
+    """Detect, extract and describe scenes for a job, recording the outcome in the job store"""
     try:
-        request_status[request_id] = {"status": "processing", "progress": 0}
+        job_store.update(request_id, status="processing", progress=0)
+        
+        if video_url is not None:
+            # Queued through a broker: this worker fetches the video itself
+            ingested, video_filename, download = fetch_video_url(request_id, video_url, os.path.dirname(scene_dir))
+            video_path, video_size, video_hash = ingested["path"], ingested["size"], ingested["sha256"]
+            log_status(request_id, f"📹 Video ready: {video_filename} ({video_size / (1024*1024):.2f} MB)")
+        
+        def cache_key_for(video_hash):
+            return result_cache.make_key(video_hash, scene_threshold, max_scenes, os.getenv("AZURE_OPENAI_DEPLOYMENT_NAME"), detector)
+        
+        def complete_from_cache(video_hash):
+            # Identical video + parameters analysed before: reuse the stored result
+            cached = result_cache.get(cache_key_for(video_hash), scene_dir)
+            job_store.update(request_id, cache="hit" if cached else "miss")
+            if not cached:
+                return False
+            scene_list, scene_descriptions = cached
+            # Entries stored before thumbnails existed (or with other THUMBNAIL_SIZES) get their variants now
+            thumbnails = write_thumbnails([shot['path'] for scene in scene_list for shot in scene['screenshots']])
+            for scene in scene_list:
+                for shot in scene['screenshots']:
+                    shot['thumbnails'] = thumbnails.get(shot['path'], {})
+            log_status(request_id, f"♻️ Cache hit: reusing {len(scene_list)} analysed scenes")
+            result = build_result(request_id, scene_list, scene_descriptions, scene_dir, response_format, video_filename, video_size)
+            job_store.update(request_id, status="completed", progress=100, result=result, timings=timings.snapshot())
+            log_status(request_id, "✅ Analysis complete!")
+            return True
+        
+        # A video_url still downloading is either decoded as it arrives or, when its
+        # container can't be read front to back, awaited before detection starts
+        source = None
+        if download is not None:
+            if download.streamable:
+                source = download.reader()
+                log_status(request_id, "⚡ Detecting scenes while the video downloads")
+            else:
+                log_status(request_id, f"⏳ Waiting for download to finish ({download.container} index is at the end of the file)")
+                video_hash = download.wait()["sha256"]
+        elif video_hash is None:
+            with timed("hash"):
+                video_hash = hash_file(video_path)
+        
+        if video_hash is not None and complete_from_cache(video_hash):
+            return
+        
         log_status(request_id, "🎬 Starting scene extraction...")
         
-        # Extract scenes
-        scenes = extract_scenes(video_path, scene_dir, scene_threshold, max_scenes)
-        request_status[request_id]["progress"] = 30
-        log_status(request_id, f"✅ Scene extraction complete: {len(scenes)} scenes detected")
-
-        # Generate storyboard with AI descriptions
-        log_status(request_id, "🤖 Starting AI description generation...")
-        markdown = "# Storyboard\n\n"
-        scene_descriptions = []
+        def on_detection_progress(fraction, probe):
+            # Scene detection covers 0-25%; frame extraction finishes at 30%
+            fields = {"progress": int(fraction * 25)}
+            if not probe_reported:
+                probe_reported.append(True)
+                fields["video"] = {
+                    "duration": round(probe['duration'], 2),
+                    "codec": probe['codec'],
+                    "width": probe['width'],
+                    "height": probe['height'],
+                    "fps": probe['fps']
+                }
+            job_store.update(request_id, **fields)
+        
+        probe_reported = []
+        completed = []
+        reused = []
+        progress_lock = threading.Lock()
+        callbacks_done = threading.Semaphore(0)
         
-        # Group screenshots by scene
-        scenes_dict = {}
-        for screenshot_info in scenes:
-            basename = os.path.basename(screenshot_info['path'])
-            if 'scene_' in basename:
-                scene_num = int(basename.split('_')[1])
-                if scene_num not in scenes_dict:
-                    scenes_dict[scene_num] = []
-                scenes_dict[scene_num].append(screenshot_info)
+        def on_described(scene, future):
+            # Stream readers get each scene as soon as its description is ready
+            try:
+                payload = scene_payload(scene, future.result())
+            except Exception as e:
+                payload = {**scene_payload(scene, None), "error": str(e)}
+            try:
+                job_store.append_event(request_id, "scene", payload)
+                with progress_lock:
+                    completed.append(scene)
+                    job_store.update(request_id, progress=30 + int((len(completed) / scene['total_scenes']) * 60),  # 30-90% for AI processing
+                                     timings=timings.snapshot())
+            except Exception as e:
+                # The result is still collected from the future; only the event or progress update is lost
+                log_status(request_id, f"⚠️ Scene {scene['scene_num']}: could not record progress: {str(e)}", "ERROR")
+            finally:
+                # Always release, or the wait for callbacks below never returns
+                callbacks_done.release()
         
-        request_status[request_id]["progress"] = 40
+        def on_retry(batch):
+            label = f"Scene {batch[0]['scene_num']}" if len(batch) == 1 else f"Scenes {batch[0]['scene_num']}-{batch[-1]['scene_num']}"
+            return lambda attempt, delay, error: log_status(
+                request_id, f"⏳ {label}: retry {attempt} in {delay:.1f}s after {error.__class__.__name__}")
         
-        # Process each scene
-        total_scenes = len(scenes_dict)
-        for i, scene_num in enumerate(sorted(scenes_dict.keys())):
-            progress = 40 + int((i / total_scenes) * 50)  # 40-90% for AI processing
-            request_status[request_id]["progress"] = progress
+        # Describe each scene as soon as its screenshots are extracted, so frame
+        # decoding and AI calls overlap; calls run concurrently in the shared describer pool.
+        # With DESCRIBE_BATCH_SCENES > 1 consecutive scenes share one request
+        scene_list = []
+        futures = []
+        batcher = SceneBatcher(describer, on_retry=on_retry)
+        scenes = iter_scenes(video_path, scene_dir, scene_threshold, max_scenes, progress_callback=on_detection_progress, source=source,
+                             detector=detector, video_index=score_index.open(video_hash) if video_hash else None)
+        try:
+            for scene in scenes:
+                if video_hash is None:
+                    # Detection has consumed the whole download, so the content hash is known now
+                    video_hash = download.wait()["sha256"]
+                    if complete_from_cache(video_hash):
+                        scenes.close()
+                        return
+                if not scene_list:
+                    job_store.update(request_id, progress=30)
+                    log_status(request_id, "🤖 Starting AI description generation...")
+                if not scene['screenshots']:
+                    log_status(request_id, f"⚠️ Scene {scene['scene_num']} has no screenshots, skipping", "ERROR")
+                    continue
             
-            scene_screenshots = sorted(scenes_dict[scene_num], key=lambda x: ['beginning', 'middle', 'end'].index(x['position']))
-            log_status(request_id, f"🔍 Processing scene {scene_num} with {len(scene_screenshots)} screenshots")
+                log_status(request_id, f"🔍 Processing scene {scene['scene_num']} with {len(scene['screenshots'])} screenshots")
             
-            if scene_screenshots:
-                scene_start = scene_screenshots[0]['scene_start']
-                scene_end = scene_screenshots[0]['scene_end']
-                
-                prompt = f"Describe this video scene (timeframe {scene_start:.1f}s - {scene_end:.1f}s) based on these sequential frames. Focus on the overall action, movement, and story progression."
-                
-                try:
-                    # Encode all images to base64
-                    image_contents = []
-                    for screenshot_info in scene_screenshots:
-                        with open(screenshot_info['path'], "rb") as f:
-                            image_data = base64.b64encode(f.read()).decode('utf-8')
-                            image_contents.append({"type": "image_url", "image_url": {"url": f"data:image/png;base64,{image_data}"}})
-                    
-                    # Call Azure OpenAI with all images
-                    messages_content = [{"type": "text", "text": prompt}] + image_contents
-                    
-                    response = client.chat.completions.create(
-                        model=os.getenv("AZURE_OPENAI_DEPLOYMENT_NAME"),
-                        messages=[
-                            {"role": "system", "content": "You are a helpful assistant that describes video scenes based on multiple frames."},
-                            {"role": "user", "content": messages_content}
-                        ],
-                        max_tokens=300
-                    )
-                    desc = response.choices[0].message.content.strip()
-                    scene_descriptions.append(desc)
-                    log_status(request_id, f"📝 Scene {scene_num} description generated")
-                except Exception as e:
-                    desc = f"Error generating description: {str(e)}"
-                    scene_descriptions.append(desc)
-                    log_status(request_id, f"❌ Error describing scene {scene_num}: {str(e)}", "ERROR")
-
-                # Generate markdown for this scene
-                markdown += f"## Scene {scene_num} ({scene_start:.1f}s - {scene_end:.1f}s)\n"
-                
-                for screenshot_info in scene_screenshots:
-                    relative_path = os.path.relpath(screenshot_info['path'], "output")
-                    img_url = f"{BASE_URL}/output/{relative_path}"
-                    position = screenshot_info['position']
-                    timestamp = screenshot_info['timestamp']
-                    markdown += f"![Scene {scene_num} - {position} @ {timestamp:.1f}s]({img_url})\n"
-                
-                markdown += f"- **Timeframe**: {scene_start:.1f}s - {scene_end:.1f}s ({scene_end - scene_start:.1f}s duration)\n"
-                markdown += f"- **Description**: {desc}\n\n"
-
-        request_status[request_id]["progress"] = 90
+                # Near-duplicate of a scene already described (here or in another job): reuse its description
+                # If the reused description fails this scene gets its own request, sent directly
+                # since the batcher may have been flushed for good by then
+                future, reused_from = frame_index.describe(
+                    scene_signature(scene),
+                    lambda scene=scene: batcher.submit(scene),
+                    {"request_id": request_id, "scene_num": scene['scene_num']},
+                    fallback=lambda scene=scene: describer.submit(scene, on_retry([scene]))
+                )
+                if reused_from:
+                    reused.append(scene['scene_num'])
+                    job_store.update(request_id, reused_descriptions=len(reused))
+                    origin = "" if reused_from["request_id"] == request_id else " of an earlier video"
+                    log_status(request_id, f"♻️ Scene {scene['scene_num']} matches scene {reused_from['scene_num']}{origin}, reusing its description")
+                future.add_done_callback(lambda done, scene=scene: on_described(scene, done))
+                scene_list.append(scene)
+                futures.append(future)
+        except Exception as e:
+            batcher.abort(e)
+            raise
+        batcher.flush()
         
-        # Save markdown
-        request_dir = os.path.dirname(scene_dir)
-        md_path = os.path.join(request_dir, "storyboard.md")
-        with open(md_path, "w") as f:
-            f.write(markdown)
+        log_status(request_id, f"✅ Scene extraction complete: {len(scene_list)} scenes detected")
         
-        # Save results
-        if response_format == 'json':
-            json_scenes = []
-            for scene_num in sorted(scenes_dict.keys()):
-                scene_screenshots = sorted(scenes_dict[scene_num], key=lambda x: ['beginning', 'middle', 'end'].index(x['position']))
-                scene_start = scene_screenshots[0]['scene_start']
-                scene_end = scene_screenshots[0]['scene_end']
-                
-                json_scenes.append({
-                    "scene_number": scene_num,
-                    "timeframe": {
-                        "start": round(scene_start, 1),
-                        "end": round(scene_end, 1),
-                        "duration": round(scene_end - scene_start, 1)
-                    },
-                    "screenshots": [
-                        {
-                            "position": shot['position'],
-                            "timestamp": round(shot['timestamp'], 1),
-                            "url": f"{BASE_URL}/output/{os.path.relpath(shot['path'], 'output')}"
-                        }
-                        for shot in scene_screenshots
-                    ],
-                    "description": scene_descriptions[scene_num - 1] if scene_num <= len(scene_descriptions) else ""
-                })
-            
-            result = {
-                "status": "success",
-                "request_id": request_id,
-                "video_info": {
-                    "filename": video_filename,
-                    "size_mb": round(video_size / (1024*1024), 2)
-                },
-                "scenes": json_scenes,
-                "markdown_url": f"{BASE_URL}/output/{request_id}/storyboard.md",
-                "total_scenes": len(scenes_dict)
-            }
-        else:
-            result = {"markdown_path": md_path}
+        # Collect descriptions in scene order
+        scene_descriptions = []
+        failed = False
+        for scene, future in zip(scene_list, futures):
+            try:
+                desc = future.result()
+                log_status(request_id, f"📝 Scene {scene['scene_num']} description generated")
+            except Exception as e:
+                desc = f"Error generating description: {str(e)}"
+                failed = True
+                log_status(request_id, f"❌ Error describing scene {scene['scene_num']}: {str(e)}", "ERROR")
+            scene_descriptions.append(desc)
         
-        request_status[request_id] = {
-            "status": "completed", 
-            "progress": 100,
-            "result": result
-        }
+        # Futures resolve before their callbacks run; let every scene event and progress update land first
+        for _ in futures:
+            callbacks_done.acquire()
+
+        job_store.update(request_id, progress=90)
+        
+        # Only complete analyses are worth reusing
+        if not failed and video_hash is not None:
+            result_cache.put(cache_key_for(video_hash), scene_list, scene_descriptions)
+        
+        result = build_result(request_id, scene_list, scene_descriptions, scene_dir, response_format, video_filename, video_size)
+        job_store.update(request_id, status="completed", progress=100, result=result, timings=timings.snapshot())
         log_status(request_id, "✅ Analysis complete!")
         
     except Exception as e:
-        request_status[request_id] = {"status": "error", "error": str(e)}
+        if download is not None:
+            download.cancel()
+        if not final_attempt and not isinstance(e, IngestError):
+            # The broker queues the job again; keep it out of the error state meanwhile.
+            # A rejected video (too large, not a video) would only fail again
+            raise
+        job_store.update(request_id, status="error", error=str(e), timings=timings.snapshot())
         log_status(request_id, f"❌ Processing failed: {str(e)}", "ERROR")
 
+def run_queued_job(lease):
+    """Run one attempt of a job claimed from the broker (see worker.py)"""
+    process_video_async(lease.job_id, **lease.payload, final_attempt=lease.attempt >= broker.max_attempts)
+
+def requeue_job(request_id, attempt, error, requeued):
+    """Record a failed attempt of a broker job: back to queued for a retry, or failed for good"""
+    if not requeued:
+        job_store.update(request_id, status="error", error=f"Failed after {attempt} attempts: {error}")
+        log_status(request_id, f"❌ Giving up after {attempt} attempts: {error}", "ERROR")
+        return
+    JOB_RETRIES.inc()
+    job_store.update(request_id, status="queued", progress=0, attempt=attempt + 1)
+    # Stream readers drop the scenes of the failed attempt; the retry sends them again
+    job_store.append_event(request_id, "retry", {"attempt": attempt + 1, "error": error})
+    log_status(request_id, f"🔁 Attempt {attempt} failed ({error}), retrying")
+
+# Jobs go to a shared broker pulled by worker processes (JOB_BROKER=sqlite/redis), or by default
+# to a fixed pool of threads in this process with a bounded queue
+broker = create_broker()
+scheduler = broker or JobScheduler(process_video_async)
+JOBS_QUEUED.set_function(lambda: scheduler.stats()["queued"])
+JOBS_RUNNING.set_function(lambda: scheduler.stats()["running"])
+
+def status_payload(request_id):
+    """/status body for a job: status fields, result, queue position and recent logs; None if unknown"""
+    status_info = job_store.get(request_id, include_result=True)
+    if status_info is None:
+        return None
+    
+    logs, total_logs = job_store.get_logs(request_id, 10)
+    
+    if status_info["status"] == "queued":
+        status_info["queue_position"] = scheduler.position(request_id)
+        status_info["eta_seconds"] = scheduler.eta(request_id)
+    
+    # Add recent logs (last 10 entries)
+    status_info["logs"] = logs
+    status_info["total_logs"] = total_logs
+    return status_info
+
 @app.route("/status/<request_id>", methods=["GET"])
 def get_status(request_id):
     """Get status and logs for a processing request"""
-    if request_id not in request_status:
+    status_info = status_payload(request_id)
+    if status_info is None:
         return jsonify({"status": "error", "error": "Request ID not found"}), 404
+    return jsonify(status_info)
+
+def format_event(event, data, event_id=None):
+    """Encode one server-sent event"""
+    lines = [f"id: {event_id}"] if event_id is not None else []
+    lines += [f"event: {event}", f"data: {json.dumps(data)}"]
+    return "\n".join(lines) + "\n\n"
+
+def next_stream_events(request_id, last_event_id, sent_status):
+    """
+    One pass over a job for /stream
+
+    Args:
+        request_id: Job to report on
+        last_event_id: Id of the last stored event already sent
+        sent_status: Status dict sent in the last progress event, or None
+        
+    Returns:
+        (chunks, last_event_id, sent_status, finished): encoded events for stored
+        events after last_event_id, a progress event if the status changed and a
+        final complete or error event once the job has finished
+    """
+    chunks = []
+    status_info = job_store.get(request_id)
+    if status_info is None:
+        return [format_event("error", {"status": "error", "error": "Request ID not found"})], last_event_id, sent_status, True
     
-    status_info = request_status[request_id].copy()
-    logs = request_logs.get(request_id, [])
+    for event in job_store.get_events(request_id, last_event_id):
+        last_event_id = event["id"]
+        chunks.append(format_event(event["event"], event["data"], event["id"]))
     
-    # Add recent logs (last 10 entries)
-    status_info["logs"] = logs[-10:]
-    status_info["total_logs"] = len(logs)
+    if status_info["status"] == "queued":
+        status_info["queue_position"] = scheduler.position(request_id)
+    if status_info != sent_status:
+        sent_status = status_info
+        chunks.append(format_event("progress", status_info))
     
-    return jsonify(status_info)
+    if status_info["status"] == "completed":
+        result = job_store.get(request_id, include_result=True).get("result", {})
+        if "markdown_path" in result:
+            result = {"status": "success", "request_id": request_id, "markdown_url": f"{BASE_URL}/output/{request_id}/storyboard.md"}
+        chunks.append(format_event("complete", result))
+        return chunks, last_event_id, sent_status, True
+    if status_info["status"] == "error":
+        chunks.append(format_event("error", {"status": "error", "error": status_info.get("error")}))
+        return chunks, last_event_id, sent_status, True
+    return chunks, last_event_id, sent_status, False
+
+def stream_events(request_id, last_event_id):
+    """
+    Yield a job's server-sent events until it finishes
+
+    Stored events after last_event_id are replayed first (so reconnecting
+    clients pick up where they left off), then a progress event is sent
+    whenever the job's status changes, and a final complete or error event
+    ends the stream.
+    """
+    with job_store.watch(request_id) as watch:
+        yield "retry: 3000\n\n"
+        sent_status = None
+        last_sent = time.time()
+        while True:
+            chunks, last_event_id, sent_status, finished = next_stream_events(request_id, last_event_id, sent_status)
+            for chunk in chunks:
+                yield chunk
+                last_sent = time.time()
+            if finished:
+                return
+            
+            if not watch.wait(STREAM_POLL_INTERVAL) and time.time() - last_sent >= STREAM_KEEPALIVE:
+                # Comment line so proxies keep an idle connection open
+                yield ": keepalive\n\n"
+                last_sent = time.time()
+
+@app.route("/stream/<request_id>", methods=["GET"])
+def stream(request_id):
+    """Stream progress, each described scene and the final result as server-sent events"""
+    if job_store.get(request_id) is None:
+        return jsonify({"status": "error", "error": "Request ID not found"}), 404
+    
+    try:
+        last_event_id = int(request.headers.get("Last-Event-ID") or request.args.get("last_event_id") or 0)
+    except ValueError:
+        last_event_id = 0
+    
+    return Response(stream_events(request_id, last_event_id), mimetype="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no"  # Let nginx pass events through as they are written
+    })
 
 @app.route("/result/<request_id>", methods=["GET"])
 def get_result(request_id):
     """Get final result for a completed request"""
-    if request_id not in request_status:
+    status_info = job_store.get(request_id, include_result=True)
+    if status_info is None:
         return jsonify({"status": "error", "error": "Request ID not found"}), 404
     
-    status_info = request_status[request_id]
-    
     if status_info["status"] != "completed":
         return jsonify({
             "status": "error", 
@@ -291,11 +639,19 @@ def get_result(request_id):
     
     # If it's a markdown result, serve the file
     if "markdown_path" in result:
-        return send_file(result["markdown_path"], as_attachment=True, download_name=f"storyboard_{request_id}.md")
+        response = send_file(result["markdown_path"], as_attachment=True, download_name=f"storyboard_{request_id}.md",
+                             etag=artifact_etag(os.stat(result["markdown_path"])))
+        response.headers["Cache-Control"] = "no-cache"
+        return response
     else:
         # JSON result
         return jsonify(result)
 
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    """Prometheus metrics: stage duration histograms, OpenAI calls and tokens, job counts and queue depth"""
+    return Response(REGISTRY.render(), mimetype="text/plain; version=0.0.4")
+
 @app.route("/health", methods=["GET"])
 def health():
     """Health check endpoint"""
@@ -312,115 +668,241 @@ def health():
 
 @app.route("/output/<path:filename>", methods=["GET"])
 def serve_output(filename):
-    """Serve static files from output directory"""
-    logger.info(f"Serving file: {filename}")
-    return send_from_directory("output", filename)
+    """
+    Serve screenshots, thumbnails and storyboards from the output directory
+
+    Files are immutable once published, so they carry a strong ETag and a
+    long-lived immutable Cache-Control; If-None-Match and Range requests are
+    answered with 304 and 206. With OUTPUT_OFFLOAD the body is left to the
+    front proxy (X-Accel-Redirect or X-Sendfile).
+    """
+    found = resolve_artifact(OUTPUT_DIR, filename)
+    if found is None:
+        return jsonify({"status": "error", "error": "File not found"}), 404
+    path, stat = found
+    
+    offload = offload_headers(filename, path)
+    response = send_file_with_offload(path, request.environ, etag=artifact_etag(stat), max_age=OUTPUT_CACHE_MAX_AGE,
+                                      use_x_sendfile=bool(offload), conditional=True)
+    if offload and response.status_code != 304:
+        # The front proxy sends the body, sets its length and answers Range requests itself
+        del response.headers["Content-Length"]
+        del response.headers["Content-Range"]
+        response.status_code = 200
+        if OUTPUT_OFFLOAD == "x-accel-redirect":
+            del response.headers["X-Sendfile"]
+            response.headers.update(offload)
+    response.cache_control.immutable = True
+    return response
+
+@app.errorhandler(413)
+def request_too_large(e):
+    """Uploads whose declared size is over the limit are refused before any data is read"""
+    return jsonify({"status": "error", "error": f"Video exceeds the {MAX_VIDEO_BYTES / (1024*1024):.0f} MB limit"}), 413
+
+def cleanup_request(request_id, request_dir):
+    """Forget a refused request: its job entry and anything already written for it"""
+    job_store.delete(request_id)
+    shutil.rmtree(request_dir, ignore_errors=True)
+
+def receive_video_url(request_id, video_url, request_dir):
+    """
+    Ingest a job's video_url: fetched here, or by the worker that runs the job when a broker is in use
+
+    Returns:
+        (ingested, video_filename, download) as from fetch_video_url; a video left
+        to the worker has no path yet
+    """
+    if broker is not None:
+        # The worker that picks the job up fetches the video, so the API tier never holds it
+        log_status(request_id, f"📥 Video will be downloaded by a worker: {video_url}")
+        return {"path": None, "size": 0, "sha256": None}, url_filename(video_url), None
+    return fetch_video_url(request_id, video_url, request_dir)
+
+def analysis_options(form):
+    """
+    Parse and validate the /analyze fields that configure a job
+
+    Run before anything is ingested or stored, so a bad value costs the client a 400 and nothing else.
+
+    Returns:
+        Dict with response_format, detector, scene_threshold and max_scenes
+
+    Raises:
+        ValueError: with a message for the client when a field is invalid
+    """
+    detector = form.get('detector', DEFAULT_SCENE_DETECTOR)
+    if detector not in available_scene_detectors():
+        raise ValueError(f"Unknown detector '{detector}'. Available: {', '.join(available_scene_detectors())}")
+    try:
+        scene_threshold = float(form.get('scene_threshold', 0.06))
+    except ValueError:
+        raise ValueError("scene_threshold must be a number") from None
+    if not 0 < scene_threshold <= 1:
+        raise ValueError("scene_threshold must be greater than 0 and at most 1")
+    try:
+        max_scenes = int(form.get('max_scenes', 10))
+    except ValueError:
+        raise ValueError("max_scenes must be an integer") from None
+    if max_scenes < 1:
+        raise ValueError("max_scenes must be at least 1")
+    return {
+        "response_format": form.get('format', 'markdown'),
+        "detector": detector,
+        "scene_threshold": scene_threshold,
+        "max_scenes": max_scenes
+    }
+
+def queue_analysis(request_id, scene_dir, options, video_filename, ingested, download=None, video_url=None):
+    """
+    Queue an analysis job for an ingested video (or a video_url left to a worker)
+
+    Args:
+        options: Validated /analyze options, as from analysis_options
+        ingested: Dict with the video's path, size and sha256 (either may be None)
+        
+    Returns:
+        1-based queue position of the job
+
+    Raises:
+        QueueFullError: when the queue is full; the download is cancelled and the job removed
+    """
+    response_format = options["response_format"]
+    detector = options["detector"]
+    scene_threshold = options["scene_threshold"]
+    max_scenes = options["max_scenes"]
+    video_path = ingested["path"]
+    video_size = ingested["size"]
+    
+    # Queue the job; when the queue is full, refuse now instead of overloading the box
+    try:
+        if broker is not None:
+            position = broker.submit(request_id, {
+                "video_path": video_path, "scene_dir": scene_dir, "scene_threshold": scene_threshold, "max_scenes": max_scenes,
+                "response_format": response_format, "video_filename": video_filename, "video_size": video_size,
+                "video_hash": ingested["sha256"], "detector": detector, "video_url": video_url if video_path is None else None
+            })
+        else:
+            position = scheduler.submit(
+                request_id, video_path, scene_dir, scene_threshold, max_scenes, response_format, video_filename, video_size,
+                ingested["sha256"], download, detector
+            )
+    except QueueFullError:
+        if download is not None:
+            download.cancel()
+        cleanup_request(request_id, os.path.dirname(scene_dir))
+        raise
+    
+    if video_path is not None:
+        log_status(request_id, f"📹 Video ready: {video_filename} ({video_size / (1024*1024):.2f} MB)")
+    if position > 1:
+        log_status(request_id, f"🕒 Queued at position {position}")
+    return position
+
+def busy_payload(e):
+    """503 body for a job refused because the queue is full"""
+    return {
+        "status": "error",
+        "error": "Server is busy, please retry later",
+        "queue_position": e.queue_length + 1,
+        "queue_length": e.queue_length,
+        "retry_after": round(e.retry_after)
+    }
+
+def accepted_payload(request_id, position):
+    """202 body for a job queued in async mode"""
+    return {
+        "status": "accepted",
+        "request_id": request_id,
+        "queue_position": position,
+        "message": "Video processing started. Use /status/{request_id} to check progress."
+    }
 
 @app.route("/analyze", methods=["POST"])
 def analyze():
     """Analyze video and generate storyboard"""
     # Generate unique folder for this request
-    unique_folder = generate_unique_folder()
+    unique_folder = generate_unique_folder(request.environ.get('HTTP_X_FORWARDED_FOR', request.environ.get('REMOTE_ADDR', 'unknown')))
+    request_dir = os.path.join(OUTPUT_DIR, unique_folder)
+    scene_dir = os.path.join(request_dir, "scenes")
+    
+    def reject(error, status_code=400):
+        cleanup_request(unique_folder, request_dir)
+        return jsonify({"status": "error", "error": error}), status_code
     
-    # Check if video_url is provided
-    video_url = request.form.get('video_url')
-    video_file = request.files.get('video')
+    # Uploaded videos are streamed into the request directory while the form is parsed
+    request.ingest_dir = request_dir
+    try:
+        video_url = request.form.get('video_url')
+        video_file = request.files.get('video')
+    except IngestError as e:
+        return reject(str(e), e.status_code)
     
     if not video_url and not video_file:
-        return jsonify({"status": "error", "error": "Either video file or video_url must be provided"}), 400
+        return reject("Either video file or video_url must be provided")
     
     if video_url and video_file:
-        return jsonify({"status": "error", "error": "Provide either video file or video_url, not both"}), 400
+        return reject("Provide either video file or video_url, not both")
+    
+    if len([upload for upload in request.files.getlist('video') if upload]) > 1:
+        return reject("Upload a single video file")
     
     # Get processing mode
     async_mode = request.form.get('async', 'false').lower() == 'true'
-    response_format = request.form.get('format', 'markdown')
+    try:
+        options = analysis_options(request.form)
+    except ValueError as e:
+        return reject(str(e))
+    response_format = options["response_format"]
     
     # Create unique directories for this request
-    request_dir = os.path.join("output", unique_folder)
-    scene_dir = os.path.join(request_dir, "scenes")
     os.makedirs(scene_dir, exist_ok=True)
+    job_store.create(unique_folder)
     
+    download = None
     if video_url:
-        # Download video from URL
         try:
-            log_status(unique_folder, f"📥 Downloading video from URL: {video_url}")
-            response = requests.get(video_url, stream=True, timeout=30)
-            response.raise_for_status()
-            
-            # Get filename from URL or use default
-            video_filename = video_url.split('/')[-1] or 'video.mp4'
-            if '?' in video_filename:
-                video_filename = video_filename.split('?')[0]
-            if not video_filename.endswith(('.mp4', '.mov', '.avi', '.webm')):
-                video_filename += '.mp4'
-            
-            video_path = os.path.join(request_dir, video_filename)
-            video_size = 0
-            
-            with open(video_path, 'wb') as f:
-                for chunk in response.iter_content(chunk_size=8192):
-                    if chunk:
-                        f.write(chunk)
-                        video_size += len(chunk)
-            
-            log_status(unique_folder, f"✅ Video downloaded: {video_filename} ({video_size / (1024*1024):.2f} MB)")
-            
+            ingested, video_filename, download = receive_video_url(unique_folder, video_url, request_dir)
+        except IngestError as e:
+            return reject(str(e), e.status_code)
         except Exception as e:
-            return jsonify({"status": "error", "error": f"Failed to download video: {str(e)}"}), 400
+            return reject(f"Failed to download video: {str(e)}")
     else:
-        # Handle file upload
-        if video_file.filename == "":
-            return jsonify({"status": "error", "error": "Empty filename"}), 400
-        
-        # Log video info
-        video_size = len(video_file.read())
-        video_file.seek(0)  # Reset file pointer
-        video_filename = video_file.filename
+        # Handle file upload (already on disk, hashed and sniffed)
+        video_filename = os.path.basename(video_file.filename)
+        if not video_filename:
+            # e.g. "clips/": a path without a file name to store the video under
+            return reject("Invalid filename")
         
-        # Save uploaded video in unique directory with original filename
-        video_path = os.path.join(request_dir, video_filename)
-        video_file.save(video_path)
+        try:
+            ingested = video_file.stream.finish(os.path.join(request_dir, video_filename))
+        except IngestError as e:
+            return reject(str(e), e.status_code)
     
-    # Get scene detection parameters
-    scene_threshold = float(request.form.get('scene_threshold', 0.06))
-    max_scenes = int(request.form.get('max_scenes', 10))
+    try:
+        position = queue_analysis(unique_folder, scene_dir, options, video_filename, ingested, download, video_url)
+    except QueueFullError as e:
+        response = jsonify(busy_payload(e))
+        response.headers["Retry-After"] = str(round(e.retry_after))
+        return response, 503
     
     if async_mode:
-        # Start async processing
-        request_status[unique_folder] = {"status": "queued", "progress": 0}
-        request_logs[unique_folder] = []
-        log_status(unique_folder, f"📹 Video ready: {video_filename} ({video_size / (1024*1024):.2f} MB)")
-        
-        thread = threading.Thread(
-            target=process_video_async,
-            args=(unique_folder, video_path, scene_dir, scene_threshold, max_scenes, response_format, video_filename, video_size)
-        )
-        thread.start()
-        
-        return jsonify({
-            "status": "accepted",
-            "request_id": unique_folder,
-            "message": "Video processing started. Use /status/{request_id} to check progress."
-        }), 202
+        return jsonify(accepted_payload(unique_folder, position)), 202
     else:
-        # Synchronous processing (original behavior)
-        start_time = datetime.now()
+        # Synchronous processing (original behavior): wait for the queued job to finish
         log_status(unique_folder, f"=== VIDEO ANALYSIS STARTED (ID: {unique_folder}) ===")
-        log_status(unique_folder, f"📹 Video ready: {video_filename} ({video_size / (1024*1024):.2f} MB)")
-        
-        # Process synchronously using the same function
-        process_video_async(unique_folder, video_path, scene_dir, scene_threshold, max_scenes, response_format, video_filename, video_size)
+        scheduler.wait(unique_folder)
         
         # Return result immediately
-        if unique_folder in request_status and request_status[unique_folder]["status"] == "completed":
-            result = request_status[unique_folder]["result"]
+        status_info = job_store.get(unique_folder, include_result=True) or {}
+        if status_info.get("status") == "completed":
+            result = status_info["result"]
             if response_format == 'json':
                 return jsonify(result)
             else:
                 return send_file(result["markdown_path"], as_attachment=True, download_name=f"storyboard_{unique_folder}.md")
         else:
-            error = request_status.get(unique_folder, {}).get("error", "Unknown error")
+            error = status_info.get("error", "Unknown error")
             return jsonify({"status": "error", "error": error}), 500
 
 if __name__ == "__main__":
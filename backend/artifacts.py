@@ -0,0 +1,192 @@
+import os
+import time
+import shutil
+import hashlib
+import threading
+import logging
+
+from werkzeug.security import safe_join
+
+from metrics import OUTPUT_BYTES, OUTPUT_EVICTIONS
+
+logger = logging.getLogger(__name__)
+
+# Browser/CDN lifetime of files under /output. Request folders are unique and their
+# files are never rewritten, so responses are marked immutable
+OUTPUT_CACHE_MAX_AGE = int(os.getenv("OUTPUT_CACHE_MAX_AGE", 365 * 24 * 3600))
+
+# Hand file bodies to the front proxy instead of streaming them from Python:
+# "x-accel-redirect" (nginx, internal location at OUTPUT_ACCEL_PREFIX), "x-sendfile" (Apache, lighttpd) or empty
+OUTPUT_OFFLOAD = os.getenv("OUTPUT_OFFLOAD", "").lower()
+OUTPUT_ACCEL_PREFIX = os.getenv("OUTPUT_ACCEL_PREFIX", "/protected-output/")
+
+# Retention of request folders: age limit and total size of OUTPUT_DIR (0 disables either),
+# seconds between sweeps, and whether uploaded/downloaded videos outlive their job
+OUTPUT_MAX_AGE = int(os.getenv("OUTPUT_MAX_AGE", 7 * 24 * 3600))
+OUTPUT_MAX_BYTES = int(os.getenv("OUTPUT_MAX_BYTES", 20 * 1024 ** 3))
+OUTPUT_RETENTION_INTERVAL = float(os.getenv("OUTPUT_RETENTION_INTERVAL", 300))
+OUTPUT_KEEP_VIDEOS = os.getenv("OUTPUT_KEEP_VIDEOS", "false").lower() == "true"
+
+# Files of a request folder that are published under /output; anything else is the source video
+PUBLISHED_ARTIFACTS = ("scenes", "storyboard.md")
+
+# Folders written to this recently are never evicted, so uploads still arriving stay put
+RETENTION_GRACE = 600
+
+def resolve_artifact(root, filename):
+    """
+    Locate a file under the output directory
+
+    Returns:
+        (absolute path, os.stat_result), or None when the name escapes root or is not a file
+    """
+    path = safe_join(os.path.abspath(root), filename)
+    if path is None:
+        return None
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    if not os.path.isfile(path):
+        return None
+    return path, stat
+
+def artifact_etag(stat):
+    """Strong validator (unquoted) from the file's size and modification time"""
+    return hashlib.sha1(f"{stat.st_size}-{stat.st_mtime_ns}".encode()).hexdigest()[:20]
+
+def etag_matches(if_none_match, etag):
+    """Whether an If-None-Match header value covers etag (weak comparison, as RFC 9110 requires for it)"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    tags = (tag.strip() for tag in if_none_match.split(","))
+    return any(tag.removeprefix("W/").strip('"') == etag for tag in tags)
+
+def cache_control():
+    """Cache-Control value for files under /output"""
+    return f"public, max-age={OUTPUT_CACHE_MAX_AGE}, immutable"
+
+def offload_headers(filename, path):
+    """Header telling the front proxy to send the file itself, or {} when serving from Python"""
+    if OUTPUT_OFFLOAD == "x-accel-redirect":
+        return {"X-Accel-Redirect": OUTPUT_ACCEL_PREFIX.rstrip("/") + "/" + filename.lstrip("/")}
+    if OUTPUT_OFFLOAD == "x-sendfile":
+        return {"X-Sendfile": path}
+    return {}
+
+def remove_source_files(request_dir):
+    """Delete everything in a finished request's folder except its published artifacts (the source video)"""
+    try:
+        entries = list(os.scandir(request_dir))
+    except OSError:
+        return
+    for entry in entries:
+        if entry.name in PUBLISHED_ARTIFACTS:
+            continue
+        try:
+            size = entry.stat().st_size
+            if entry.is_dir(follow_symlinks=False):
+                shutil.rmtree(entry.path, ignore_errors=True)
+            else:
+                os.remove(entry.path)
+            logger.info(f"🧹 Removed source file {entry.name} ({size / (1024*1024):.1f} MB)")
+        except OSError:
+            pass
+
+def _folder_usage(path):
+    """(total bytes, newest modification time) of a folder's files"""
+    size = 0
+    newest = os.stat(path).st_mtime
+    for dirpath, _, filenames in os.walk(path):
+        for filename in filenames:
+            try:
+                stat = os.stat(os.path.join(dirpath, filename))
+            except OSError:
+                continue
+            size += stat.st_size
+            newest = max(newest, stat.st_mtime)
+    return size, newest
+
+class OutputRetention:
+    """
+    Background sweeper keeping OUTPUT_DIR within its age limit and disk quota
+
+    Request folders older than max_age are deleted, then the oldest folders
+    until the total fits in max_bytes. Folders of jobs that are still queued
+    or running (is_active(request_id) is true) and folders written to within
+    the last RETENTION_GRACE seconds are never touched. Result URLs of
+    evicted requests return 404.
+    """
+
+    def __init__(self, root, is_active, max_age=OUTPUT_MAX_AGE, max_bytes=OUTPUT_MAX_BYTES, interval=OUTPUT_RETENTION_INTERVAL):
+        self.root = root
+        self.is_active = is_active
+        self.max_age = max_age
+        self.max_bytes = max_bytes
+        self.interval = interval
+        self.stopping = threading.Event()
+        self.thread = None
+
+    def start(self):
+        """Sweep every interval seconds in a daemon thread (no-op when retention is disabled)"""
+        if self.interval <= 0 or (self.max_age <= 0 and self.max_bytes <= 0) or self.thread is not None:
+            return
+        self.thread = threading.Thread(target=self._run, name="output-retention", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stopping.set()
+
+    def _run(self):
+        while not self.stopping.wait(self.interval):
+            try:
+                self.sweep()
+            except Exception as e:
+                logger.error(f"❌ Output retention sweep failed: {e}")
+
+    def sweep(self):
+        """
+        Delete expired folders, then the oldest ones until under the quota
+
+        Returns:
+            Names of the deleted request folders
+        """
+        now = time.time()
+        folders = []
+        total = 0
+        try:
+            entries = list(os.scandir(self.root))
+        except OSError:
+            return []
+        for entry in entries:
+            if not entry.is_dir(follow_symlinks=False):
+                continue
+            try:
+                size, newest = _folder_usage(entry.path)
+            except OSError:
+                continue
+            total += size
+            folders.append((newest, size, entry.name))
+
+        folders.sort()
+        deleted = []
+        for newest, size, name in folders:
+            expired = self.max_age > 0 and now - newest > self.max_age
+            over_quota = self.max_bytes > 0 and total > self.max_bytes
+            if not (expired or over_quota):
+                continue
+            if now - newest < RETENTION_GRACE or self.is_active(name):
+                continue
+            shutil.rmtree(os.path.join(self.root, name), ignore_errors=True)
+            total -= size
+            deleted.append(name)
+            OUTPUT_EVICTIONS.inc(reason="age" if expired else "quota")
+            logger.info(f"🧹 Evicted output {name} ({size / (1024*1024):.1f} MB, {'expired' if expired else 'over quota'})")
+
+        OUTPUT_BYTES.set(total)
+        if self.max_bytes > 0 and total > self.max_bytes:
+            logger.warning(f"⚠️ Output directory holds {total / 1024 ** 3:.2f} GB, over its "
+                           f"{self.max_bytes / 1024 ** 3:.2f} GB quota, in active or recent requests")
+        return deleted
@@ -0,0 +1,429 @@
+import os
+import asyncio
+import mimetypes
+import logging
+from contextlib import asynccontextmanager
+
+import anyio
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import Response, JSONResponse, FileResponse, PlainTextResponse, StreamingResponse
+from starlette.routing import Route
+from python_multipart.multipart import MultipartParser, parse_options_header
+
+import app as pipeline
+from app import job_store, OUTPUT_DIR, STREAM_POLL_INTERVAL, STREAM_KEEPALIVE
+from artifacts import resolve_artifact, artifact_etag, etag_matches, cache_control, offload_headers
+from ingest import IngestError, IngestWriter, INGEST_CHUNK_SIZE, MAX_VIDEO_BYTES
+from jobs import QueueFullError
+from metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+# Threads for blocking work (job store reads, disk writes, URL downloads); the event loop serves every connection
+ASGI_THREAD_LIMIT = int(os.getenv("ASGI_THREAD_LIMIT", 40))
+# Largest non-file form field accepted by /analyze
+MAX_FIELD_BYTES = 64 * 1024
+
+class AsyncWatches:
+    """
+    asyncio counterpart of JobStore.watch
+
+    The job store calls notify() from whichever thread changed a job; tasks
+    waiting on that job get their event set on the event loop, so an idle
+    stream costs no thread.
+    """
+
+    def __init__(self):
+        self.events = {}
+        self.loop = None
+
+    def notify(self, request_id):
+        if self.loop is not None and request_id in self.events:
+            self.loop.call_soon_threadsafe(self._set, request_id)
+
+    def _set(self, request_id):
+        for event in self.events.get(request_id, ()):
+            event.set()
+
+    @asynccontextmanager
+    async def watch(self, request_id):
+        """Yield an asyncio.Event set whenever the job changes in this process (clear it before each read)"""
+        self.loop = asyncio.get_running_loop()
+        event = asyncio.Event()
+        self.events.setdefault(request_id, set()).add(event)
+        try:
+            yield event
+        finally:
+            watchers = self.events.get(request_id)
+            watchers.discard(event)
+            if not watchers:
+                del self.events[request_id]
+
+watches = AsyncWatches()
+job_store.add_listener(watches.notify)
+
+async def wait_for_change(event, timeout):
+    """Wait until event is set or timeout passes; returns True if it was set"""
+    try:
+        await asyncio.wait_for(event.wait(), timeout)
+        return True
+    except asyncio.TimeoutError:
+        return False
+
+class AnalyzeForm:
+    """
+    Incremental multipart/form-data parser for /analyze
+
+    Fields are kept in memory; the bytes of the 'video' part are queued and
+    written to an IngestWriter by flush(), which the caller runs on a worker
+    thread once a chunk's worth has arrived.
+    """
+
+    def __init__(self, ingest_dir, boundary=None):
+        self.ingest_dir = ingest_dir
+        self.fields = {}
+        self.video_filename = None
+        self.writer = None
+        self.pending = []
+        self.pending_bytes = 0
+        self.headers = {}
+        self.header_field = b""
+        self.header_value = b""
+        self.part_name = None
+        self.part_is_video = False
+        self.part_value = bytearray()
+        self.parser = boundary and MultipartParser(boundary, {
+            "on_part_begin": self._on_part_begin,
+            "on_header_field": lambda data, start, end: self._append_header("header_field", data[start:end]),
+            "on_header_value": lambda data, start, end: self._append_header("header_value", data[start:end]),
+            "on_header_end": self._on_header_end,
+            "on_headers_finished": self._on_headers_finished,
+            "on_part_data": self._on_part_data,
+            "on_part_end": self._on_part_end,
+        })
+
+    def _on_part_begin(self):
+        self.headers = {}
+        self.part_name = None
+        self.part_is_video = False
+        self.part_value = bytearray()
+
+    def _append_header(self, name, data):
+        setattr(self, name, getattr(self, name) + data)
+
+    def _on_header_end(self):
+        self.headers[self.header_field.lower()] = self.header_value
+        self.header_field = b""
+        self.header_value = b""
+
+    def _on_headers_finished(self):
+        _, options = parse_options_header(self.headers.get(b"content-disposition", b""))
+        self.part_name = options.get(b"name", b"").decode("latin-1")
+        if self.part_name == "video" and b"filename" in options:
+            if not options[b"filename"]:
+                # A file input left blank: no file, as Werkzeug treats it
+                self.part_name = None
+            elif self.video_filename is not None:
+                raise IngestError("Upload a single video file")
+            else:
+                self.part_is_video = True
+                self.video_filename = options[b"filename"].decode("utf-8", "replace")
+
+    def _on_part_data(self, data, start, end):
+        if self.part_is_video:
+            self.pending.append(bytes(data[start:end]))
+            self.pending_bytes += end - start
+        elif self.part_name is not None:
+            self.part_value += data[start:end]
+            if len(self.part_value) > MAX_FIELD_BYTES:
+                raise IngestError(f"Form field '{self.part_name}' is too large")
+
+    def _on_part_end(self):
+        if not self.part_is_video and self.part_name:
+            self.fields[self.part_name] = self.part_value.decode("utf-8", "replace")
+
+    def feed(self, chunk):
+        self.parser.write(chunk)
+
+    def finalize(self):
+        self.parser.finalize()
+
+    def flush(self):
+        """Write queued video bytes to disk (blocking; run on a worker thread)"""
+        if self.video_filename is not None and self.writer is None:
+            self.writer = IngestWriter(self.ingest_dir)
+        data, self.pending, self.pending_bytes = b"".join(self.pending), [], 0
+        if data:
+            self.writer.write(data)
+
+    def discard(self):
+        if self.writer is not None:
+            self.writer.discard()
+
+async def read_analyze_form(request, ingest_dir):
+    """
+    Read an /analyze body without blocking the event loop
+
+    Returns:
+        AnalyzeForm with the form fields and, for uploads, the video's IngestWriter
+
+    Raises:
+        IngestError: for oversized, empty or unrecognised videos
+    """
+    content_type, options = parse_options_header(request.headers.get("content-type", ""))
+    if content_type != b"multipart/form-data" or not options.get(b"boundary"):
+        # No file parts (e.g. urlencoded video_url requests): Starlette's parser is fine
+        form = AnalyzeForm(ingest_dir)
+        form.fields = dict(await request.form())
+        return form
+
+    form = AnalyzeForm(ingest_dir, options[b"boundary"])
+    try:
+        async for chunk in request.stream():
+            form.feed(chunk)
+            if form.pending_bytes >= INGEST_CHUNK_SIZE:
+                await run_in_threadpool(form.flush)
+        form.finalize()
+        await run_in_threadpool(form.flush)
+    except BaseException:
+        await run_in_threadpool(form.discard)
+        raise
+    return form
+
+def error_response(error, status_code, headers=None):
+    return JSONResponse({"status": "error", "error": error}, status_code=status_code, headers=headers)
+
+def client_ip(request):
+    return request.headers.get("x-forwarded-for") or (request.client.host if request.client else "unknown")
+
+async def analyze(request):
+    """Analyze video and generate storyboard; uploads stream in and sync requests wait without holding a thread"""
+    declared = request.headers.get("content-length", "")
+    if MAX_VIDEO_BYTES and declared.isdigit() and int(declared) > MAX_VIDEO_BYTES + 1024 * 1024:
+        return error_response(f"Video exceeds the {MAX_VIDEO_BYTES / (1024*1024):.0f} MB limit", 413)
+
+    unique_folder = pipeline.generate_unique_folder(client_ip(request))
+    request_dir = os.path.join(OUTPUT_DIR, unique_folder)
+    scene_dir = os.path.join(request_dir, "scenes")
+
+    async def reject(error, status_code=400):
+        await run_in_threadpool(pipeline.cleanup_request, unique_folder, request_dir)
+        return error_response(error, status_code)
+
+    try:
+        form = await read_analyze_form(request, request_dir)
+    except IngestError as e:
+        return await reject(str(e), e.status_code)
+
+    video_url = form.fields.get('video_url')
+    if not video_url and form.video_filename is None:
+        return await reject("Either video file or video_url must be provided")
+    if video_url and form.video_filename is not None:
+        return await reject("Provide either video file or video_url, not both")
+
+    async_mode = form.fields.get('async', 'false').lower() == 'true'
+    try:
+        options = pipeline.analysis_options(form.fields)
+    except ValueError as e:
+        return await reject(str(e))
+    response_format = options["response_format"]
+
+    await run_in_threadpool(os.makedirs, scene_dir, exist_ok=True)
+    await run_in_threadpool(job_store.create, unique_folder)
+
+    download = None
+    if video_url:
+        try:
+            ingested, video_filename, download = await run_in_threadpool(pipeline.receive_video_url, unique_folder, video_url, request_dir)
+        except IngestError as e:
+            return await reject(str(e), e.status_code)
+        except Exception as e:
+            return await reject(f"Failed to download video: {str(e)}")
+    else:
+        video_filename = os.path.basename(form.video_filename)
+        if not video_filename:
+            return await reject("Invalid filename")
+        try:
+            ingested = await run_in_threadpool(form.writer.finish, os.path.join(request_dir, video_filename))
+        except IngestError as e:
+            return await reject(str(e), e.status_code)
+
+    try:
+        position = await run_in_threadpool(pipeline.queue_analysis, unique_folder, scene_dir, options, video_filename, ingested,
+                                           download, video_url)
+    except QueueFullError as e:
+        return JSONResponse(pipeline.busy_payload(e), status_code=503, headers={"Retry-After": str(round(e.retry_after))})
+
+    if async_mode:
+        return JSONResponse(pipeline.accepted_payload(unique_folder, position), status_code=202)
+
+    # Synchronous mode: await the job's completion through store notifications rather than a blocked thread
+    await run_in_threadpool(pipeline.log_status, unique_folder, f"=== VIDEO ANALYSIS STARTED (ID: {unique_folder}) ===")
+    status_info = await wait_for_job(unique_folder)
+    if status_info.get("status") == "completed":
+        result = status_info["result"]
+        if response_format == 'json':
+            return JSONResponse(result)
+        return FileResponse(result["markdown_path"], filename=f"storyboard_{unique_folder}.md")
+    return error_response(status_info.get("error", "Unknown error"), 500)
+
+async def wait_for_job(request_id):
+    """Status (with result) of a job once it has completed or failed"""
+    async with watches.watch(request_id) as changed:
+        while True:
+            changed.clear()
+            status_info = await run_in_threadpool(job_store.get, request_id, True) or {}
+            if status_info.get("status") in ("completed", "error", None):
+                return status_info
+            # Changes made by other processes (broker workers) are picked up by the timeout
+            await wait_for_change(changed, STREAM_POLL_INTERVAL)
+
+async def get_status(request):
+    """Get status and logs for a processing request"""
+    status_info = await run_in_threadpool(pipeline.status_payload, request.path_params["request_id"])
+    if status_info is None:
+        return error_response("Request ID not found", 404)
+    return JSONResponse(status_info)
+
+async def stream_events(request_id, last_event_id):
+    """Async form of app.stream_events: one worker-thread pass per change, none while idle"""
+    async with watches.watch(request_id) as changed:
+        yield "retry: 3000\n\n"
+        sent_status = None
+        loop = asyncio.get_running_loop()
+        last_sent = loop.time()
+        while True:
+            changed.clear()
+            chunks, last_event_id, sent_status, finished = await run_in_threadpool(
+                pipeline.next_stream_events, request_id, last_event_id, sent_status)
+            for chunk in chunks:
+                yield chunk
+                last_sent = loop.time()
+            if finished:
+                return
+
+            if not await wait_for_change(changed, STREAM_POLL_INTERVAL) and loop.time() - last_sent >= STREAM_KEEPALIVE:
+                # Comment line so proxies keep an idle connection open
+                yield ": keepalive\n\n"
+                last_sent = loop.time()
+
+async def stream(request):
+    """Stream progress, each described scene and the final result as server-sent events"""
+    request_id = request.path_params["request_id"]
+    if await run_in_threadpool(job_store.get, request_id) is None:
+        return error_response("Request ID not found", 404)
+
+    try:
+        last_event_id = int(request.headers.get("last-event-id") or request.query_params.get("last_event_id") or 0)
+    except ValueError:
+        last_event_id = 0
+
+    return StreamingResponse(stream_events(request_id, last_event_id), media_type="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no"  # Let nginx pass events through as they are written
+    })
+
+async def get_result(request):
+    """Get final result for a completed request"""
+    request_id = request.path_params["request_id"]
+    status_info = await run_in_threadpool(job_store.get, request_id, True)
+    if status_info is None:
+        return error_response("Request ID not found", 404)
+    if status_info["status"] != "completed":
+        return error_response(f"Request not completed. Current status: {status_info['status']}", 400)
+
+    result = status_info["result"]
+    if "markdown_path" in result:
+        stat = await run_in_threadpool(os.stat, result["markdown_path"])
+        etag = artifact_etag(stat)
+        headers = {"ETag": f'"{etag}"', "Cache-Control": "no-cache"}
+        if etag_matches(request.headers.get("if-none-match"), etag):
+            return Response(status_code=304, headers=headers)
+        return FileResponse(result["markdown_path"], filename=f"storyboard_{request_id}.md", stat_result=stat, headers=headers)
+    return JSONResponse(result)
+
+async def serve_output(request):
+    """Serve screenshots, thumbnails and storyboards with validators and immutable caching (see app.serve_output)"""
+    filename = request.path_params["filename"]
+    found = await run_in_threadpool(resolve_artifact, OUTPUT_DIR, filename)
+    if found is None:
+        return error_response("File not found", 404)
+    path, stat = found
+
+    etag = artifact_etag(stat)
+    headers = {"ETag": f'"{etag}"', "Cache-Control": cache_control()}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    offload = offload_headers(filename, path)
+    if offload:
+        # The front proxy sends the body and answers Range requests itself
+        return Response(headers={**headers, **offload}, media_type=mimetypes.guess_type(path)[0] or "application/octet-stream")
+    # FileResponse answers Range requests with 206
+    return FileResponse(path, stat_result=stat, headers=headers)
+
+async def metrics(request):
+    """Prometheus metrics: stage duration histograms, OpenAI calls and tokens, job counts and queue depth"""
+    return PlainTextResponse(await run_in_threadpool(REGISTRY.render), media_type="text/plain; version=0.0.4")
+
+async def health(request):
+    """Health check endpoint"""
+    return JSONResponse({
+        "status": "healthy",
+        "version": "1.0.0",
+        "services": {
+            "scene_detection": "operational",
+            "ai_description": "operational",
+            "storage": "operational"
+        }
+    })
+
+class CORSMiddleware:
+    """Same origin whitelist and headers as the Flask app, including the OPTIONS preflight reply"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        origin = dict(scope["headers"]).get(b"origin", b"").decode("latin-1") or None
+        headers = pipeline.cors_headers_for(origin)
+        if scope["method"] == "OPTIONS":
+            return await JSONResponse({"status": "ok"}, headers=headers)(scope, receive, send)
+
+        async def send_with_cors(message):
+            if message["type"] == "http.response.start" and headers:
+                message["headers"] = list(message.get("headers", [])) + [
+                    (name.lower().encode("latin-1"), value.encode("latin-1")) for name, value in headers.items()
+                ]
+            await send(message)
+
+        await self.app(scope, receive, send_with_cors)
+
+@asynccontextmanager
+async def lifespan(app):
+    anyio.to_thread.current_default_thread_limiter().total_tokens = ASGI_THREAD_LIMIT
+    watches.loop = asyncio.get_running_loop()
+    yield
+
+app = Starlette(
+    routes=[
+        Route("/analyze", analyze, methods=["POST"]),
+        Route("/status/{request_id}", get_status, methods=["GET"]),
+        Route("/stream/{request_id}", stream, methods=["GET"]),
+        Route("/result/{request_id}", get_result, methods=["GET"]),
+        Route("/metrics", metrics, methods=["GET"]),
+        Route("/health", health, methods=["GET"]),
+        Route("/output/{filename:path}", serve_output, methods=["GET"]),
+    ],
+    lifespan=lifespan
+)
+app.add_middleware(CORSMiddleware)
+
+if __name__ == "__main__":
+    import uvicorn
+    port = int(os.getenv("BACKEND_PORT", 13000))
+    host = os.getenv("BACKEND_HOST", "0.0.0.0")
+    uvicorn.run(app, host=host, port=port)
@@ -0,0 +1,91 @@
+import sys
+import json
+import argparse
+
+def _change(old, new):
+    if old is None or new is None:
+        return None
+    if old == 0:
+        return 0.0 if new == 0 else float("inf")
+    return (new - old) / old
+
+def compare(baseline, candidate, threshold=0.10, min_seconds=0.05):
+    """
+    Compare the summaries of two benchmark result files
+
+    A metric regresses when it gets worse by more than threshold (relative)
+    and, for timings, by more than min_seconds, which keeps sub-second
+    noise from failing a comparison. Boundary accuracy regresses on any
+    drop in F1.
+
+    Returns:
+        (rows, regressions): rows of (video, metric, old, new, change) and
+        the subset of rows that regressed
+    """
+    rows = []
+    regressions = []
+    for video, new in candidate["summary"].items():
+        old = baseline["summary"].get(video)
+        if old is None or "error" in old or "error" in new:
+            continue
+
+        metrics = [("wall_seconds", old["wall_seconds"], new["wall_seconds"], True)]
+        for stage in sorted(set(old["stages"]) | set(new["stages"])):
+            metrics.append((f"stage:{stage}", old["stages"].get(stage), new["stages"].get(stage), True))
+        metrics.append(("peak_rss_mb", old["peak_rss_mb"], new["peak_rss_mb"], False))
+        metrics.append(("openai_requests", old["openai_requests"], new["openai_requests"], False))
+        metrics.append(("f1", old["accuracy"]["f1"], new["accuracy"]["f1"], False))
+
+        for metric, old_value, new_value, is_time in metrics:
+            change = _change(old_value, new_value)
+            row = (video, metric, old_value, new_value, change)
+            rows.append(row)
+            if change is None:
+                continue
+            if metric == "f1":
+                regressed = new_value < old_value
+            else:
+                regressed = change > threshold and (not is_time or new_value - old_value > min_seconds)
+            if regressed:
+                regressions.append(row)
+    return rows, regressions
+
+def _format(value):
+    if value is None:
+        return "-"
+    return f"{value:.3f}" if isinstance(value, float) else str(value)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare two benchmark result files (baseline first)")
+    parser.add_argument("baseline")
+    parser.add_argument("candidate")
+    parser.add_argument("--threshold", type=float, default=0.10, help="relative change counted as a regression (default 0.10)")
+    parser.add_argument("--min-seconds", type=float, default=0.05, help="ignore timing changes smaller than this")
+    parser.add_argument("--json", action="store_true", help="print the comparison as JSON")
+    args = parser.parse_args(argv)
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.candidate) as f:
+        candidate = json.load(f)
+
+    rows, regressions = compare(baseline, candidate, args.threshold, args.min_seconds)
+    if args.json:
+        print(json.dumps({
+            "baseline": baseline["environment"],
+            "candidate": candidate["environment"],
+            "rows": [dict(zip(("video", "metric", "baseline", "candidate", "change"), row)) for row in rows],
+            "regressions": [dict(zip(("video", "metric", "baseline", "candidate", "change"), row)) for row in regressions]
+        }, indent=2))
+    else:
+        print(f"{'video':<24} {'metric':<24} {'baseline':>10} {'candidate':>10} {'change':>8}")
+        for row in rows:
+            video, metric, old_value, new_value, change = row
+            change_text = "-" if change is None else ("new" if change == float("inf") else f"{change:+.1%}")
+            flag = "  ⚠️" if row in regressions else ""
+            print(f"{video:<24} {metric:<24} {_format(old_value):>10} {_format(new_value):>10} {change_text:>8}{flag}")
+        print(f"\n{len(regressions)} regression(s) beyond {args.threshold:.0%}")
+    return 1 if regressions else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
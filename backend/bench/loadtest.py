@@ -0,0 +1,483 @@
+import os
+import re
+import sys
+import json
+import time
+import uuid
+import random
+import struct
+import shutil
+import logging
+import argparse
+import tempfile
+import threading
+from datetime import datetime
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import requests
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from bench.videos import SUITES, BENCH_VIDEO_DIR, ensure_suite  # noqa: E402
+from bench.mock_openai import MockOpenAI  # noqa: E402
+from bench.run import RESULTS_DIR, backend_settings, environment_info, process_rss, descendant_pids  # noqa: E402
+
+logger = logging.getLogger(__name__)
+
+_RANGE_RE = re.compile(r"bytes=(\d*)-(\d*)")
+_METRIC_RE = re.compile(r"^(clipweaver_jobs_queued|clipweaver_jobs_in_flight|clipweaver_openai_requests_in_flight) (\S+)$", re.MULTILINE)
+
+def unique_suffix(token=None):
+    """A top-level MP4 'free' box with a random (or token-derived) payload: demuxers skip it, but it changes the content hash"""
+    payload = (uuid.uuid5(uuid.NAMESPACE_URL, token) if token else uuid.uuid4()).bytes
+    return struct.pack(">I", 8 + len(payload)) + b"free" + payload
+
+class VideoServer:
+    """
+    Serves the benchmark videos over HTTP with Range support, as video_url sources
+
+    /<token>/<name>.mp4 serves the named video; unless repeat_content is set,
+    each token gets its own trailing free box, so every job is a
+    different file to the result cache while decoding the same frames.
+    """
+
+    def __init__(self, videos, repeat_content=False, host="127.0.0.1", port=0):
+        self.videos = {os.path.basename(video["path"]): video["path"] for video in videos}
+        self.repeat_content = repeat_content
+        self.server = ThreadingHTTPServer((host, port), self._handler())
+        self.server.daemon_threads = True
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, name="video-server", daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _handler(self):
+        videos = self.videos
+        repeat_content = self.repeat_content
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def _resolve(self):
+                parts = self.path.split("?")[0].strip("/").split("/")
+                path = videos.get(parts[-1]) if len(parts) == 2 else None
+                if path is None:
+                    self.send_error(404)
+                    return None, None
+                # Every request for one token (HEAD and each range) must see the same bytes
+                return path, b"" if repeat_content else unique_suffix(parts[0])
+
+            def do_HEAD(self):
+                path, suffix = self._resolve()
+                if path:
+                    self.send_response(200)
+                    self.send_header("Content-Length", str(os.path.getsize(path) + len(suffix)))
+                    self.send_header("Accept-Ranges", "bytes")
+                    self.end_headers()
+
+            def do_GET(self):
+                path, suffix = self._resolve()
+                if not path:
+                    return
+                size = os.path.getsize(path) + len(suffix)
+                start, end = 0, size - 1
+                match = _RANGE_RE.fullmatch(self.headers.get("Range", ""))
+                if match and (match.group(1) or match.group(2)):
+                    if match.group(1):
+                        start = int(match.group(1))
+                        end = min(int(match.group(2)), size - 1) if match.group(2) else size - 1
+                    else:
+                        start = max(0, size - int(match.group(2)))
+                    self.send_response(206)
+                    self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+                else:
+                    self.send_response(200)
+                self.send_header("Content-Type", "video/mp4")
+                self.send_header("Content-Length", str(end - start + 1))
+                self.send_header("Accept-Ranges", "bytes")
+                self.end_headers()
+
+                file_size = size - len(suffix)
+                try:
+                    with open(path, "rb") as f:
+                        f.seek(min(start, file_size))
+                        remaining = max(0, min(end + 1, file_size) - start)
+                        while remaining:
+                            chunk = f.read(min(remaining, 256 * 1024))
+                            if not chunk:
+                                break
+                            self.wfile.write(chunk)
+                            remaining -= len(chunk)
+                    if end >= file_size:
+                        self.wfile.write(suffix[max(0, start - file_size):end - file_size + 1])
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+
+        return Handler
+
+class UploadBody:
+    """File-like upload body: the video followed by an optional unique suffix"""
+
+    def __init__(self, path, suffix):
+        self.file = open(path, "rb")
+        self.suffix = suffix
+        self.len = os.path.getsize(path) + len(suffix)
+
+    def read(self, size=-1):
+        data = self.file.read(size)
+        if (size < 0 or not data) and self.suffix:
+            data += self.suffix
+            self.suffix = b""
+        return data
+
+    def close(self):
+        self.file.close()
+
+def percentile(values, fraction):
+    """Nearest-rank percentile, or None for no values"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, round(fraction * len(ordered) + 0.5) - 1))
+    return round(ordered[index], 3)
+
+def _distribution(values):
+    return {
+        "count": len(values),
+        "p50": percentile(values, 0.50),
+        "p95": percentile(values, 0.95),
+        "p99": percentile(values, 0.99),
+        "max": round(max(values), 3) if values else None
+    }
+
+class LoadTest:
+    """
+    Open-loop load generator for async /analyze jobs
+
+    Jobs arrive at a fixed (or Poisson) rate regardless of how fast the
+    server completes them, so queueing shows up as latency and 503s rather
+    than as a slower arrival rate. Each job is followed over /stream (or by
+    polling /status) until it completes or fails.
+    """
+
+    def __init__(self, base_url, videos, video_server, args):
+        self.base_url = base_url.rstrip("/")
+        self.videos = videos
+        self.video_server = video_server
+        self.args = args
+        self.rng = random.Random(args.seed)
+        self.lock = threading.Lock()
+        self.jobs = []
+        self.active = 0
+        self.started = None
+
+    def _record(self, job):
+        with self.lock:
+            self.jobs.append(job)
+            self.active -= 1
+
+    def _follow_stream(self, request_id, job, submitted):
+        with requests.get(f"{self.base_url}/stream/{request_id}", stream=True, timeout=(10, self.args.job_timeout)) as response:
+            response.raise_for_status()
+            event = None
+            for line in response.iter_lines(decode_unicode=True):
+                if line.startswith("event: "):
+                    event = line[7:]
+                elif line.startswith("data: "):
+                    if event == "scene" and "first_scene_seconds" not in job:
+                        job["first_scene_seconds"] = time.perf_counter() - submitted
+                    elif event == "complete":
+                        return "completed", None
+                    elif event == "error":
+                        return "error", json.loads(line[6:]).get("error")
+        return "error", "stream ended without a result"
+
+    def _follow_poll(self, request_id, job, submitted):
+        deadline = time.perf_counter() + self.args.job_timeout
+        while time.perf_counter() < deadline:
+            status = requests.get(f"{self.base_url}/status/{request_id}", timeout=10).json()
+            if status["status"] in ("completed", "error"):
+                return status["status"], status.get("error")
+            time.sleep(self.args.poll_interval)
+        return "error", "timed out"
+
+    def _run_job(self, index):
+        video = self.videos[index % len(self.videos)] if not self.args.shuffle else self.rng.choice(self.videos)
+        name = os.path.basename(video["path"])
+        with self.lock:
+            kind = "upload" if self.rng.random() < self.args.upload_ratio else "video_url"
+        job = {"index": index, "kind": kind, "video": video["spec"]["name"], "offset_seconds": round(time.perf_counter() - self.started, 3)}
+        form = {"async": "true", "format": "json", "max_scenes": str(self.args.max_scenes)}
+
+        submitted = time.perf_counter()
+        try:
+            if kind == "upload":
+                body = UploadBody(video["path"], b"" if self.args.repeat_content else unique_suffix())
+                try:
+                    response = requests.post(f"{self.base_url}/analyze", data=form, files={"video": (name, body, "video/mp4")}, timeout=120)
+                finally:
+                    body.close()
+            else:
+                video_url = f"{self.video_server.url}/{uuid.uuid4().hex}/{name}"
+                response = requests.post(f"{self.base_url}/analyze", data={**form, "video_url": video_url}, timeout=120)
+            job["submit_seconds"] = round(time.perf_counter() - submitted, 3)
+            job["http_status"] = response.status_code
+
+            if response.status_code == 503:
+                job["outcome"] = "rejected"
+                job["retry_after"] = response.json().get("retry_after")
+            elif response.status_code not in (200, 202):
+                job["outcome"] = "error"
+                job["error"] = (response.json() if response.headers.get("Content-Type", "").startswith("application/json") else {}).get(
+                    "error", f"HTTP {response.status_code}")
+            else:
+                request_id = response.json()["request_id"]
+                follow = self._follow_poll if self.args.poll else self._follow_stream
+                job["outcome"], error = follow(request_id, job, submitted)
+                job["latency_seconds"] = round(time.perf_counter() - submitted, 3)
+                if error:
+                    job["error"] = error
+        except requests.RequestException as e:
+            job["outcome"] = "error"
+            job["error"] = f"{e.__class__.__name__}: {e}"
+        if "first_scene_seconds" in job:
+            job["first_scene_seconds"] = round(job["first_scene_seconds"], 3)
+        self._record(job)
+
+    def run(self):
+        """Submit jobs for the configured duration, then wait for them to finish; returns the job records"""
+        self.started = self.started or time.perf_counter()
+        next_arrival = self.started
+        index = 0
+        threads = []
+        while next_arrival - self.started < self.args.duration:
+            time.sleep(max(0.0, next_arrival - time.perf_counter()))
+            with self.lock:
+                self.active += 1
+            thread = threading.Thread(target=self._run_job, args=(index,), name=f"load-job-{index}", daemon=True)
+            thread.start()
+            threads.append(thread)
+            index += 1
+            next_arrival += self.rng.expovariate(self.args.rate) if self.args.poisson else 1.0 / self.args.rate
+
+        deadline = time.perf_counter() + self.args.job_timeout
+        for thread in threads:
+            thread.join(max(0.0, deadline - time.perf_counter()))
+        with self.lock:
+            return sorted(self.jobs, key=lambda job: job["index"])
+
+class ResourceMonitor:
+    """
+    Timeline of client-side job counts and server load, sampled at a fixed interval
+
+    Queue depth and in-flight jobs come from the server's /metrics. Memory
+    and CPU are read from /proc for the server process and its ffmpeg
+    children when its PID is known (always, for the in-process server).
+    """
+
+    def __init__(self, base_url, load, pid=None, interval=1.0):
+        self.base_url = base_url.rstrip("/")
+        self.load = load
+        self.pid = pid
+        self.interval = interval
+        self.samples = []
+        self.stopping = threading.Event()
+        self.thread = None
+        self.ticks = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+
+    def _cpu_seconds(self):
+        total = 0
+        for pid in [self.pid] + descendant_pids(self.pid):
+            try:
+                with open(f"/proc/{pid}/stat") as f:
+                    fields = f.read().rsplit(")", 1)[1].split()
+                # utime, stime, and for the server itself cutime/cstime of children it has reaped
+                total += sum(int(value) for value in (fields[11:15] if pid == self.pid else fields[11:13]))
+            except (OSError, IndexError, ValueError):
+                pass
+        return total / self.ticks
+
+    def _sample(self, previous):
+        now = time.perf_counter()
+        with self.load.lock:
+            finished = self.load.jobs
+            sample = {
+                "t": round(now - self.load.started, 2),
+                "client_active": self.load.active,
+                "completed": sum(1 for job in finished if job.get("outcome") == "completed"),
+                "errors": sum(1 for job in finished if job.get("outcome") == "error"),
+                "rejected": sum(1 for job in finished if job.get("outcome") == "rejected")
+            }
+        try:
+            text = requests.get(f"{self.base_url}/metrics", timeout=5).text
+            values = {name: float(value) for name, value in _METRIC_RE.findall(text)}
+            sample["server_queued"] = values.get("clipweaver_jobs_queued")
+            sample["server_in_flight"] = values.get("clipweaver_jobs_in_flight")
+            sample["openai_in_flight"] = values.get("clipweaver_openai_requests_in_flight")
+        except requests.RequestException:
+            pass
+        if self.pid:
+            sample["rss_mb"] = round((process_rss(self.pid) + sum(process_rss(pid) for pid in descendant_pids(self.pid))) / 2 ** 20, 1)
+            cpu = self._cpu_seconds()
+            if previous is not None:
+                sample["cpu_percent"] = round(100 * (cpu - previous[1]) / max(now - previous[0], 1e-6), 1)
+            previous = (now, cpu)
+        self.samples.append(sample)
+        return previous
+
+    def _run(self):
+        previous = (time.perf_counter(), self._cpu_seconds()) if self.pid else None
+        while not self.stopping.wait(self.interval):
+            previous = self._sample(previous)
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, name="load-monitor", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stopping.set()
+        self.thread.join()
+        return self.samples
+
+def summarize(jobs, samples, wall):
+    """Throughput, latency percentiles, error rates and peak resource usage"""
+    completed = [job for job in jobs if job.get("outcome") == "completed"]
+    summary = {
+        "submitted": len(jobs),
+        "completed": len(completed),
+        "errors": sum(1 for job in jobs if job.get("outcome") == "error"),
+        "rejected": sum(1 for job in jobs if job.get("outcome") == "rejected"),
+        "wall_seconds": round(wall, 2),
+        "throughput_jobs_per_minute": round(60 * len(completed) / wall, 2) if wall else None,
+        "error_rate": round(sum(1 for job in jobs if job.get("outcome") == "error") / len(jobs), 4) if jobs else None,
+        "rejection_rate": round(sum(1 for job in jobs if job.get("outcome") == "rejected") / len(jobs), 4) if jobs else None,
+        "latency_seconds": _distribution([job["latency_seconds"] for job in completed]),
+        "first_scene_seconds": _distribution([job["first_scene_seconds"] for job in completed if "first_scene_seconds" in job]),
+        "submit_seconds": _distribution([job["submit_seconds"] for job in jobs if "submit_seconds" in job]),
+        "by_kind": {}
+    }
+    for kind in sorted({job["kind"] for job in jobs}):
+        kind_jobs = [job for job in jobs if job["kind"] == kind]
+        summary["by_kind"][kind] = {
+            "submitted": len(kind_jobs),
+            "completed": sum(1 for job in kind_jobs if job.get("outcome") == "completed"),
+            "latency_seconds": _distribution([job["latency_seconds"] for job in kind_jobs if job.get("outcome") == "completed"])
+        }
+    for key in ("server_queued", "server_in_flight", "rss_mb", "cpu_percent"):
+        values = [sample[key] for sample in samples if sample.get(key) is not None]
+        summary[f"peak_{key}"] = max(values) if values else None
+    return summary
+
+def start_local_server(args, work_dir):
+    """Run the Flask app in this process (threaded, like the dev server) against the mock OpenAI server"""
+    from werkzeug.serving import make_server
+
+    mock = MockOpenAI(latency=args.latency, jitter=args.jitter, rate_429=args.rate_429, retry_after=args.retry_after).start()
+    overrides = dict(item.split("=", 1) for item in args.env)
+    os.environ.update(backend_settings(mock.url, work_dir, overrides))
+    os.chdir(work_dir)
+
+    import app as app_module
+    server = make_server("127.0.0.1", 0, app_module.app, threaded=True)
+    threading.Thread(target=server.serve_forever, name="flask-server", daemon=True).start()
+    return mock, server, f"http://127.0.0.1:{server.server_port}", overrides
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Load-test async /analyze jobs (uploads and video_url) and report latency and throughput")
+    parser.add_argument("--url", help="base URL of a running server; default starts one in this process with the mock OpenAI backend")
+    parser.add_argument("--server-pid", type=int, help="PID of the --url server, to sample its memory and CPU")
+    parser.add_argument("--rate", type=float, default=0.2, help="job arrivals per second")
+    parser.add_argument("--duration", type=float, default=60, help="seconds to keep submitting jobs")
+    parser.add_argument("--poisson", action="store_true", help="exponentially distributed arrivals instead of a fixed interval")
+    parser.add_argument("--upload-ratio", type=float, default=0.5, help="fraction of jobs sent as uploads; the rest use video_url")
+    parser.add_argument("--suite", choices=sorted(SUITES), default="quick", help="benchmark videos to submit")
+    parser.add_argument("--videos-dir", default=BENCH_VIDEO_DIR)
+    parser.add_argument("--shuffle", action="store_true", help="pick videos at random instead of round-robin")
+    parser.add_argument("--repeat-content", action="store_true", help="send byte-identical videos, so repeats can hit the result cache")
+    parser.add_argument("--max-scenes", type=int, default=10)
+    parser.add_argument("--poll", action="store_true", help="poll /status instead of following /stream")
+    parser.add_argument("--poll-interval", type=float, default=1.0)
+    parser.add_argument("--job-timeout", type=float, default=900, help="seconds to wait for each job (and for the drain at the end)")
+    parser.add_argument("--sample-interval", type=float, default=1.0, help="seconds between resource samples")
+    parser.add_argument("--latency", type=float, default=1.0, help="mock OpenAI mean seconds per completion (local server)")
+    parser.add_argument("--jitter", type=float, default=0.25, help="mock OpenAI latency jitter (local server)")
+    parser.add_argument("--rate-429", type=float, default=0.0, help="fraction of mock OpenAI requests answered with 429 (local server)")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="Retry-After seconds on mock 429s (local server)")
+    parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE",
+                        help="setting for the local server, e.g. --env JOB_WORKERS=4 (repeatable)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="results JSON path (default: bench/results/loadtest-<timestamp>.json)")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(levelname)s - %(message)s')
+    logger.setLevel(logging.INFO)
+    output = os.path.abspath(args.output or os.path.join(RESULTS_DIR, f"loadtest-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json"))
+
+    videos = ensure_suite(args.suite, args.videos_dir)
+    video_server = VideoServer(videos, args.repeat_content).start()
+    work_dir = None
+    mock = server = None
+    overrides = {}
+    try:
+        if args.url:
+            base_url, pid = args.url, args.server_pid
+        else:
+            work_dir = tempfile.mkdtemp(prefix="clipweaver-load-")
+            mock, server, base_url, overrides = start_local_server(args, work_dir)
+            # The app configures INFO logging on import; keep per-request lines out of the report
+            logging.getLogger().setLevel(logging.WARNING)
+            logging.getLogger("werkzeug").setLevel(logging.WARNING)
+            pid = os.getpid()
+
+        logger.info(f"🚦 {args.rate} jobs/s for {args.duration:.0f}s against {base_url}")
+        load = LoadTest(base_url, videos, video_server, args)
+        load.started = time.perf_counter()
+        monitor = ResourceMonitor(base_url, load, pid, args.sample_interval)
+        monitor.start()
+        jobs = load.run()
+        samples = monitor.stop()
+        wall = time.perf_counter() - load.started
+    finally:
+        video_server.stop()
+        if server is not None:
+            server.shutdown()
+        if mock is not None:
+            mock.stop()
+        if work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    summary = summarize(jobs, samples, wall)
+    results = {
+        "environment": environment_info(),
+        "config": {key: value for key, value in vars(args).items() if key not in ("output", "env")} | {"env": overrides},
+        "summary": summary,
+        "jobs": jobs,
+        "timeline": samples
+    }
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+
+    latency = summary["latency_seconds"]
+    logger.info(f"📊 {summary['completed']}/{summary['submitted']} completed, {summary['errors']} errors, {summary['rejected']} rejected; "
+                f"{summary['throughput_jobs_per_minute']} jobs/min; latency p50 {latency['p50']}s p95 {latency['p95']}s p99 {latency['p99']}s")
+    logger.info(f"📄 Results written to {output}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,187 @@
+import os
+import re
+import json
+import time
+import random
+import threading
+import logging
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+logger = logging.getLogger(__name__)
+
+# Defaults for the mock's behaviour; all can be overridden per server
+MOCK_OPENAI_LATENCY = float(os.getenv("MOCK_OPENAI_LATENCY", 1.0))
+MOCK_OPENAI_JITTER = float(os.getenv("MOCK_OPENAI_JITTER", 0.25))
+MOCK_OPENAI_RATE_429 = float(os.getenv("MOCK_OPENAI_RATE_429", 0.0))
+MOCK_OPENAI_RETRY_AFTER = float(os.getenv("MOCK_OPENAI_RETRY_AFTER", 1.0))
+
+# Rough prompt token cost of one image, to make usage numbers plausible
+IMAGE_TOKENS = {"low": 85, "high": 765, "auto": 765}
+
+_SCENE_LABEL_RE = re.compile(r"^Scene (\d+) \(timeframe")
+
+class MockOpenAI:
+    """
+    Local stand-in for the Azure OpenAI chat completions endpoint
+
+    Answers POST .../chat/completions after a latency drawn from
+    latency ± jitter (deterministic for a seed), rejects a
+    fraction of requests with 429 and a Retry-After header, and answers
+    batched multi-scene prompts with the JSON the describer asks for.
+    GET /stats returns request counters.
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, latency=MOCK_OPENAI_LATENCY, jitter=MOCK_OPENAI_JITTER,
+                 rate_429=MOCK_OPENAI_RATE_429, retry_after=MOCK_OPENAI_RETRY_AFTER, seed=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_429 = rate_429
+        self.retry_after = retry_after
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.counters = {"requests": 0, "completed": 0, "throttled": 0, "in_flight": 0, "max_in_flight": 0,
+                         "prompt_tokens": 0, "completion_tokens": 0, "images": 0}
+        self.server = ThreadingHTTPServer((host, port), self._handler())
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        """Serve in a background thread; returns self"""
+        self.thread = threading.Thread(target=self.server.serve_forever, name="mock-openai", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def stats(self):
+        with self.lock:
+            return dict(self.counters)
+
+    def reset_stats(self):
+        with self.lock:
+            for key in self.counters:
+                self.counters[key] = 0
+
+    def _draw(self):
+        """(throttle?, delay) for the next request"""
+        with self.lock:
+            throttle = self.rng.random() < self.rate_429
+            delay = max(0.0, self.latency + self.rng.uniform(-self.jitter, self.jitter))
+            return throttle, delay
+
+    def complete(self, body):
+        """Build the chat completion response for a request body"""
+        content = body["messages"][-1]["content"]
+        texts = [part["text"] for part in content if part.get("type") == "text"] if isinstance(content, list) else [content]
+        images = [part for part in content if part.get("type") == "image_url"] if isinstance(content, list) else []
+
+        scene_nums = [int(match.group(1)) for text in texts[1:] if (match := _SCENE_LABEL_RE.match(text))]
+        if scene_nums:
+            answer = json.dumps({"scenes": [
+                {"scene": num, "description": f"Mock description of scene {num}: shapes and colours move across the frame."}
+                for num in scene_nums
+            ]})
+        else:
+            answer = f"Mock description based on {len(images)} frames: shapes and colours move across the frame."
+
+        detail = images[0]["image_url"].get("detail", "auto") if images else "auto"
+        prompt_tokens = sum(len(text) for text in texts) // 4 + len(images) * IMAGE_TOKENS.get(detail, 765)
+        completion_tokens = len(answer) // 4
+        with self.lock:
+            self.counters["prompt_tokens"] += prompt_tokens
+            self.counters["completion_tokens"] += completion_tokens
+            self.counters["images"] += len(images)
+
+        return {
+            "id": f"chatcmpl-mock-{time.time_ns()}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "mock"),
+            "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": answer}}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                      "total_tokens": prompt_tokens + completion_tokens}
+        }
+
+    def _handler(self):
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def _send_json(self, status, payload, headers=None):
+                data = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                if self.path.rstrip("/") == "/stats":
+                    self._send_json(200, mock.stats())
+                else:
+                    self._send_json(404, {"error": {"message": "Not found"}})
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                if not self.path.split("?")[0].endswith("/chat/completions"):
+                    self._send_json(404, {"error": {"message": "Not found"}})
+                    return
+
+                with mock.lock:
+                    mock.counters["requests"] += 1
+                throttle, delay = mock._draw()
+                if throttle:
+                    with mock.lock:
+                        mock.counters["throttled"] += 1
+                    self._send_json(429, {"error": {"code": "429", "message": "Rate limit is exceeded (mock)"}}, {
+                        "Retry-After": str(max(1, round(mock.retry_after))),
+                        "retry-after-ms": str(int(mock.retry_after * 1000))
+                    })
+                    return
+
+                with mock.lock:
+                    mock.counters["in_flight"] += 1
+                    mock.counters["max_in_flight"] = max(mock.counters["max_in_flight"], mock.counters["in_flight"])
+                try:
+                    time.sleep(delay)
+                    response = mock.complete(body)
+                finally:
+                    with mock.lock:
+                        mock.counters["in_flight"] -= 1
+                        mock.counters["completed"] += 1
+                self._send_json(200, response)
+
+        return Handler
+
+if __name__ == "__main__":
+    import argparse
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Serve a mock Azure OpenAI chat completions endpoint")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=MOCK_OPENAI_LATENCY, help="mean seconds per completion")
+    parser.add_argument("--jitter", type=float, default=MOCK_OPENAI_JITTER, help="latency varies uniformly by ± this many seconds")
+    parser.add_argument("--rate-429", type=float, default=MOCK_OPENAI_RATE_429, help="fraction of requests rejected with 429")
+    parser.add_argument("--retry-after", type=float, default=MOCK_OPENAI_RETRY_AFTER, help="Retry-After seconds sent with 429s")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    mock = MockOpenAI(args.host, args.port, args.latency, args.jitter, args.rate_429, args.retry_after, args.seed)
+    logger.info(f"🧪 Mock Azure OpenAI listening on {mock.url} (set AZURE_OPENAI_ENDPOINT to it)")
+    try:
+        mock.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
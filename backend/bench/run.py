@@ -0,0 +1,319 @@
+import os
+import sys
+import json
+import time
+import shutil
+import logging
+import argparse
+import platform
+import tempfile
+import threading
+import statistics
+import subprocess
+from datetime import datetime, timezone
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from bench.videos import SUITES, BENCH_VIDEO_DIR, ensure_suite  # noqa: E402
+from bench.mock_openai import MockOpenAI  # noqa: E402
+
+logger = logging.getLogger(__name__)
+
+RESULTS_DIR = os.path.join(BACKEND_DIR, "bench", "results")
+
+def process_rss(pid):
+    """Resident memory of one process in bytes (0 if unknown)"""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return 0
+
+def descendant_pids(pid):
+    """PIDs of all live descendants of a process"""
+    descendants = []
+    pending = [pid]
+    while pending:
+        parent = pending.pop()
+        try:
+            for task in os.listdir(f"/proc/{parent}/task"):
+                with open(f"/proc/{parent}/task/{task}/children") as f:
+                    children = [int(child) for child in f.read().split()]
+                descendants += children
+                pending += children
+        except OSError:
+            pass
+    return descendants
+
+class RssSampler:
+    """
+    Samples the resident memory of a process (this one by default) and all its descendants (ffmpeg)
+
+    Reads /proc, so it only reports on Linux; elsewhere the peaks stay 0.
+    """
+
+    def __init__(self, pid=None, interval=0.05):
+        self.pid = pid or os.getpid()
+        self.interval = interval
+        self.peak_total = 0
+        self.peak_process = 0
+        self.stopping = threading.Event()
+        self.thread = None
+
+    def _sample(self):
+        own = process_rss(self.pid)
+        total = own + sum(process_rss(pid) for pid in descendant_pids(self.pid))
+        self.peak_process = max(self.peak_process, own)
+        self.peak_total = max(self.peak_total, total)
+
+    def _run(self):
+        while not self.stopping.wait(self.interval):
+            self._sample()
+
+    def start(self):
+        self.peak_total = self.peak_process = 0
+        self.stopping.clear()
+        self._sample()
+        self.thread = threading.Thread(target=self._run, name="rss-sampler", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """Stop sampling; returns (peak of process + descendants, peak of the process alone) in bytes"""
+        self.stopping.set()
+        self.thread.join()
+        self._sample()
+        return self.peak_total, self.peak_process
+
+def boundary_accuracy(detected, cuts, tolerance):
+    """
+    Match detected scene boundaries to the known cuts
+
+    Each cut can be matched once, by the nearest detected boundary within
+    tolerance seconds.
+
+    Returns:
+        Dict with precision, recall, f1, matched counts and the mean absolute
+        error (seconds) of matched boundaries
+    """
+    remaining = sorted(cuts)
+    errors = []
+    for boundary in sorted(detected):
+        if not remaining:
+            break
+        nearest = min(remaining, key=lambda cut: abs(cut - boundary))
+        if abs(nearest - boundary) <= tolerance:
+            errors.append(abs(nearest - boundary))
+            remaining.remove(nearest)
+
+    matched = len(errors)
+    precision = matched / len(detected) if detected else float(not cuts)
+    recall = matched / len(cuts) if cuts else 1.0
+    return {
+        "expected_cuts": len(cuts),
+        "detected_cuts": len(detected),
+        "matched_cuts": matched,
+        "precision": round(precision, 4),
+        "recall": round(recall, 4),
+        "f1": round(2 * precision * recall / (precision + recall), 4) if precision + recall else 0.0,
+        "mean_abs_error": round(statistics.fmean(errors), 4) if errors else None
+    }
+
+def _command_output(cmd, cwd=None):
+    try:
+        return subprocess.run(cmd, capture_output=True, text=True, check=True, cwd=cwd).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def environment_info():
+    """What the numbers were measured on"""
+    ffmpeg_version = _command_output(["ffmpeg", "-version"])
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "git_commit": _command_output(["git", "rev-parse", "HEAD"], cwd=BACKEND_DIR),
+        "git_dirty": bool(_command_output(["git", "status", "--porcelain", "--untracked-files=no"], cwd=BACKEND_DIR)),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "ffmpeg": ffmpeg_version.splitlines()[0] if ffmpeg_version else None
+    }
+
+def backend_settings(mock_url, work_dir, overrides=None):
+    """Environment for running the backend in this process against the mock, with all state under work_dir"""
+    return {
+        "AZURE_OPENAI_ENDPOINT": mock_url,
+        "AZURE_OPENAI_KEY": "bench",
+        "AZURE_OPENAI_API_VERSION": "2025-01-01-preview",
+        "AZURE_OPENAI_DEPLOYMENT_NAME": "bench",
+        "JOB_STORE_PATH": os.path.join(work_dir, "data", "jobs.db"),
+        "RESULT_CACHE_DIR": os.path.join(work_dir, "cache", "results"),
+        "SCORE_INDEX_DIR": os.path.join(work_dir, "cache", "index"),
+        # Measure the pipeline, not the production request quota
+        "DESCRIBE_RATE_LIMIT_RPM": "100000",
+        **(overrides or {})
+    }
+
+def reset_state(app_module):
+    """Drop every cache so a run measures the cold path"""
+    from cache import ResultCache
+    from score_index import ScoreIndex
+    from frame_index import FrameIndex
+    for cache in (app_module.result_cache, app_module.score_index):
+        shutil.rmtree(cache.root, ignore_errors=True)
+    app_module.result_cache = ResultCache()
+    app_module.score_index = ScoreIndex()
+    app_module.frame_index = FrameIndex()
+
+def run_video(client, app_module, video, mock, sampler, args):
+    """Analyse one video synchronously through /analyze and measure it"""
+    if not args.warm:
+        reset_state(app_module)
+    mock.reset_stats()
+    form = {
+        "format": "json",
+        # One scene per shot is the most the detector could correctly find
+        "max_scenes": str(len(video["cuts"]) + 1),
+        "scene_threshold": str(args.scene_threshold)
+    }
+    if args.detector:
+        form["detector"] = args.detector
+
+    sampler.start()
+    started = time.perf_counter()
+    with open(video["path"], "rb") as f:
+        response = client.post("/analyze", data={"video": (f, os.path.basename(video["path"])), **form},
+                               content_type="multipart/form-data")
+    wall = time.perf_counter() - started
+    peak_total, peak_process = sampler.stop()
+
+    payload = response.get_json(silent=True) or {}
+    run = {
+        "video": video["spec"]["name"],
+        "resolution": f"{video['spec']['width']}x{video['spec']['height']}",
+        "duration": video["spec"]["duration"],
+        "http_status": response.status_code,
+        "wall_seconds": round(wall, 3),
+        "peak_rss_mb": round(peak_total / 2 ** 20, 1),
+        "peak_process_rss_mb": round(peak_process / 2 ** 20, 1),
+        "mock_openai": mock.stats()
+    }
+    if response.status_code != 200 or "scenes" not in payload:
+        run["error"] = payload.get("error", f"HTTP {response.status_code}")
+        return run
+
+    status = client.get(f"/status/{payload['request_id']}").get_json()
+    timings = status.get("timings", {})
+    run["stages"] = {stage: stats["seconds"] for stage, stats in timings.get("stages", {}).items()}
+    run["stage_counts"] = {stage: stats["count"] for stage, stats in timings.get("stages", {}).items()}
+    run["openai"] = timings.get("openai", {})
+    run["cache"] = status.get("cache")
+    run["scenes"] = len(payload["scenes"])
+    detected = [scene["timeframe"]["start"] for scene in payload["scenes"][1:]]
+    run["accuracy"] = boundary_accuracy(detected, video["cuts"], args.tolerance)
+    return run
+
+def summarize(runs):
+    """Per-video medians over repeats (peak memory: maximum), keyed by video name"""
+    summary = {}
+    for name in dict.fromkeys(run["video"] for run in runs):
+        video_runs = [run for run in runs if run["video"] == name and "error" not in run]
+        if not video_runs:
+            summary[name] = {"error": next(run["error"] for run in runs if run["video"] == name)}
+            continue
+        stages = sorted({stage for run in video_runs for stage in run["stages"]})
+        summary[name] = {
+            "runs": len(video_runs),
+            "wall_seconds": round(statistics.median(run["wall_seconds"] for run in video_runs), 3),
+            "stages": {stage: round(statistics.median(run["stages"].get(stage, 0.0) for run in video_runs), 3) for stage in stages},
+            "peak_rss_mb": max(run["peak_rss_mb"] for run in video_runs),
+            "openai_requests": statistics.median(run["mock_openai"]["requests"] for run in video_runs),
+            "accuracy": video_runs[-1]["accuracy"]
+        }
+    return summary
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the analysis pipeline offline on synthetic videos")
+    parser.add_argument("--suite", choices=sorted(SUITES), default="quick")
+    parser.add_argument("--videos-dir", default=BENCH_VIDEO_DIR, help="where generated videos are cached")
+    parser.add_argument("--output", help="results JSON path (default: bench/results/<suite>-<timestamp>.json)")
+    parser.add_argument("--repeat", type=int, default=1, help="runs per video; the summary reports medians")
+    parser.add_argument("--warm", action="store_true", help="keep caches between runs instead of measuring the cold path")
+    parser.add_argument("--detector", help="scene detector to request (default: server default)")
+    parser.add_argument("--scene-threshold", type=float, default=0.06)
+    parser.add_argument("--tolerance", type=float, default=0.25, help="seconds a boundary may be off and still match a cut")
+    parser.add_argument("--latency", type=float, default=0.5, help="mock OpenAI mean seconds per completion")
+    parser.add_argument("--jitter", type=float, default=0.1, help="mock OpenAI latency jitter (±seconds)")
+    parser.add_argument("--rate-429", type=float, default=0.0, help="fraction of mock OpenAI requests answered with 429")
+    parser.add_argument("--retry-after", type=float, default=0.5, help="Retry-After seconds on mock 429s")
+    parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE",
+                        help="server setting for this run, e.g. --env DESCRIBE_BATCH_SCENES=4 (repeatable)")
+    parser.add_argument("--keep", action="store_true", help="keep the working directory with outputs")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(levelname)s - %(message)s')
+    logger.setLevel(logging.INFO)
+
+    videos = ensure_suite(args.suite, args.videos_dir)
+    mock = MockOpenAI(latency=args.latency, jitter=args.jitter, rate_429=args.rate_429, retry_after=args.retry_after).start()
+    work_dir = tempfile.mkdtemp(prefix="clipweaver-bench-")
+
+    # Settings are read when the backend modules are imported, so they go in first
+    overrides = dict(item.split("=", 1) for item in args.env)
+    os.environ.update(backend_settings(mock.url, work_dir, {"JOB_STORE": "memory", **overrides}))
+    output = args.output or os.path.join(RESULTS_DIR, f"{args.suite}-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json")
+    output = os.path.abspath(output)
+    os.chdir(work_dir)
+
+    import app as app_module
+    logging.getLogger().setLevel(logging.WARNING)
+    client = app_module.app.test_client()
+    sampler = RssSampler()
+
+    runs = []
+    try:
+        for repeat in range(args.repeat):
+            for video in videos:
+                logger.info(f"⏱️ {video['spec']['name']} (run {repeat + 1}/{args.repeat})")
+                run = run_video(client, app_module, video, mock, sampler, args)
+                runs.append(run)
+                if "error" in run:
+                    logger.error(f"❌ {run['video']}: {run['error']}")
+                else:
+                    logger.info(f"✅ {run['video']}: {run['wall_seconds']}s, {run['peak_rss_mb']} MB peak, "
+                                f"F1 {run['accuracy']['f1']}, {run['mock_openai']['requests']} OpenAI requests")
+    finally:
+        mock.stop()
+        if not args.keep:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    results = {
+        "environment": environment_info(),
+        "config": {
+            "suite": args.suite,
+            "repeat": args.repeat,
+            "warm": args.warm,
+            "detector": args.detector,
+            "scene_threshold": args.scene_threshold,
+            "tolerance": args.tolerance,
+            "mock_openai": {"latency": args.latency, "jitter": args.jitter, "rate_429": args.rate_429, "retry_after": args.retry_after},
+            "env": overrides
+        },
+        "videos": {video["spec"]["name"]: {"spec": video["spec"], "cuts": video["cuts"]} for video in videos},
+        "runs": runs,
+        "summary": summarize(runs)
+    }
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+    logger.info(f"📄 Results written to {output}")
+    if args.keep:
+        logger.info(f"📁 Outputs kept in {work_dir}")
+    return 1 if any("error" in run for run in runs) else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,155 @@
+import os
+import json
+import random
+import subprocess
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Generated videos are cached here and reused while their spec is unchanged
+BENCH_VIDEO_DIR = os.getenv("BENCH_VIDEO_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "videos"))
+
+# Bump when the generator changes in a way that alters the videos
+GENERATOR_VERSION = 1
+
+# lavfi sources cycled through for consecutive shots; neighbours differ in
+# structure and colour so every join is a hard cut, and each one moves (or
+# evolves) so a shot is not a single frozen frame
+_SOURCES = [
+    "testsrc2=size={size}:rate={fps}",
+    "life=size={size}:rate={fps}:seed={seed}:mold=10:ratio=0.1:death_color=#402060:life_color=#e0c020",
+    "smptehdbars=size={size}:rate={fps}",
+    "gradients=size={size}:rate={fps}:seed={seed}:speed=0.05",
+    "cellauto=size={size}:rate={fps}:seed={seed}:rule=110:scroll=1",
+    "rgbtestsrc=size={size}:rate={fps}",
+]
+
+class VideoSpec:
+    """
+    A synthetic benchmark video: resolution, frame rate and shot lengths
+
+    Shot lengths come from a seeded random generator, so the same spec
+    always yields the same video and the same cut points.
+    """
+
+    def __init__(self, name, width, height, fps, duration, min_shot=2.0, max_shot=8.0, seed=1):
+        self.name = name
+        self.width = width
+        self.height = height
+        self.fps = fps
+        self.duration = duration
+        self.min_shot = min_shot
+        self.max_shot = max_shot
+        self.seed = seed
+
+    def shots(self):
+        """Shot durations in seconds, each a whole number of frames, summing to duration"""
+        rng = random.Random(self.seed)
+        total_frames = round(self.duration * self.fps)
+        shots = []
+        used = 0
+        while used < total_frames:
+            frames = round(rng.uniform(self.min_shot, self.max_shot) * self.fps)
+            frames = min(frames, total_frames - used)
+            # Fold a too-short tail into the previous shot
+            if shots and frames < self.min_shot * self.fps:
+                shots[-1] += frames
+            else:
+                shots.append(frames)
+            used += frames
+        return [frames / self.fps for frames in shots]
+
+    def cuts(self):
+        """Timestamps of the hard cuts between shots"""
+        times = []
+        position = 0.0
+        for shot in self.shots()[:-1]:
+            position += shot
+            times.append(round(position, 6))
+        return times
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "width": self.width,
+            "height": self.height,
+            "fps": self.fps,
+            "duration": self.duration,
+            "min_shot": self.min_shot,
+            "max_shot": self.max_shot,
+            "seed": self.seed,
+            "generator_version": GENERATOR_VERSION
+        }
+
+# Suites of specs; videos are rendered once (the first run takes a while) and reused
+SUITES = {
+    "quick": [
+        VideoSpec("360p-30s", 640, 360, 25, 30),
+        VideoSpec("720p-60s", 1280, 720, 30, 60, seed=2),
+    ],
+    "full": [
+        VideoSpec("360p-30s", 640, 360, 25, 30),
+        VideoSpec("720p-60s", 1280, 720, 30, 60, seed=2),
+        VideoSpec("1080p-120s", 1920, 1080, 30, 120, seed=3),
+        VideoSpec("480p-300s-short-shots", 854, 480, 25, 300, min_shot=1.5, max_shot=4.0, seed=4),
+    ],
+}
+
+def build_command(spec, path):
+    """ffmpeg command rendering a spec's shots and joining them with hard cuts"""
+    size = f"{spec.width}x{spec.height}"
+    cmd = ["ffmpeg", "-hide_banner", "-loglevel", "error", "-y"]
+    graph = []
+    shots = spec.shots()
+    for index, shot in enumerate(shots):
+        source = _SOURCES[index % len(_SOURCES)].format(size=size, fps=spec.fps, seed=spec.seed * 1000 + index)
+        cmd += ["-f", "lavfi", "-t", f"{shot:.6f}", "-i", source]
+        # Rotate the hue on repeats of a source so no two shots look alike
+        hue = (index // len(_SOURCES)) * 67 % 360
+        graph.append(f"[{index}:v]hue=h={hue},scale={size},setsar=1,format=yuv420p[v{index}]")
+    graph.append("".join(f"[v{index}]" for index in range(len(shots))) + f"concat=n={len(shots)}:v=1:a=0[out]")
+    cmd += [
+        "-filter_complex", ";".join(graph), "-map", "[out]",
+        "-c:v", "libx264", "-preset", "veryfast", "-crf", "23", "-g", str(spec.fps * 2),
+        "-pix_fmt", "yuv420p", "-movflags", "+faststart", path
+    ]
+    return cmd
+
+def ensure_video(spec, directory=BENCH_VIDEO_DIR):
+    """
+    Generate a spec's video unless an identical one is already cached
+
+    Returns:
+        Dict with path, spec, shots and cuts (the ground truth for accuracy)
+    """
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{spec.name}.mp4")
+    meta_path = os.path.join(directory, f"{spec.name}.json")
+    info = {"path": path, "spec": spec.to_dict(), "shots": spec.shots(), "cuts": spec.cuts()}
+
+    try:
+        with open(meta_path) as f:
+            if json.load(f)["spec"] == info["spec"] and os.path.exists(path):
+                return info
+    except (OSError, ValueError, KeyError):
+        pass
+
+    logger.info(f"🎞️ Generating {spec.name} ({len(info['shots'])} shots)")
+    subprocess.run(build_command(spec, path), check=True)
+    with open(meta_path, "w") as f:
+        json.dump(info, f, indent=2)
+    return info
+
+def ensure_suite(suite, directory=BENCH_VIDEO_DIR):
+    """Generate (or reuse) every video of a suite"""
+    return [ensure_video(spec, directory) for spec in SUITES[suite]]
+
+if __name__ == "__main__":
+    import argparse
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Generate the synthetic benchmark videos")
+    parser.add_argument("--suite", choices=sorted(SUITES), default="quick")
+    parser.add_argument("--dir", default=BENCH_VIDEO_DIR)
+    args = parser.parse_args()
+    for video in ensure_suite(args.suite, args.dir):
+        print(f"{video['path']}: {len(video['cuts'])} cuts")
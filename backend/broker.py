@@ -0,0 +1,497 @@
+import os
+import math
+import json
+import time
+import sqlite3
+import threading
+import logging
+from abc import ABC, abstractmethod
+
+from jobs import JOB_QUEUE_SIZE, QueueFullError
+
+logger = logging.getLogger(__name__)
+
+# Where /analyze sends jobs: local (in-process worker threads), sqlite (worker processes on this host) or redis (worker nodes)
+JOB_BROKER = os.getenv("JOB_BROKER", "local")
+BROKER_PATH = os.getenv("BROKER_PATH", os.path.join("data", "broker.db"))
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+REDIS_PREFIX = os.getenv("REDIS_PREFIX", "clipweaver:")
+# A claimed job returns to the queue when its worker has not heartbeated for this many seconds
+BROKER_VISIBILITY_TIMEOUT = float(os.getenv("BROKER_VISIBILITY_TIMEOUT", 120))
+BROKER_HEARTBEAT_INTERVAL = float(os.getenv("BROKER_HEARTBEAT_INTERVAL", 15))
+# Attempts per job, counting crashed workers and failed runs, before it is marked as failed
+BROKER_MAX_ATTEMPTS = int(os.getenv("BROKER_MAX_ATTEMPTS", 3))
+# Seconds between queue checks by idle workers and by requests waiting for a job
+BROKER_POLL_INTERVAL = float(os.getenv("BROKER_POLL_INTERVAL", 1.0))
+# Finished jobs are kept this long for wait() and then dropped from the broker
+BROKER_RETENTION = int(os.getenv("BROKER_RETENTION", 3600))
+
+class Lease:
+    """A claimed job: its id, JSON payload and 1-based attempt number"""
+
+    def __init__(self, job_id, payload, attempt):
+        self.job_id = job_id
+        self.payload = payload
+        self.attempt = attempt
+
+class Broker(ABC):
+    """
+    Durable job queue shared by the API tier and worker processes
+
+    Jobs carry a JSON payload. A worker claims the oldest queued job and
+    holds a lease on it, which its heartbeats keep extending; a job whose
+    lease runs out (the worker crashed or hung) is put back at the front of
+    the queue, and a job whose run fails is put back at the end, until it
+    has used max_attempts. Workers register with heartbeats too, so the
+    pool size used for queue ETAs counts only live workers.
+    """
+
+    def __init__(self, max_queued=JOB_QUEUE_SIZE, visibility_timeout=BROKER_VISIBILITY_TIMEOUT, max_attempts=BROKER_MAX_ATTEMPTS):
+        self.max_queued = max_queued
+        self.visibility_timeout = visibility_timeout
+        self.max_attempts = max(1, max_attempts)
+
+    @abstractmethod
+    def submit(self, job_id, payload):
+        """
+        Queue a job for the workers
+
+        Returns:
+            1-based queue position of the job
+
+        Raises:
+            QueueFullError: when max_queued jobs are already waiting
+        """
+
+    @abstractmethod
+    def claim(self, worker_id):
+        """Lease the oldest queued job to a worker; returns a Lease or None when the queue is empty"""
+
+    @abstractmethod
+    def heartbeat(self, worker_id, slots, job_ids):
+        """
+        Mark a worker alive and extend the leases of the jobs it is running
+
+        Returns:
+            Job ids among job_ids whose lease the worker no longer holds
+        """
+
+    @abstractmethod
+    def complete(self, lease):
+        """Mark a leased job as done"""
+
+    @abstractmethod
+    def fail(self, lease, error):
+        """Record a failed attempt; returns True if the job was queued again for another attempt"""
+
+    @abstractmethod
+    def reap(self):
+        """
+        Requeue (or, out of attempts, fail) jobs whose lease has expired
+
+        Returns:
+            List of (job_id, attempt, requeued) for the jobs reaped
+        """
+
+    @abstractmethod
+    def state(self, job_id):
+        """queued, running, done, failed, or None for unknown jobs"""
+
+    @abstractmethod
+    def position(self, job_id):
+        """1-based position of a waiting job, or None if it is running or unknown"""
+
+    @abstractmethod
+    def stats(self):
+        """Current queue depth, running job count and live worker slots"""
+
+    @abstractmethod
+    def avg_duration(self):
+        """Recent average job duration in seconds, or None before any job has finished"""
+
+    def eta(self, job_id):
+        """Estimated seconds until a waiting job starts, or None if unknown"""
+        position = self.position(job_id)
+        duration = self.avg_duration()
+        if position is None or duration is None:
+            return None
+        workers = max(1, self.stats()["workers"])
+        return round(math.ceil(position / workers) * duration, 1)
+
+    def _retry_after(self, queued):
+        duration = self.avg_duration()
+        if duration is None:
+            return 30
+        return math.ceil((queued + 1) / max(1, self.stats()["workers"])) * duration
+
+    def wait(self, job_id, timeout=None):
+        """Block until a job is done or failed; returns False on timeout"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self.state(job_id) in ("queued", "running"):
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(BROKER_POLL_INTERVAL)
+        return True
+
+class SQLiteBroker(Broker):
+    """
+    Broker in a SQLite database, for worker processes on one host (or local testing)
+
+    Claims run in an IMMEDIATE transaction, so two workers never lease the
+    same job.
+    """
+
+    def __init__(self, path=BROKER_PATH, **kwargs):
+        super().__init__(**kwargs)
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False, timeout=30, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS queue (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                job_id TEXT NOT NULL UNIQUE,
+                payload TEXT NOT NULL,
+                state TEXT NOT NULL,
+                attempt INTEGER NOT NULL DEFAULT 0,
+                worker TEXT,
+                lease_until REAL,
+                error TEXT,
+                enqueued_at REAL NOT NULL,
+                started_at REAL,
+                finished_at REAL
+            );
+            CREATE INDEX IF NOT EXISTS queue_waiting ON queue (state, enqueued_at, seq);
+            CREATE INDEX IF NOT EXISTS queue_lease ON queue (state, lease_until);
+            CREATE TABLE IF NOT EXISTS workers (
+                worker_id TEXT PRIMARY KEY,
+                slots INTEGER NOT NULL,
+                heartbeat_at REAL NOT NULL
+            );
+        """)
+
+    def _transaction(self, fn):
+        with self.lock:
+            self.db.execute("BEGIN IMMEDIATE")
+            try:
+                result = fn()
+                self.db.execute("COMMIT")
+                return result
+            except Exception:
+                self.db.execute("ROLLBACK")
+                raise
+
+    def submit(self, job_id, payload):
+        def enqueue():
+            queued = self.db.execute("SELECT COUNT(*) FROM queue WHERE state = 'queued'").fetchone()[0]
+            if queued >= self.max_queued:
+                return queued, None
+            self.db.execute(
+                "INSERT OR REPLACE INTO queue (job_id, payload, state, enqueued_at) VALUES (?, ?, 'queued', ?)",
+                (job_id, json.dumps(payload), time.time())
+            )
+            return queued, queued + 1
+
+        queued, position = self._transaction(enqueue)
+        if position is None:
+            raise QueueFullError(queued, self._retry_after(queued))
+        return position
+
+    def claim(self, worker_id):
+        def lease():
+            row = self.db.execute(
+                "SELECT seq, job_id, payload, attempt FROM queue WHERE state = 'queued' ORDER BY enqueued_at, seq LIMIT 1"
+            ).fetchone()
+            if row is None:
+                return None
+            seq, job_id, payload, attempt = row
+            now = time.time()
+            self.db.execute(
+                "UPDATE queue SET state = 'running', attempt = ?, worker = ?, lease_until = ?, started_at = ? WHERE seq = ?",
+                (attempt + 1, worker_id, now + self.visibility_timeout, now, seq)
+            )
+            return Lease(job_id, json.loads(payload), attempt + 1)
+
+        return self._transaction(lease)
+
+    def heartbeat(self, worker_id, slots, job_ids):
+        def beat():
+            now = time.time()
+            self.db.execute(
+                "INSERT OR REPLACE INTO workers (worker_id, slots, heartbeat_at) VALUES (?, ?, ?)", (worker_id, slots, now)
+            )
+            lost = []
+            for job_id in job_ids:
+                extended = self.db.execute(
+                    "UPDATE queue SET lease_until = ? WHERE job_id = ? AND state = 'running' AND worker = ?",
+                    (now + self.visibility_timeout, job_id, worker_id)
+                ).rowcount
+                if not extended:
+                    lost.append(job_id)
+            # Workers silent for a full visibility timeout are gone; their jobs are reaped separately
+            self.db.execute("DELETE FROM workers WHERE heartbeat_at < ?", (now - self.visibility_timeout,))
+            return lost
+
+        return self._transaction(beat)
+
+    def complete(self, lease):
+        with self.lock:
+            self.db.execute(
+                "UPDATE queue SET state = 'done', lease_until = NULL, finished_at = ? WHERE job_id = ? AND state = 'running' AND attempt = ?",
+                (time.time(), lease.job_id, lease.attempt)
+            )
+
+    def fail(self, lease, error):
+        requeue = lease.attempt < self.max_attempts
+        with self.lock:
+            if requeue:
+                # Back of the queue, so a job that keeps failing doesn't hold up the others
+                self.db.execute(
+                    "UPDATE queue SET state = 'queued', worker = NULL, lease_until = NULL, error = ?, enqueued_at = ? "
+                    "WHERE job_id = ? AND state = 'running' AND attempt = ?",
+                    (error, time.time(), lease.job_id, lease.attempt)
+                )
+            else:
+                self.db.execute(
+                    "UPDATE queue SET state = 'failed', lease_until = NULL, error = ?, finished_at = ? "
+                    "WHERE job_id = ? AND state = 'running' AND attempt = ?",
+                    (error, time.time(), lease.job_id, lease.attempt)
+                )
+        return requeue
+
+    def reap(self):
+        def expire():
+            now = time.time()
+            rows = self.db.execute(
+                "SELECT job_id, attempt FROM queue WHERE state = 'running' AND lease_until < ?", (now,)
+            ).fetchall()
+            reaped = []
+            for job_id, attempt in rows:
+                requeue = attempt < self.max_attempts
+                if requeue:
+                    # Keeps its original enqueue time, so it goes back to the front
+                    self.db.execute(
+                        "UPDATE queue SET state = 'queued', worker = NULL, lease_until = NULL, error = 'lease expired' WHERE job_id = ?",
+                        (job_id,)
+                    )
+                else:
+                    self.db.execute(
+                        "UPDATE queue SET state = 'failed', lease_until = NULL, error = 'lease expired', finished_at = ? WHERE job_id = ?",
+                        (now, job_id)
+                    )
+                reaped.append((job_id, attempt, requeue))
+            self.db.execute("DELETE FROM queue WHERE state IN ('done', 'failed') AND finished_at < ?", (now - BROKER_RETENTION,))
+            return reaped
+
+        return self._transaction(expire)
+
+    def state(self, job_id):
+        with self.lock:
+            row = self.db.execute("SELECT state FROM queue WHERE job_id = ?", (job_id,)).fetchone()
+        return row[0] if row else None
+
+    def position(self, job_id):
+        with self.lock:
+            job = self.db.execute("SELECT enqueued_at, seq FROM queue WHERE job_id = ? AND state = 'queued'", (job_id,)).fetchone()
+            if job is None:
+                return None
+            ahead = self.db.execute(
+                "SELECT COUNT(*) FROM queue WHERE state = 'queued' AND (enqueued_at < ? OR (enqueued_at = ? AND seq < ?))",
+                (job[0], job[0], job[1])
+            ).fetchone()[0]
+        return ahead + 1
+
+    def stats(self):
+        with self.lock:
+            counts = dict(self.db.execute(
+                "SELECT state, COUNT(*) FROM queue WHERE state IN ('queued', 'running') GROUP BY state"
+            ).fetchall())
+            slots = self.db.execute(
+                "SELECT COALESCE(SUM(slots), 0) FROM workers WHERE heartbeat_at >= ?", (time.time() - self.visibility_timeout,)
+            ).fetchone()[0]
+        return {"queued": counts.get("queued", 0), "running": counts.get("running", 0), "workers": slots}
+
+    def avg_duration(self):
+        with self.lock:
+            row = self.db.execute(
+                "SELECT AVG(finished_at - started_at) FROM "
+                "(SELECT finished_at, started_at FROM queue WHERE state = 'done' ORDER BY finished_at DESC LIMIT 20)"
+            ).fetchone()
+        return row[0]
+
+# Atomic queue operations; KEYS are queue list, lease sorted set, ARGV[1] the job hash key prefix
+_SUBMIT_SCRIPT = """
+local queued = redis.call('LLEN', KEYS[1])
+if queued >= tonumber(ARGV[5]) then return {0, queued} end
+local key = ARGV[1] .. ARGV[2]
+redis.call('DEL', key)
+redis.call('HSET', key, 'payload', ARGV[3], 'state', 'queued', 'attempt', 0, 'enqueued_at', ARGV[4])
+return {1, redis.call('RPUSH', KEYS[1], ARGV[2])}
+"""
+
+_CLAIM_SCRIPT = """
+local job_id = redis.call('LPOP', KEYS[1])
+if not job_id then return nil end
+local key = ARGV[1] .. job_id
+local attempt = redis.call('HINCRBY', key, 'attempt', 1)
+redis.call('HSET', key, 'state', 'running', 'worker', ARGV[2], 'started_at', ARGV[3])
+redis.call('ZADD', KEYS[2], ARGV[4], job_id)
+return {job_id, redis.call('HGET', key, 'payload'), attempt}
+"""
+
+_HEARTBEAT_SCRIPT = """
+local lost = {}
+for i = 4, #ARGV do
+    local job_id = ARGV[i]
+    if redis.call('HGET', ARGV[1] .. job_id, 'worker') == ARGV[2] and redis.call('ZSCORE', KEYS[2], job_id) then
+        redis.call('ZADD', KEYS[2], ARGV[3], job_id)
+    else
+        table.insert(lost, job_id)
+    end
+end
+return lost
+"""
+
+_FINISH_SCRIPT = """
+local key = ARGV[1] .. ARGV[2]
+if redis.call('HGET', key, 'attempt') ~= ARGV[3] or redis.call('HGET', key, 'state') ~= 'running' then return 0 end
+redis.call('ZREM', KEYS[2], ARGV[2])
+redis.call('HSET', key, 'state', ARGV[4], 'error', ARGV[5], 'finished_at', ARGV[6])
+if ARGV[4] == 'queued' then
+    redis.call('RPUSH', KEYS[1], ARGV[2])
+else
+    redis.call('EXPIRE', key, ARGV[7])
+end
+return 1
+"""
+
+_REAP_SCRIPT = """
+local reaped = {}
+for _, job_id in ipairs(redis.call('ZRANGEBYSCORE', KEYS[2], '-inf', ARGV[2])) do
+    redis.call('ZREM', KEYS[2], job_id)
+    local key = ARGV[1] .. job_id
+    local attempt = tonumber(redis.call('HGET', key, 'attempt') or '0')
+    if attempt < tonumber(ARGV[3]) then
+        redis.call('HSET', key, 'state', 'queued', 'error', 'lease expired')
+        redis.call('LPUSH', KEYS[1], job_id)
+        table.insert(reaped, {job_id, attempt, 1})
+    else
+        redis.call('HSET', key, 'state', 'failed', 'error', 'lease expired')
+        redis.call('EXPIRE', key, ARGV[4])
+        table.insert(reaped, {job_id, attempt, 0})
+    end
+end
+return reaped
+"""
+
+class RedisBroker(Broker):
+    """
+    Broker on a Redis-compatible server, for workers spread over several nodes
+
+    The queue is a list of job ids, leases a sorted set scored by expiry
+    time, and each job a hash with its payload, state and attempt count.
+    Submits, claims, heartbeats and reaping run as Lua scripts so they are
+    atomic; concurrent submits can't push the queue past max_queued.
+    """
+
+    def __init__(self, url=REDIS_URL, prefix=REDIS_PREFIX, **kwargs):
+        super().__init__(**kwargs)
+        # Imported on first use so redis stays optional for the local and sqlite brokers
+        import redis
+        self.redis = redis.Redis.from_url(url, decode_responses=True)
+        self.prefix = prefix
+        self.queue_key = f"{prefix}queue"
+        self.lease_key = f"{prefix}leases"
+        self.workers_key = f"{prefix}workers"
+        self.slots_key = f"{prefix}worker_slots"
+        self.duration_key = f"{prefix}avg_duration"
+        self.job_prefix = f"{prefix}job:"
+        self._submit = self.redis.register_script(_SUBMIT_SCRIPT)
+        self._claim = self.redis.register_script(_CLAIM_SCRIPT)
+        self._heartbeat = self.redis.register_script(_HEARTBEAT_SCRIPT)
+        self._finish = self.redis.register_script(_FINISH_SCRIPT)
+        self._reap = self.redis.register_script(_REAP_SCRIPT)
+
+    def submit(self, job_id, payload):
+        accepted, count = self._submit(keys=[self.queue_key, self.lease_key],
+                                       args=[self.job_prefix, job_id, json.dumps(payload), time.time(), self.max_queued])
+        if not accepted:
+            raise QueueFullError(count, self._retry_after(count))
+        return count
+
+    def claim(self, worker_id):
+        now = time.time()
+        row = self._claim(keys=[self.queue_key, self.lease_key],
+                          args=[self.job_prefix, worker_id, now, now + self.visibility_timeout])
+        if row is None:
+            return None
+        job_id, payload, attempt = row
+        return Lease(job_id, json.loads(payload), int(attempt))
+
+    def heartbeat(self, worker_id, slots, job_ids):
+        now = time.time()
+        with self.redis.pipeline() as pipe:
+            pipe.zadd(self.workers_key, {worker_id: now})
+            pipe.hset(self.slots_key, worker_id, slots)
+            stale = self.redis.zrangebyscore(self.workers_key, "-inf", now - self.visibility_timeout)
+            if stale:
+                pipe.zrem(self.workers_key, *stale)
+                pipe.hdel(self.slots_key, *stale)
+            pipe.execute()
+        return self._heartbeat(keys=[self.queue_key, self.lease_key],
+                               args=[self.job_prefix, worker_id, now + self.visibility_timeout, *job_ids])
+
+    def _finish_job(self, lease, state, error):
+        return self._finish(keys=[self.queue_key, self.lease_key],
+                            args=[self.job_prefix, lease.job_id, lease.attempt, state, error, time.time(), BROKER_RETENTION])
+
+    def complete(self, lease):
+        started = self.redis.hget(self.job_prefix + lease.job_id, "started_at")
+        if self._finish_job(lease, "done", "") and started:
+            # Exponentially weighted so the estimate follows recent load; concurrent updates may drop a sample
+            duration = time.time() - float(started)
+            previous = self.redis.get(self.duration_key)
+            self.redis.set(self.duration_key, duration if previous is None else 0.8 * float(previous) + 0.2 * duration)
+
+    def fail(self, lease, error):
+        requeue = lease.attempt < self.max_attempts
+        self._finish_job(lease, "queued" if requeue else "failed", error)
+        return requeue
+
+    def reap(self):
+        rows = self._reap(keys=[self.queue_key, self.lease_key],
+                          args=[self.job_prefix, time.time(), self.max_attempts, BROKER_RETENTION])
+        return [(job_id, int(attempt), bool(requeued)) for job_id, attempt, requeued in rows]
+
+    def state(self, job_id):
+        return self.redis.hget(self.job_prefix + job_id, "state")
+
+    def position(self, job_id):
+        index = self.redis.lpos(self.queue_key, job_id)
+        return index + 1 if index is not None else None
+
+    def stats(self):
+        live = self.redis.zrangebyscore(self.workers_key, time.time() - self.visibility_timeout, "+inf")
+        slots = self.redis.hmget(self.slots_key, live) if live else []
+        return {
+            "queued": self.redis.llen(self.queue_key),
+            "running": self.redis.zcard(self.lease_key),
+            "workers": sum(int(value) for value in slots if value)
+        }
+
+    def avg_duration(self):
+        value = self.redis.get(self.duration_key)
+        return float(value) if value is not None else None
+
+def create_broker():
+    """Build the broker selected by JOB_BROKER, or None when jobs run in this process"""
+    if JOB_BROKER == "sqlite":
+        return SQLiteBroker()
+    if JOB_BROKER == "redis":
+        return RedisBroker()
+    if JOB_BROKER != "local":
+        logger.error(f"❌ Unknown JOB_BROKER '{JOB_BROKER}', running jobs in this process")
+    return None
@@ -0,0 +1,188 @@
+import os
+import json
+import time
+import shutil
+import hashlib
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Bump when the cached payload or the analysis pipeline changes meaningfully
+CACHE_VERSION = 2
+
+RESULT_CACHE_DIR = os.getenv("RESULT_CACHE_DIR", os.path.join("cache", "results"))
+RESULT_CACHE_MAX_BYTES = int(os.getenv("RESULT_CACHE_MAX_BYTES", 2 * 1024 ** 3))
+# Seconds since an entry was created (not last used) after which it is no longer served, so
+# descriptions are regenerated now and then even for videos that keep hitting the cache
+RESULT_CACHE_MAX_AGE = int(os.getenv("RESULT_CACHE_MAX_AGE", 7 * 24 * 3600))
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+def hash_file(path):
+    """Streaming SHA-256 of a file's bytes"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(HASH_CHUNK_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def _link_or_copy(src, dst):
+    """Hard link when possible so cached screenshots cost no extra disk space"""
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+class ResultCache:
+    """
+    Content-addressed store of finished analyses
+
+    Each entry is a directory named after the cache key holding entry.json
+    (scene bounds, screenshot metadata and descriptions) and its own links to
+    the screenshot files, so entries stay valid after the originating request
+    folder is deleted. Entries expire max_age seconds after they were created,
+    however often they are hit; within that, the least recently used are
+    evicted first to stay under max_bytes.
+    """
+
+    def __init__(self, root=RESULT_CACHE_DIR, max_bytes=RESULT_CACHE_MAX_BYTES, max_age=RESULT_CACHE_MAX_AGE):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.lock = threading.Lock()
+        os.makedirs(self.root, exist_ok=True)
+
+    @staticmethod
+    def make_key(video_hash, scene_threshold, max_scenes, deployment, detector="ffmpeg"):
+        """Cache key covering the video content and every parameter that changes the result"""
+        params = {
+            "version": CACHE_VERSION,
+            "video_sha256": video_hash,
+            "scene_threshold": float(scene_threshold),
+            "max_scenes": int(max_scenes),
+            "deployment": deployment,
+            "detector": detector
+        }
+        return hashlib.sha256(json.dumps(params, sort_keys=True).encode()).hexdigest()
+
+    def _entry_dir(self, key):
+        return os.path.join(self.root, key)
+
+    def get(self, key, scene_dir):
+        """
+        Look up a cached analysis and materialise its screenshots in scene_dir
+
+        Returns:
+            (scene_list, scene_descriptions) or None on a miss
+        """
+        entry_dir = self._entry_dir(key)
+        entry_path = os.path.join(entry_dir, "entry.json")
+        try:
+            with open(entry_path) as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        if time.time() - entry.get("created_at", 0) > self.max_age:
+            return None
+
+        os.makedirs(scene_dir, exist_ok=True)
+        scene_list = []
+        try:
+            for scene in entry["scenes"]:
+                screenshots = []
+                for shot in scene["screenshots"]:
+                    path = os.path.join(scene_dir, shot["file"])
+                    if not os.path.exists(path):
+                        _link_or_copy(os.path.join(entry_dir, shot["file"]), path)
+                    thumbnails = {}
+                    for width, filename in shot.get("thumbnails", {}).items():
+                        thumbnails[int(width)] = os.path.join(scene_dir, filename)
+                        if not os.path.exists(thumbnails[int(width)]):
+                            _link_or_copy(os.path.join(entry_dir, filename), thumbnails[int(width)])
+                    screenshots.append({
+                        'path': path,
+                        'timestamp': shot["timestamp"],
+                        'position': shot["position"],
+                        'scene_start': scene["start"],
+                        'scene_end': scene["end"],
+                        'thumbnails': thumbnails
+                    })
+                scene_list.append({
+                    'scene_num': scene["scene_num"],
+                    'start': scene["start"],
+                    'end': scene["end"],
+                    'total_scenes': len(entry["scenes"]),
+                    'screenshots': screenshots
+                })
+        except (OSError, KeyError) as e:
+            logger.info(f"⚠️ Discarding unusable cache entry {key[:12]}: {e}")
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            return None
+
+        # Touch the entry so eviction is least-recently-used
+        os.utime(entry_path)
+        return scene_list, [scene["description"] for scene in entry["scenes"]]
+
+    def put(self, key, scene_list, scene_descriptions):
+        """Store a finished analysis; concurrent writers of the same key keep the first entry"""
+        entry_dir = self._entry_dir(key)
+        if os.path.exists(entry_dir):
+            return
+
+        staging_dir = f"{entry_dir}.{os.getpid()}.{threading.get_ident()}.tmp"
+        os.makedirs(staging_dir, exist_ok=True)
+        try:
+            scenes = []
+            for scene, description in zip(scene_list, scene_descriptions):
+                shots = []
+                for shot in scene['screenshots']:
+                    filename = os.path.basename(shot['path'])
+                    _link_or_copy(shot['path'], os.path.join(staging_dir, filename))
+                    thumbnails = {}
+                    for width, path in shot.get('thumbnails', {}).items():
+                        thumbnails[width] = os.path.basename(path)
+                        _link_or_copy(path, os.path.join(staging_dir, thumbnails[width]))
+                    shots.append({"file": filename, "timestamp": shot['timestamp'], "position": shot['position'],
+                                  "thumbnails": thumbnails})
+                scenes.append({
+                    "scene_num": scene['scene_num'],
+                    "start": scene['start'],
+                    "end": scene['end'],
+                    "screenshots": shots,
+                    "description": description
+                })
+
+            with open(os.path.join(staging_dir, "entry.json"), "w") as f:
+                json.dump({"created_at": time.time(), "scenes": scenes}, f)
+            os.rename(staging_dir, entry_dir)
+        except OSError as e:
+            logger.error(f"❌ Could not store cache entry {key[:12]}: {e}")
+            shutil.rmtree(staging_dir, ignore_errors=True)
+            return
+
+        self.evict()
+
+    def evict(self):
+        """Drop expired entries, then the least recently used ones until under max_bytes"""
+        with self.lock:
+            now = time.time()
+            entries = []
+            for name in os.listdir(self.root):
+                entry_dir = os.path.join(self.root, name)
+                entry_path = os.path.join(entry_dir, "entry.json")
+                if name.endswith(".tmp") or not os.path.exists(entry_path):
+                    continue
+                size = sum(entry.stat().st_size for entry in os.scandir(entry_dir) if entry.is_file())
+                # entry.json is touched on every hit; the directory keeps its creation-time mtime
+                entries.append((os.path.getmtime(entry_path), os.path.getmtime(entry_dir), size, entry_dir))
+
+            entries.sort()
+            total = sum(size for _, _, size, _ in entries)
+            for _, created_at, size, entry_dir in entries:
+                if now - created_at <= self.max_age and total <= self.max_bytes:
+                    continue
+                shutil.rmtree(entry_dir, ignore_errors=True)
+                total -= size
+                logger.info(f"🧹 Evicted cache entry {os.path.basename(entry_dir)[:12]}")
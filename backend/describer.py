@@ -0,0 +1,328 @@
+import os
+import re
+import json
+import base64
+import time
+import random
+import threading
+import logging
+from email.utils import parsedate_to_datetime
+from concurrent.futures import ThreadPoolExecutor, Future
+import openai
+from metrics import timed, record_usage, submit_in_context, OPENAI_REQUESTS, OPENAI_IN_FLIGHT
+
+logger = logging.getLogger(__name__)
+
+# Concurrent chat completion calls across all jobs in this process
+DESCRIBE_CONCURRENCY = int(os.getenv("DESCRIBE_CONCURRENCY", 4))
+# Sustained request budget shared by all jobs (requests per minute) and burst size
+DESCRIBE_RATE_LIMIT_RPM = float(os.getenv("DESCRIBE_RATE_LIMIT_RPM", 60))
+DESCRIBE_RATE_LIMIT_BURST = int(os.getenv("DESCRIBE_RATE_LIMIT_BURST", DESCRIBE_CONCURRENCY))
+# Retry policy for 429/5xx/connection errors
+DESCRIBE_MAX_RETRIES = int(os.getenv("DESCRIBE_MAX_RETRIES", 5))
+DESCRIBE_BACKOFF_BASE = float(os.getenv("DESCRIBE_BACKOFF_BASE", 1.0))
+DESCRIBE_BACKOFF_MAX = float(os.getenv("DESCRIBE_BACKOFF_MAX", 60.0))
+# Consecutive scenes described together in one multi-image request (1 = one request per scene)
+DESCRIBE_BATCH_SCENES = int(os.getenv("DESCRIBE_BATCH_SCENES", 1))
+# Completion tokens budgeted per scene description
+DESCRIBE_MAX_TOKENS = int(os.getenv("DESCRIBE_MAX_TOKENS", 300))
+
+# Vision detail level requested for each frame: low, high or auto
+MODEL_IMAGE_DETAIL = os.getenv("MODEL_IMAGE_DETAIL", "auto")
+
+SYSTEM_PROMPT = "You are a helpful assistant that describes video scenes based on multiple frames."
+
+class TokenBucket:
+    """Thread-safe token bucket that can also be paused when the API asks us to back off"""
+
+    def __init__(self, rate_per_minute, capacity):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = max(1, capacity)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Block until a request may be sent"""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+
+                if now < self.paused_until:
+                    wait = self.paused_until - now
+                elif self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                else:
+                    wait = (1 - self.tokens) / self.rate if self.rate > 0 else 1.0
+            time.sleep(wait)
+
+    def pause(self, seconds):
+        """Hold back every caller for the given number of seconds"""
+        with self.lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+def _retry_after_seconds(error):
+    """Read Retry-After (or retry-after-ms) from an API error response, if present"""
+    response = getattr(error, 'response', None)
+    if response is None:
+        return None
+
+    headers = response.headers
+    if headers.get('retry-after-ms'):
+        try:
+            return float(headers['retry-after-ms']) / 1000
+        except ValueError:
+            pass
+
+    value = headers.get('retry-after')
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        try:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
+
+def _is_retryable(error):
+    if isinstance(error, (openai.RateLimitError, openai.APIConnectionError)):
+        return True
+    return isinstance(error, openai.APIStatusError) and error.status_code >= 500
+
+@timed("image_encoding")
+def _image_contents(scene):
+    """Image parts for a scene's screenshots, preferring the compact in-memory model view over the PNG"""
+    image_contents = []
+    for screenshot_info in scene['screenshots']:
+        model_image = screenshot_info.get('model_image')
+        if model_image:
+            data, mime = model_image['data'], model_image['mime']
+        else:
+            with open(screenshot_info['path'], "rb") as f:
+                data, mime = f.read(), "image/png"
+        image_data = base64.b64encode(data).decode('utf-8')
+        image_contents.append({"type": "image_url", "image_url": {"url": f"data:{mime};base64,{image_data}", "detail": MODEL_IMAGE_DETAIL}})
+    return image_contents
+
+def build_scene_messages(scene):
+    """Build the chat messages for one scene dict (scene_num, start, end, screenshots)"""
+    prompt = (f"Describe this video scene (timeframe {scene['start']:.1f}s - {scene['end']:.1f}s) based on these "
+              f"sequential frames. Focus on the overall action, movement, and story progression.")
+
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": [{"type": "text", "text": prompt}] + _image_contents(scene)}
+    ]
+
+def build_batch_messages(scenes):
+    """
+    Build one multi-image request for several consecutive scenes
+
+    Each scene's frames follow a text label with its number and timeframe,
+    and the model is asked for a JSON object with one description per
+    scene number so the reply can be split back up.
+    """
+    prompt = (f"Describe each of the following {len(scenes)} consecutive video scenes based on its sequential frames. "
+              f"Focus on the overall action, movement, and story progression of each scene, and describe every scene "
+              f"on its own. Reply with only a JSON object of the form "
+              f'{{"scenes": [{{"scene": <scene number>, "description": "<description>"}}]}} '
+              f"with one entry per scene.")
+
+    content = [{"type": "text", "text": prompt}]
+    for scene in scenes:
+        content.append({"type": "text", "text": f"Scene {scene['scene_num']} (timeframe {scene['start']:.1f}s - {scene['end']:.1f}s):"})
+        content.extend(_image_contents(scene))
+
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": content}
+    ]
+
+def parse_batch_descriptions(text, scene_nums):
+    """
+    Split a batched reply into per-scene descriptions
+
+    Returns:
+        Dict of scene number to description for the scenes the reply covers
+        (empty if the reply is not the requested JSON)
+    """
+    # Models sometimes wrap the object in a markdown code fence or add a preamble
+    match = re.search(r"\{.*\}", text or "", re.DOTALL)
+    if not match:
+        return {}
+    try:
+        data = json.loads(match.group(0))
+    except ValueError:
+        return {}
+
+    entries = data.get("scenes") if isinstance(data, dict) else None
+    if not isinstance(entries, list):
+        return {}
+
+    descriptions = {}
+    for entry in entries:
+        if not isinstance(entry, dict):
+            continue
+        try:
+            scene_num = int(entry.get("scene"))
+        except (TypeError, ValueError):
+            continue
+        description = entry.get("description")
+        if scene_num in scene_nums and isinstance(description, str) and description.strip():
+            descriptions[scene_num] = description.strip()
+    return descriptions
+
+def _chain(source, target):
+    """Resolve target with source's outcome once source is done"""
+    def copy(done):
+        error = done.exception()
+        if error is not None:
+            target.set_exception(error)
+        else:
+            target.set_result(done.result())
+    source.add_done_callback(copy)
+
+class SceneDescriber:
+    """
+    Describes scenes with Azure OpenAI using a bounded pool of concurrent calls
+
+    All jobs in the process share the pool and the token bucket, so the
+    number of in-flight requests and the request rate stay within budget no
+    matter how many videos are being processed.
+    """
+
+    def __init__(self, client, deployment, concurrency=DESCRIBE_CONCURRENCY, rate_limiter=None, max_retries=DESCRIBE_MAX_RETRIES):
+        self.client = client
+        self.deployment = deployment
+        self.max_retries = max_retries
+        self.rate_limiter = rate_limiter or TokenBucket(DESCRIBE_RATE_LIMIT_RPM, DESCRIBE_RATE_LIMIT_BURST)
+        self.executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="describe")
+
+    def complete(self, messages, max_tokens=DESCRIBE_MAX_TOKENS, on_retry=None):
+        """Send one chat completion, retrying 429/5xx with exponential backoff and jitter"""
+        for attempt in range(self.max_retries + 1):
+            self.rate_limiter.acquire()
+            try:
+                OPENAI_IN_FLIGHT.inc()
+                try:
+                    with timed("openai_call"):
+                        response = self.client.chat.completions.create(
+                            model=self.deployment,
+                            messages=messages,
+                            max_tokens=max_tokens
+                        )
+                finally:
+                    OPENAI_IN_FLIGHT.dec()
+                OPENAI_REQUESTS.inc(outcome="success")
+                record_usage(getattr(response, 'usage', None))
+                return response
+            except Exception as e:
+                if not _is_retryable(e) or attempt == self.max_retries:
+                    OPENAI_REQUESTS.inc(outcome="error")
+                    raise
+                OPENAI_REQUESTS.inc(outcome="retry")
+
+                delay = _retry_after_seconds(e)
+                if delay is None:
+                    delay = random.uniform(0, min(DESCRIBE_BACKOFF_MAX, DESCRIBE_BACKOFF_BASE * 2 ** attempt))
+                if isinstance(e, openai.RateLimitError):
+                    # Throttled: hold back every job, not just this call
+                    self.rate_limiter.pause(delay)
+
+                logger.info(f"⏳ Azure OpenAI call failed ({e.__class__.__name__}), retry {attempt + 1}/{self.max_retries} in {delay:.1f}s")
+                if on_retry:
+                    on_retry(attempt + 1, delay, e)
+                time.sleep(delay)
+
+    def describe(self, scene, on_retry=None):
+        """Describe a single scene, blocking until the description is available"""
+        response = self.complete(build_scene_messages(scene), on_retry=on_retry)
+        return response.choices[0].message.content.strip()
+
+    def submit(self, scene, on_retry=None):
+        """Queue a scene for description and return a Future with the description"""
+        return submit_in_context(self.executor, self.describe, scene, on_retry)
+
+    def submit_batch(self, scenes, on_retry=None, futures=None):
+        """
+        Queue several scenes for description in a single request
+
+        Args:
+            scenes: Consecutive scene dicts
+            on_retry: Retry callback for the batched request
+            futures: Optional Futures to resolve, one per scene
+
+        Returns:
+            One Future per scene with its description
+        """
+        futures = futures or [Future() for _ in scenes]
+        if len(scenes) == 1:
+            _chain(self.submit(scenes[0], on_retry), futures[0])
+        else:
+            submit_in_context(self.executor, self._describe_batch, scenes, futures, on_retry)
+        return futures
+
+    def _describe_batch(self, scenes, futures, on_retry):
+        scene_nums = {scene['scene_num'] for scene in scenes}
+        try:
+            response = self.complete(build_batch_messages(scenes), max_tokens=DESCRIBE_MAX_TOKENS * len(scenes), on_retry=on_retry)
+            descriptions = parse_batch_descriptions(response.choices[0].message.content, scene_nums)
+        except Exception as e:
+            logger.info(f"⚠️ Batched description of {len(scenes)} scenes failed ({e.__class__.__name__}), describing them one by one")
+            descriptions = None
+
+        if descriptions is not None and len(descriptions) < len(scenes):
+            logger.info(f"⚠️ Batched reply covered {len(descriptions)} of {len(scenes)} scenes, describing the rest one by one")
+
+        # Anything the batched reply did not cover gets its own request
+        for scene, future in zip(scenes, futures):
+            if descriptions and scene['scene_num'] in descriptions:
+                future.set_result(descriptions[scene['scene_num']])
+            else:
+                _chain(self.submit(scene, on_retry), future)
+
+class SceneBatcher:
+    """
+    Collects consecutive scenes of one job into batched description requests
+
+    submit() hands back a Future straight away; the scenes go out once
+    batch_size of them are pending or on flush(). With a batch size of 1
+    every scene is sent on its own as before.
+    """
+
+    def __init__(self, describer, batch_size=DESCRIBE_BATCH_SCENES, on_retry=None):
+        self.describer = describer
+        self.batch_size = max(1, batch_size)
+        self.on_retry = on_retry
+        self.pending = []
+
+    def submit(self, scene):
+        """Add a scene to the current batch and return a Future with its description"""
+        if self.batch_size == 1:
+            return self.describer.submit(scene, self.on_retry([scene]) if self.on_retry else None)
+
+        future = Future()
+        self.pending.append((scene, future))
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+        return future
+
+    def flush(self):
+        """Send the scenes collected so far"""
+        if not self.pending:
+            return
+        scenes = [scene for scene, _ in self.pending]
+        futures = [future for _, future in self.pending]
+        self.pending = []
+        self.describer.submit_batch(scenes, self.on_retry(scenes) if self.on_retry else None, futures)
+
+    def abort(self, error):
+        """Fail the scenes that were never sent, so nothing waits on them forever"""
+        for _, future in self.pending:
+            future.set_exception(error)
+        self.pending = []
@@ -0,0 +1,119 @@
+import os
+import threading
+import itertools
+import logging
+from collections import OrderedDict
+from concurrent.futures import Future
+
+logger = logging.getLogger(__name__)
+
+# dHash grid: each row compares HASH_WIDTH adjacent gray pixels -> 8x8 = 64 bits
+HASH_WIDTH = 9
+HASH_HEIGHT = 8
+
+# Largest per-frame Hamming distance (out of 64 bits) still treated as the same picture
+PHASH_MAX_DISTANCE = int(os.getenv("PHASH_MAX_DISTANCE", 6))
+# Scene signatures remembered across jobs (least recently used are dropped first)
+PHASH_INDEX_SIZE = int(os.getenv("PHASH_INDEX_SIZE", 5000))
+
+def dhash(pixels):
+    """64-bit difference hash from a HASH_WIDTH x HASH_HEIGHT grayscale frame (row-major bytes)"""
+    value = 0
+    for row in range(HASH_HEIGHT):
+        offset = row * HASH_WIDTH
+        for col in range(HASH_WIDTH - 1):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return f"{value:016x}"
+
+def hamming(a, b):
+    """Number of differing bits between two hex hashes"""
+    return (int(a, 16) ^ int(b, 16)).bit_count()
+
+def scene_signature(scene):
+    """Perceptual hashes of a scene's frames in position order, or None if any frame lacks one"""
+    hashes = tuple(shot.get('phash') for shot in scene['screenshots'])
+    if not hashes or None in hashes:
+        return None
+    return hashes
+
+class FrameIndex:
+    """
+    Bounded LRU index of scene signatures to their (pending or finished) descriptions
+
+    A signature is the tuple of dHashes of a scene's beginning/middle/end
+    frames. Two scenes match when every frame pair is within max_distance
+    bits. Entries hold the description Future, so a near-duplicate scene can
+    reuse a description that is still being generated, within one job or
+    across jobs; if that description then fails, the scene is described on
+    its own instead of inheriting the error.
+
+    Descriptions are reused verbatim: one that mentions a timeframe gives
+    the matched scene's times, not the reusing scene's.
+    """
+
+    def __init__(self, max_entries=PHASH_INDEX_SIZE, max_distance=PHASH_MAX_DISTANCE):
+        self.max_entries = max_entries
+        self.max_distance = max_distance
+        self.entries = OrderedDict()
+        self.ids = itertools.count()
+        self.lock = threading.Lock()
+
+    def _matches(self, a, b):
+        return len(a) == len(b) and all(hamming(x, y) <= self.max_distance for x, y in zip(a, b))
+
+    def describe(self, signature, submit, source, fallback=None):
+        """
+        Return a Future for a scene description, reusing a near-duplicate's when possible
+
+        Args:
+            signature: Scene signature from scene_signature()
+            submit: Callable returning a new description Future if no match exists
+            source: Dict identifying this scene (e.g. request_id, scene_num) for reuse logs
+            fallback: Callable returning a new description Future when a reused
+                description fails, called from the thread that completed it
+                (defaults to submit)
+
+        Returns:
+            (future, matched_source) where matched_source is None if a new call was made
+        """
+        if signature is None or self.max_entries <= 0:
+            return submit(), None
+
+        with self.lock:
+            for key, (entry_signature, future, entry_source) in reversed(self.entries.items()):
+                if self._matches(signature, entry_signature):
+                    self.entries.move_to_end(key)
+                    return self._reuse(future, fallback or submit, source), entry_source
+
+            future = submit()
+            key = next(self.ids)
+            self.entries[key] = (signature, future, source)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+        # Failed descriptions must not be reused
+        future.add_done_callback(lambda f: f.exception() and self._discard(key))
+        return future, None
+
+    def _reuse(self, future, fallback, source):
+        """Future resolved with a matched description, or with a fresh one if that description fails"""
+        reused = Future()
+
+        def copy(done):
+            if not done.cancelled() and done.exception() is None:
+                reused.set_result(done.result())
+                return
+            logger.info(f"⚠️ Reused description for {source} failed, describing the scene on its own")
+            try:
+                fresh = fallback()
+            except Exception as e:
+                reused.set_exception(e)
+                return
+            fresh.add_done_callback(lambda f: reused.set_exception(f.exception()) if f.exception() else reused.set_result(f.result()))
+
+        future.add_done_callback(copy)
+        return reused
+
+    def _discard(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
@@ -0,0 +1,432 @@
+import os
+import time
+import struct
+import hashlib
+import tempfile
+import threading
+import logging
+import requests
+from flask import Request
+
+logger = logging.getLogger(__name__)
+
+# Bytes buffered per disk write while ingesting uploads and downloads
+INGEST_CHUNK_SIZE = int(os.getenv("INGEST_CHUNK_SIZE", 1024 * 1024))
+# Largest accepted video (uploads and video_url downloads); 0 disables the limit
+MAX_VIDEO_BYTES = int(os.getenv("MAX_VIDEO_BYTES", 500 * 1024 ** 2))
+# Leading bytes inspected to recognise the container (MPEG-TS needs a few 188-byte packets)
+SNIFF_BYTES = 512
+
+VIDEO_EXTENSIONS = ('.mp4', '.mov', '.avi', '.webm')
+
+# Overlapped video_url ingest: parallel range requests, analysis starts while the transfer runs
+OVERLAP_DOWNLOAD = os.getenv("OVERLAP_DOWNLOAD", "true").lower() == "true"
+DOWNLOAD_CONNECTIONS = int(os.getenv("DOWNLOAD_CONNECTIONS", 4))
+DOWNLOAD_PART_SIZE = int(os.getenv("DOWNLOAD_PART_SIZE", 8 * 1024 * 1024))
+DOWNLOAD_RETRIES = int(os.getenv("DOWNLOAD_RETRIES", 3))
+# Socket read size for ranged downloads; small so readers see progress promptly
+DOWNLOAD_READ_SIZE = 64 * 1024
+
+class IngestError(Exception):
+    """Raised when an incoming video is rejected; carries the HTTP status to answer with"""
+
+    def __init__(self, message, status_code=400):
+        super().__init__(message)
+        self.status_code = status_code
+
+def sniff_container(header):
+    """Best-effort container name from a file's leading bytes, or None if unrecognised"""
+    if header[4:8] in (b'ftyp', b'moov', b'mdat', b'free', b'wide', b'skip', b'pnot'):
+        return "mov" if header[8:12] == b'qt  ' else "mp4"
+    if header.startswith(b'\x1a\x45\xdf\xa3'):
+        return "webm" if b'webm' in header[:64] else "matroska"
+    if header.startswith(b'RIFF') and header[8:12] == b'AVI ':
+        return "avi"
+    if header.startswith(b'\x00\x00\x01\xba'):
+        return "mpeg"
+    if header[:1] == b'\x47' and (len(header) <= 188 or header[188:189] == b'\x47'):
+        return "mpegts"
+    if header.startswith(b'FLV'):
+        return "flv"
+    if header.startswith(b'OggS'):
+        return "ogg"
+    if header.startswith(b'\x30\x26\xb2\x75\x8e\x66\xcf\x11'):
+        return "asf"
+    return None
+
+def _limit_mb(max_bytes):
+    return f"{max_bytes / (1024 * 1024):.0f} MB"
+
+class IngestWriter:
+    """
+    File-like sink that writes a video to disk in one pass
+
+    Bytes go through a large write buffer into a temporary file in the
+    target directory while the SHA-256 and size are updated and the
+    container is sniffed from the first bytes, so the video is never held
+    in memory nor copied a second time. Oversized or unrecognised inputs
+    raise IngestError as soon as they are detected.
+    """
+
+    def __init__(self, directory, max_bytes=MAX_VIDEO_BYTES):
+        os.makedirs(directory, exist_ok=True)
+        fd, self.temp_path = tempfile.mkstemp(dir=directory, prefix=".ingest-", suffix=".part")
+        self.file = os.fdopen(fd, "w+b", buffering=INGEST_CHUNK_SIZE)
+        self.max_bytes = max_bytes
+        self.digest = hashlib.sha256()
+        self.size = 0
+        self.header = b""
+        self.container = None
+
+    def write(self, data):
+        self.size += len(data)
+        if self.max_bytes and self.size > self.max_bytes:
+            raise IngestError(f"Video exceeds the {_limit_mb(self.max_bytes)} limit", 413)
+
+        if self.container is None and len(self.header) < SNIFF_BYTES:
+            self.header += bytes(data[:SNIFF_BYTES - len(self.header)])
+            if len(self.header) >= SNIFF_BYTES:
+                self._sniff()
+
+        self.digest.update(data)
+        self.file.write(data)
+        return len(data)
+
+    def _sniff(self):
+        self.container = sniff_container(self.header)
+        if self.container is None:
+            raise IngestError("Unrecognized video container", 415)
+
+    # Werkzeug rewinds file parts once they are complete
+    def seek(self, offset, whence=0):
+        return self.file.seek(offset, whence)
+
+    def tell(self):
+        return self.file.tell()
+
+    def read(self, size=-1):
+        return self.file.read(size)
+
+    def finish(self, path):
+        """
+        Move the finished video to path
+
+        Returns:
+            Dict with path, size, sha256 and container
+        """
+        if self.size == 0:
+            raise IngestError("Empty video")
+        if self.container is None:
+            self._sniff()
+
+        self.file.close()
+        os.replace(self.temp_path, path)
+        return {"path": path, "size": self.size, "sha256": self.digest.hexdigest(), "container": self.container}
+
+    def close(self):
+        self.file.close()
+
+    def discard(self):
+        """Close and remove the partial file"""
+        self.file.close()
+        try:
+            os.remove(self.temp_path)
+        except FileNotFoundError:
+            pass
+
+class IngestRequest(Request):
+    """
+    Flask request that streams uploaded file parts straight into ingest_dir
+
+    Set ingest_dir before the form is first accessed; each file part is then
+    written by an IngestWriter instead of Werkzeug's spooled temporary file.
+    Parts with a blank filename (a file input left empty) carry no video and
+    keep the default stream, so they leave nothing behind in ingest_dir.
+    """
+
+    ingest_dir = None
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        if self.ingest_dir is None or not filename:
+            return super()._get_file_stream(total_content_length, content_type, filename, content_length)
+        return IngestWriter(self.ingest_dir)
+
+def url_filename(url):
+    """Video filename taken from a URL's last path segment"""
+    filename = url.split('/')[-1] or 'video.mp4'
+    if '?' in filename:
+        filename = filename.split('?')[0]
+    if not filename.endswith(VIDEO_EXTENSIONS):
+        filename += '.mp4'
+    return filename
+
+def ingest_url(url, directory, max_bytes=MAX_VIDEO_BYTES):
+    """
+    Download a video into directory through an IngestWriter
+
+    Returns:
+        Dict with path, size, sha256, container and filename
+    """
+    response = requests.get(url, stream=True, timeout=30)
+    with response:
+        response.raise_for_status()
+
+        # Refuse oversized videos before transferring anything when the server announces the size
+        announced = response.headers.get('Content-Length')
+        if max_bytes and announced and announced.isdigit() and int(announced) > max_bytes:
+            raise IngestError(f"Video exceeds the {_limit_mb(max_bytes)} limit", 413)
+
+        filename = url_filename(url)
+        writer = IngestWriter(directory, max_bytes)
+        try:
+            for chunk in response.iter_content(chunk_size=INGEST_CHUNK_SIZE):
+                if chunk:
+                    writer.write(chunk)
+            info = writer.finish(os.path.join(directory, filename))
+        except BaseException:
+            writer.discard()
+            raise
+
+    info["filename"] = filename
+    return info
+
+def is_streamable(container, read_at):
+    """
+    Whether ffmpeg can decode the container front to back from a pipe
+
+    MP4/MOV can only be streamed when the moov index precedes the media
+    data (faststart); read_at(offset, size) supplies the box headers.
+    """
+    if container not in ("mp4", "mov"):
+        return True
+
+    offset = 0
+    for _ in range(64):
+        header = read_at(offset, 16)
+        if len(header) < 8:
+            return False
+        size, box = struct.unpack(">I4s", header[:8])
+        if box == b'moov':
+            return True
+        if box == b'mdat':
+            return False
+        if size == 1 and len(header) == 16:
+            size = struct.unpack(">Q", header[8:16])[0]
+        if size < 8:
+            return False
+        offset += size
+    return False
+
+class _DownloadReader:
+    """Sequential reader over a RangeDownload that blocks until bytes arrive"""
+
+    def __init__(self, download):
+        self.download = download
+        self.position = 0
+
+    def read(self, size=-1):
+        data = self.download.read_at(self.position, size if size and size > 0 else INGEST_CHUNK_SIZE)
+        self.position += len(data)
+        return data
+
+class RangeDownload:
+    """
+    Parallel HTTP range download into a preallocated file that can be read while it fills
+
+    The file is split into fixed-size parts that a few connections fetch
+    lowest offset first, so the contiguous prefix from the start of the file
+    keeps growing and readers (scene detection) can follow it. A hashing
+    thread follows the same prefix so the SHA-256 is ready as soon as the
+    last byte lands. Failed parts are retried from where they stopped.
+    """
+
+    def __init__(self, url, path, size, connections=DOWNLOAD_CONNECTIONS, part_size=DOWNLOAD_PART_SIZE, progress_callback=None):
+        self.url = url
+        self.path = path
+        self.filename = os.path.basename(path)
+        self.size = size
+        self.progress_callback = progress_callback
+        # Smaller parts for small files so every connection gets work
+        part_size = max(DOWNLOAD_READ_SIZE, min(part_size, -(-size // (connections * 2))))
+        self.parts = [(start, min(start + part_size, size)) for start in range(0, size, part_size)]
+        self.written = [0] * len(self.parts)
+        self.next_part = 0
+        self.first_incomplete = 0
+        self.contiguous = 0
+        self.received = 0
+        self.container = None
+        self.streamable = False
+        self.sha256 = None
+        self.error = None
+        self.condition = threading.Condition()
+
+        self.fd = os.open(path, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o644)
+        os.ftruncate(self.fd, size)
+
+        self.workers = [
+            threading.Thread(target=self._fetch_parts, name=f"download-{i}", daemon=True)
+            for i in range(max(1, min(connections, len(self.parts))))
+        ]
+        for worker in self.workers:
+            worker.start()
+        threading.Thread(target=self._hash, name="download-hash", daemon=True).start()
+
+    def _fail(self, error):
+        with self.condition:
+            if self.error is None:
+                self.error = error
+            self.condition.notify_all()
+
+    def cancel(self):
+        """Stop fetching; readers and waiters get an IngestError"""
+        self._fail(IngestError("Download cancelled"))
+
+    def _fetch_parts(self):
+        while True:
+            with self.condition:
+                if self.error is not None or self.next_part >= len(self.parts):
+                    return
+                index = self.next_part
+                self.next_part += 1
+            try:
+                self._fetch_part(index)
+            except Exception as e:
+                self._fail(e)
+                return
+
+    def _fetch_part(self, index):
+        start, end = self.parts[index]
+        for attempt in range(DOWNLOAD_RETRIES + 1):
+            offset = start + self.written[index]
+            if offset >= end:
+                return
+            try:
+                with requests.get(self.url, headers={'Range': f"bytes={offset}-{end - 1}"}, stream=True, timeout=30) as response:
+                    response.raise_for_status()
+                    if response.status_code != 206:
+                        raise IngestError("Server stopped honouring range requests")
+                    for chunk in response.iter_content(chunk_size=DOWNLOAD_READ_SIZE):
+                        if self.error is not None:
+                            return
+                        chunk = chunk[:end - offset]
+                        os.pwrite(self.fd, chunk, offset)
+                        offset += len(chunk)
+                        self._advance(index, len(chunk))
+                if offset >= end:
+                    return
+                raise IngestError(f"Range {start}-{end - 1} ended early")
+            except (requests.RequestException, IngestError) as e:
+                if attempt == DOWNLOAD_RETRIES:
+                    raise
+                logger.info(f"⏳ Range {start}-{end - 1} failed ({e}), retry {attempt + 1}/{DOWNLOAD_RETRIES}")
+                time.sleep(2 ** attempt)
+
+    def _advance(self, index, count):
+        with self.condition:
+            self.written[index] += count
+            self.received += count
+            while self.first_incomplete < len(self.parts):
+                start, end = self.parts[self.first_incomplete]
+                if self.written[self.first_incomplete] < end - start:
+                    break
+                self.first_incomplete += 1
+            if self.first_incomplete < len(self.parts):
+                self.contiguous = self.parts[self.first_incomplete][0] + self.written[self.first_incomplete]
+            else:
+                self.contiguous = self.size
+            received = self.received
+            self.condition.notify_all()
+        if self.progress_callback:
+            self.progress_callback(received, self.size)
+
+    def _hash(self):
+        digest = hashlib.sha256()
+        try:
+            # Unbuffered: read-ahead would pick up the preallocated zeros past the prefix
+            with open(self.path, "rb", buffering=0) as f:
+                position = 0
+                while position < self.size:
+                    with self.condition:
+                        while self.contiguous <= position and self.error is None:
+                            self.condition.wait()
+                        if self.error is not None:
+                            return
+                        available = self.contiguous
+                    while position < available:
+                        data = f.read(min(INGEST_CHUNK_SIZE, available - position))
+                        digest.update(data)
+                        position += len(data)
+            with self.condition:
+                self.sha256 = digest.hexdigest()
+                self.condition.notify_all()
+        except OSError as e:
+            self._fail(e)
+        finally:
+            # Writers must be gone before the descriptor is closed (and its number reused)
+            for worker in self.workers:
+                worker.join()
+            os.close(self.fd)
+
+    def read_at(self, offset, size):
+        """Read up to size bytes at offset, blocking until at least one is downloaded; b'' at EOF"""
+        with self.condition:
+            while self.contiguous <= offset < self.size and self.error is None:
+                self.condition.wait()
+            if self.error is not None:
+                raise self.error
+            available = min(size, self.contiguous - offset)
+        if available <= 0:
+            return b""
+        with open(self.path, "rb", buffering=0) as f:
+            return os.pread(f.fileno(), available, offset)
+
+    def reader(self):
+        """New sequential file-like reader from the start of the video"""
+        return _DownloadReader(self)
+
+    def sniff(self):
+        """Identify the container from the first bytes and whether it can be decoded while downloading"""
+        header = b""
+        while len(header) < min(SNIFF_BYTES, self.size):
+            header += self.read_at(len(header), SNIFF_BYTES - len(header))
+        self.container = sniff_container(header)
+        if self.container is None:
+            raise IngestError("Unrecognized video container", 415)
+        self.streamable = is_streamable(self.container, self.read_at)
+
+    def wait(self):
+        """
+        Block until the download has finished
+
+        Returns:
+            Dict with path, size, sha256, container and filename
+        """
+        with self.condition:
+            while self.sha256 is None and self.error is None:
+                self.condition.wait()
+            if self.error is not None:
+                raise self.error
+        return {"path": self.path, "size": self.size, "sha256": self.sha256, "container": self.container, "filename": self.filename}
+
+def start_download(url, directory, max_bytes=MAX_VIDEO_BYTES, progress_callback=None):
+    """
+    Start a RangeDownload of url into directory
+
+    Returns:
+        The running RangeDownload, or None when the server does not support
+        range requests or does not report the size (use ingest_url instead)
+    """
+    with requests.get(url, headers={'Range': 'bytes=0-0'}, stream=True, timeout=30) as response:
+        response.raise_for_status()
+        total = response.headers.get('Content-Range', '').rpartition('/')[2]
+        if response.status_code != 206 or not total.isdigit():
+            return None
+
+    size = int(total)
+    if size == 0:
+        raise IngestError("Empty video")
+    if max_bytes and size > max_bytes:
+        raise IngestError(f"Video exceeds the {_limit_mb(max_bytes)} limit", 413)
+
+    os.makedirs(directory, exist_ok=True)
+    return RangeDownload(url, os.path.join(directory, url_filename(url)), size, progress_callback=progress_callback)
@@ -0,0 +1,115 @@
+import os
+import math
+import time
+import threading
+import logging
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+# Videos processed at the same time; each runs its own ffmpeg decodes
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", 2))
+# Jobs allowed to wait for a worker before /analyze starts refusing work
+JOB_QUEUE_SIZE = int(os.getenv("JOB_QUEUE_SIZE", 20))
+
+class QueueFullError(Exception):
+    """Raised when a job is submitted while the queue is at capacity"""
+
+    def __init__(self, queue_length, retry_after):
+        super().__init__(f"Job queue is full ({queue_length} waiting)")
+        self.queue_length = queue_length
+        self.retry_after = retry_after
+
+class JobScheduler:
+    """
+    Fixed pool of worker threads fed from a bounded FIFO queue
+
+    The heavy lifting happens in ffmpeg subprocesses and the shared describer
+    pool, so bounding the worker count bounds how many videos decode at once.
+    Job durations are tracked to estimate when queued jobs will start.
+    """
+
+    def __init__(self, handler, workers=JOB_WORKERS, max_queued=JOB_QUEUE_SIZE):
+        self.handler = handler
+        self.workers = max(1, workers)
+        self.max_queued = max_queued
+        self.queue = deque()
+        self.running = {}
+        self.done_events = {}
+        self.avg_duration = None
+        self.condition = threading.Condition()
+
+        for i in range(self.workers):
+            threading.Thread(target=self._work, name=f"job-worker-{i}", daemon=True).start()
+
+    def submit(self, job_id, *args):
+        """
+        Queue a job for the worker pool
+
+        Returns:
+            1-based queue position of the job
+
+        Raises:
+            QueueFullError: when max_queued jobs are already waiting
+        """
+        with self.condition:
+            if len(self.queue) >= self.max_queued:
+                raise QueueFullError(len(self.queue), self._eta_locked(len(self.queue) + 1) or 30)
+            self.queue.append((job_id, args))
+            self.done_events[job_id] = threading.Event()
+            self.condition.notify()
+            return len(self.queue)
+
+    def position(self, job_id):
+        """1-based position of a waiting job, or None if it is running or unknown"""
+        with self.condition:
+            for index, (queued_id, _) in enumerate(self.queue):
+                if queued_id == job_id:
+                    return index + 1
+        return None
+
+    def _eta_locked(self, position):
+        if self.avg_duration is None:
+            return None
+        # Jobs ahead are spread over all workers; a job starts once a full round ahead of it finishes
+        return math.ceil(position / self.workers) * self.avg_duration
+
+    def eta(self, job_id):
+        """Estimated seconds until a waiting job starts, or None if unknown"""
+        position = self.position(job_id)
+        if position is None:
+            return None
+        with self.condition:
+            eta = self._eta_locked(position)
+        return round(eta, 1) if eta is not None else None
+
+    def wait(self, job_id, timeout=None):
+        """Block until a submitted job has finished; returns False on timeout"""
+        event = self.done_events.get(job_id)
+        return event.wait(timeout) if event else True
+
+    def stats(self):
+        """Current queue depth, running job count and pool size"""
+        with self.condition:
+            return {"queued": len(self.queue), "running": len(self.running), "workers": self.workers}
+
+    def _work(self):
+        while True:
+            with self.condition:
+                while not self.queue:
+                    self.condition.wait()
+                job_id, args = self.queue.popleft()
+                self.running[job_id] = time.monotonic()
+
+            try:
+                self.handler(job_id, *args)
+            except Exception as e:
+                logger.error(f"❌ Job {job_id} crashed: {e}")
+            finally:
+                with self.condition:
+                    duration = time.monotonic() - self.running.pop(job_id)
+                    # Exponentially weighted so the estimate follows recent load
+                    self.avg_duration = duration if self.avg_duration is None else 0.8 * self.avg_duration + 0.2 * duration
+                    event = self.done_events.pop(job_id, None)
+                if event:
+                    event.set()
@@ -0,0 +1,238 @@
+import os
+import time
+import threading
+import contextvars
+from contextlib import contextmanager, ContextDecorator
+
+# Upper bounds (seconds) of the duration histogram buckets
+METRICS_BUCKETS = tuple(sorted(float(bound) for bound in os.getenv(
+    "METRICS_BUCKETS", "0.01,0.05,0.1,0.25,0.5,1,2.5,5,10,30,60,120,300").split(",")))
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+class _Metric:
+    """Named metric with a fixed set of label names, rendered in the Prometheus text format"""
+
+    kind = "untyped"
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self.values = {}
+        self.lock = threading.Lock()
+        REGISTRY.register(self)
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, "")) for name in self.labels)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self.lock:
+            values = sorted(self.values.items())
+        for key, value in values:
+            lines.append(f"{self.name}{_format_labels(self.labels, key)} {_format_value(value)}")
+        return lines
+
+class Counter(_Metric):
+    """Monotonically increasing count per label set"""
+
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+class Gauge(_Metric):
+    """Current value per label set, either set directly or read from a callback at scrape time"""
+
+    kind = "gauge"
+
+    def __init__(self, name, help_text, labels=(), function=None):
+        super().__init__(name, help_text, labels)
+        self.function = function
+
+    def set(self, value, **labels):
+        with self.lock:
+            self.values[self._key(labels)] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set_function(self, function):
+        """Read the (unlabelled) value from function() whenever metrics are rendered"""
+        self.function = function
+
+    def render(self):
+        if self.function is not None:
+            self.set(self.function())
+        return super().render()
+
+class Histogram(_Metric):
+    """Bucketed observations (cumulative buckets, sum and count) per label set"""
+
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labels=(), buckets=METRICS_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(buckets) + (float("inf"),)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self.lock:
+            counts, total = self.values.get(key, ([0] * len(self.buckets), 0.0))
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[index] += 1
+            self.values[key] = (counts, total + value)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self.lock:
+            values = sorted((key, (list(counts), total)) for key, (counts, total) in self.values.items())
+        for key, (counts, total) in values:
+            for bound, count in zip(self.buckets, counts):
+                lines.append(f"{self.name}_bucket{_format_labels(self.labels, key, [('le', _format_value(bound))])} {count}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {counts[-1]}")
+        return lines
+
+class Registry:
+    """All metrics of the process, rendered together for /metrics"""
+
+    def __init__(self):
+        self.metrics = []
+        self.lock = threading.Lock()
+
+    def register(self, metric):
+        with self.lock:
+            self.metrics.append(metric)
+
+    def render(self):
+        """Prometheus text exposition format (version 0.0.4)"""
+        with self.lock:
+            metrics = list(self.metrics)
+        return "\n".join(line for metric in metrics for line in metric.render()) + "\n"
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = Histogram("clipweaver_stage_duration_seconds", "Time spent in each processing stage", ("stage",))
+OPENAI_REQUESTS = Counter("clipweaver_openai_requests_total", "Azure OpenAI chat completion attempts by outcome", ("outcome",))
+OPENAI_TOKENS = Counter("clipweaver_openai_tokens_total", "Tokens used by Azure OpenAI calls", ("kind",))
+OPENAI_IN_FLIGHT = Gauge("clipweaver_openai_requests_in_flight", "Azure OpenAI calls currently waiting for a response")
+JOBS_FINISHED = Counter("clipweaver_jobs_total", "Analysis jobs finished, by final status", ("status",))
+JOB_SECONDS = Histogram("clipweaver_job_duration_seconds", "Wall time of analysis jobs from start to finish", ("status",))
+JOB_RETRIES = Counter("clipweaver_job_retries_total", "Broker jobs queued again after a failed attempt or a lost worker")
+JOBS_QUEUED = Gauge("clipweaver_jobs_queued", "Jobs waiting for a worker")
+JOBS_RUNNING = Gauge("clipweaver_jobs_in_flight", "Jobs currently being processed")
+OUTPUT_BYTES = Gauge("clipweaver_output_bytes", "Disk space used by request folders under OUTPUT_DIR at the last retention sweep")
+OUTPUT_EVICTIONS = Counter("clipweaver_output_evictions_total", "Request folders deleted by output retention, by reason", ("reason",))
+
+class JobTimings:
+    """
+    Stage spans and token usage of one job, as reported in its /status
+
+    Spans from every thread working for the job (job worker, segment
+    decoders, describer pool) are added here while the job's context is
+    active, so stage totals can exceed the job's wall time.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.stages = {}
+        self.calls = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+
+    def add_span(self, stage, seconds):
+        with self.lock:
+            stats = self.stages.setdefault(stage, {"count": 0, "seconds": 0.0, "max_seconds": 0.0})
+            stats["count"] += 1
+            stats["seconds"] += seconds
+            stats["max_seconds"] = max(stats["max_seconds"], seconds)
+
+    def add_usage(self, prompt_tokens, completion_tokens):
+        with self.lock:
+            self.calls += 1
+            self.prompt_tokens += prompt_tokens
+            self.completion_tokens += completion_tokens
+
+    def snapshot(self):
+        """JSON-ready copy: per-stage count/seconds/max_seconds and OpenAI call and token totals"""
+        with self.lock:
+            return {
+                "stages": {
+                    stage: {"count": stats["count"], "seconds": round(stats["seconds"], 3), "max_seconds": round(stats["max_seconds"], 3)}
+                    for stage, stats in self.stages.items()
+                },
+                "openai": {
+                    "calls": self.calls,
+                    "prompt_tokens": self.prompt_tokens,
+                    "completion_tokens": self.completion_tokens
+                }
+            }
+
+_current_job = contextvars.ContextVar("job_timings", default=None)
+
+@contextmanager
+def track_job():
+    """Collect spans recorded in this context (and contexts copied from it) into a new JobTimings"""
+    timings = JobTimings()
+    token = _current_job.set(timings)
+    try:
+        yield timings
+    finally:
+        _current_job.reset(token)
+
+def submit_in_context(executor, function, *args):
+    """executor.submit that runs function in a copy of the caller's context, so its spans count for the same job"""
+    return executor.submit(contextvars.copy_context().run, function, *args)
+
+class timed(ContextDecorator):
+    """Context manager/decorator that records its duration as a span of the given stage"""
+
+    def __init__(self, stage):
+        self.stage = stage
+        self.started = None
+
+    def _recreate_cm(self):
+        # A fresh instance per decorated call, so concurrent calls don't share a start time
+        return timed(self.stage)
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        seconds = time.perf_counter() - self.started
+        STAGE_SECONDS.observe(seconds, stage=self.stage)
+        timings = _current_job.get()
+        if timings is not None:
+            timings.add_span(self.stage, seconds)
+        return False
+
+def record_usage(usage):
+    """Count the token usage of a chat completion response (usage may be None)"""
+    prompt_tokens = getattr(usage, "prompt_tokens", 0) or 0
+    completion_tokens = getattr(usage, "completion_tokens", 0) or 0
+    OPENAI_TOKENS.inc(prompt_tokens, kind="prompt")
+    OPENAI_TOKENS.inc(completion_tokens, kind="completion")
+    timings = _current_job.get()
+    if timings is not None:
+        timings.add_usage(prompt_tokens, completion_tokens)
@@ -0,0 +1,211 @@
+import os
+import subprocess
+import threading
+import logging
+import numpy as np
+from analyzer import (
+    _empty_probe, _parse_input_header, _feed_stdin, _finish_detection, _hms_to_seconds,
+    _STATS_TIME_RE, InputStreamError, list_keyframes
+)
+
+logger = logging.getLogger(__name__)
+
+# Size frames are decoded to for scoring; aspect ratio does not matter for change detection
+NUMPY_DETECT_WIDTH = int(os.getenv("NUMPY_DETECT_WIDTH", 160))
+NUMPY_DETECT_HEIGHT = int(os.getenv("NUMPY_DETECT_HEIGHT", 90))
+# gray or rgb24
+NUMPY_DETECT_PIXEL_FORMAT = os.getenv("NUMPY_DETECT_PIXEL_FORMAT", "gray")
+# Score every Nth frame (1 = every frame); keyframes_only scores just the keyframes of local files
+NUMPY_DETECT_STRIDE = int(os.getenv("NUMPY_DETECT_STRIDE", 1))
+NUMPY_DETECT_KEYFRAMES_ONLY = os.getenv("NUMPY_DETECT_KEYFRAMES_ONLY", "false").lower() == "true"
+# Frames scored per vectorized batch
+NUMPY_DETECT_BATCH = int(os.getenv("NUMPY_DETECT_BATCH", 256))
+
+HIST_BINS = 32
+
+def _histograms(frames):
+    """Normalised HIST_BINS-bin histograms per frame (channels pooled), shape (batch, HIST_BINS)"""
+    count = len(frames)
+    flat = frames.reshape(count, -1)
+    bins = (flat >> 3).astype(np.int64)  # 256 levels / HIST_BINS
+    bins += (np.arange(count, dtype=np.int64) * HIST_BINS)[:, None]
+    hist = np.bincount(bins.ravel(), minlength=count * HIST_BINS).reshape(count, HIST_BINS)
+    return hist / flat.shape[1]
+
+class FrameScorer:
+    """
+    Vectorized scene-change scores for batches of consecutive frames
+
+    The pixel term follows ffmpeg's scene filter: the mean absolute
+    difference to the previous frame (mafd) as a fraction of the 0-255
+    range, damped by how much it changed from the previous mafd so steady
+    motion does not look like a cut. The histogram term is half the L1 distance between the
+    frames' intensity histograms (0-1). The score averages both, so a cut
+    needs a change in content and in tonal distribution, and thresholds
+    stay on the same 0-1 scale as the ffmpeg detector.
+    """
+
+    def __init__(self):
+        self.previous = None
+        self.previous_hist = None
+        self.previous_mafd = 0.0
+
+    def score(self, frames):
+        """Scores for a (batch, height, width[, channels]) uint8 array, continuing from the last batch"""
+        frames = frames.astype(np.int16)
+        hist = _histograms(frames)
+
+        if self.previous is None:
+            stacked, stacked_hist = frames, hist
+        else:
+            stacked = np.concatenate([self.previous[None], frames])
+            stacked_hist = np.concatenate([self.previous_hist[None], hist])
+
+        axes = tuple(range(1, stacked.ndim))
+        mafd = np.abs(np.diff(stacked, axis=0)).mean(axis=axes) / 255.0
+        hist_distance = 0.5 * np.abs(np.diff(stacked_hist, axis=0)).sum(axis=1)
+        if self.previous is None:
+            # The very first frame has nothing to compare against
+            mafd = np.concatenate([[0.0], mafd])
+            hist_distance = np.concatenate([[0.0], hist_distance])
+
+        mafd_change = np.abs(np.diff(np.concatenate([[self.previous_mafd], mafd])))
+        pixel = np.clip(np.minimum(mafd, mafd_change), 0.0, 1.0)
+
+        self.previous = frames[-1]
+        self.previous_hist = hist[-1]
+        self.previous_mafd = float(mafd[-1])
+        return (pixel + hist_distance) / 2
+
+def score_settings(source=None):
+    """Decode and sampling settings that change the scores (keyframes_only only applies to local files)"""
+    settings = {"width": NUMPY_DETECT_WIDTH, "height": NUMPY_DETECT_HEIGHT, "pixel_format": NUMPY_DETECT_PIXEL_FORMAT}
+    if NUMPY_DETECT_KEYFRAMES_ONLY and source is None:
+        settings["keyframes_only"] = True
+    else:
+        settings["stride"] = max(1, NUMPY_DETECT_STRIDE)
+    return settings
+
+def score_video(video_path, progress_callback=None, source=None, stride=NUMPY_DETECT_STRIDE,
+                keyframes_only=NUMPY_DETECT_KEYFRAMES_ONLY):
+    """
+    Decode downscaled raw frames from ffmpeg and score them with NumPy
+
+    Returns:
+        (probe, times, scores) with times and scores as float arrays
+    """
+    keyframes_only = keyframes_only and source is None
+    channels = 3 if NUMPY_DETECT_PIXEL_FORMAT == "rgb24" else 1
+    frame_size = NUMPY_DETECT_WIDTH * NUMPY_DETECT_HEIGHT * channels
+    shape = (NUMPY_DETECT_HEIGHT, NUMPY_DETECT_WIDTH, channels) if channels > 1 else (NUMPY_DETECT_HEIGHT, NUMPY_DETECT_WIDTH)
+
+    scale = f"scale={NUMPY_DETECT_WIDTH}:{NUMPY_DETECT_HEIGHT}:flags=fast_bilinear,format={NUMPY_DETECT_PIXEL_FORMAT}"
+    cmd = ["ffmpeg", "-hide_banner", "-nostdin", "-stats_period", "0.5", "-skip_loop_filter", "all"]
+    if keyframes_only:
+        cmd += ["-skip_frame", "nokey", "-i", video_path, "-vf", scale, "-fps_mode", "passthrough"]
+    else:
+        # Constant-rate sampling so frame n is at n * stride / fps
+        cmd += ["-i", "pipe:0" if source else video_path, "-vf", f"fps=source_fps/{max(1, stride)},{scale}"]
+    cmd += ["-map", "0:v:0", "-an", "-f", "rawvideo", "-"]
+    logger.info(f"🔧 FFmpeg command: {' '.join(cmd)}")
+
+    probe = _empty_probe()
+    last_reported = [-1]
+    tail = []
+
+    def read_stderr(stream):
+        in_input_header = True
+        for line in stream:
+            line = line.rstrip()
+            if not line:
+                continue
+            tail[:] = (tail + [line])[-5:]
+            if in_input_header:
+                if line.startswith(('Stream mapping:', 'Output #')):
+                    in_input_header = False
+                else:
+                    _parse_input_header(line, probe)
+            elif progress_callback and probe['duration'] and (match := _STATS_TIME_RE.search(line)):
+                seconds = _hms_to_seconds(match)
+                if int(seconds / probe['duration'] * 100) > last_reported[0]:
+                    last_reported[0] = int(seconds / probe['duration'] * 100)
+                    progress_callback(min(seconds / probe['duration'], 1.0), probe)
+
+    process = subprocess.Popen(cmd, stdin=subprocess.PIPE if source else subprocess.DEVNULL, stdout=subprocess.PIPE,
+                               stderr=subprocess.PIPE)
+    stderr_reader = threading.Thread(target=read_stderr, args=(_text_lines(process.stderr),), daemon=True)
+    stderr_reader.start()
+    feed_errors = []
+    if source:
+        feeder = threading.Thread(target=_feed_stdin, args=(source, process.stdin, feed_errors), daemon=True)
+        feeder.start()
+
+    scorer = FrameScorer()
+    batches = []
+    batch_bytes = frame_size * NUMPY_DETECT_BATCH
+    try:
+        while True:
+            data = _read_full(process.stdout, batch_bytes)
+            usable = len(data) - len(data) % frame_size
+            if usable:
+                frames = np.frombuffer(data[:usable], dtype=np.uint8).reshape((-1,) + shape)
+                batches.append(scorer.score(frames))
+            if len(data) < batch_bytes:
+                break
+    except BaseException:
+        process.kill()
+        process.wait()
+        raise
+
+    returncode = process.wait()
+    stderr_reader.join()
+    if source:
+        feeder.join()
+        if feed_errors:
+            raise InputStreamError(f"Video stream failed during scene detection: {feed_errors[0]}")
+    if returncode != 0:
+        raise RuntimeError(f"ffmpeg frame decode exited with {returncode}: {' | '.join(tail)}")
+
+    scores = np.concatenate(batches) if batches else np.zeros(0)
+    if keyframes_only:
+        times = np.asarray(list_keyframes(video_path))
+        count = min(len(times), len(scores))
+        times, scores = times[:count], scores[:count]
+    else:
+        fps = probe['fps'] or 25.0
+        times = np.arange(len(scores)) * max(1, stride) / fps
+    return probe, times, scores
+
+def _text_lines(stream):
+    """Decode ffmpeg's stderr into lines, splitting \\r-terminated stats updates too"""
+    buffer = b""
+    while chunk := stream.read1(65536):
+        buffer += chunk
+        *lines, buffer = buffer.replace(b'\r', b'\n').split(b'\n')
+        for line in lines:
+            yield line.decode('utf-8', 'replace')
+    if buffer:
+        yield buffer.decode('utf-8', 'replace')
+
+def _read_full(stream, size):
+    """Read exactly size bytes unless the stream ends first"""
+    chunks = []
+    remaining = size
+    while remaining:
+        chunk = stream.read(remaining)
+        if not chunk:
+            break
+        chunks.append(chunk)
+        remaining -= len(chunk)
+    return b"".join(chunks)
+
+def detect_scene_changes(video_path, progress_callback=None, source=None):
+    """
+    Scene-change scores from downscaled frames, with the same result shape as analyzer.detect_scene_changes
+
+    Returns:
+        Dict with duration, stream metadata and a list of (pts_time, score) for every scored frame
+    """
+    probe, times, scores = score_video(video_path, progress_callback, source)
+    logger.info(f"🧮 Scored {len(scores)} frames at {NUMPY_DETECT_WIDTH}x{NUMPY_DETECT_HEIGHT}")
+    return _finish_detection(video_path, probe, list(zip(times.tolist(), scores.tolist())), progress_callback)
@@ -0,0 +1,185 @@
+import os
+import sys
+import json
+import mmap
+import time
+import shutil
+import threading
+import logging
+from array import array
+from cache import _link_or_copy
+
+logger = logging.getLogger(__name__)
+
+# Bump when the stored layout or the meaning of stored scores changes
+INDEX_VERSION = 2
+
+SCORE_INDEX_DIR = os.getenv("SCORE_INDEX_DIR", os.path.join("cache", "index"))
+SCORE_INDEX_MAX_BYTES = int(os.getenv("SCORE_INDEX_MAX_BYTES", 5 * 1024 ** 3))
+SCORE_INDEX_MAX_AGE = int(os.getenv("SCORE_INDEX_MAX_AGE", 30 * 24 * 3600))
+
+def _write_atomic(path, write):
+    """Write a file through a temporary name so readers never see it half written"""
+    temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(temp_path, "wb") as f:
+        write(f)
+    os.replace(temp_path, path)
+
+class VideoIndex:
+    """
+    What has already been computed for one video, keyed by its content hash
+
+    Per-frame scene scores are stored per detector as a flat array of
+    native float64 (pts_time, score) pairs that is memory-mapped on load
+    (numpy.memmap can read it as well), with the probe metadata in a JSON
+    sidecar. Extracted frames are kept by timestamp (milliseconds) with
+    their PNG, perceptual hash and model view, so re-analysing with other
+    parameters only decodes frames at timestamps not seen before.
+    """
+
+    def __init__(self, directory):
+        self.dir = directory
+        self.frames_dir = os.path.join(directory, "frames")
+        os.makedirs(self.frames_dir, exist_ok=True)
+
+    def _scores_paths(self, detector):
+        return (os.path.join(self.dir, f"scores-{detector}.f64"), os.path.join(self.dir, f"scores-{detector}.json"))
+
+    def load_scores(self, detector, settings):
+        """
+        Stored detection dict (probe fields and scores) for a detector, or None
+
+        Scores computed with other detector settings (see
+        analyzer.scene_detector_settings) count as missing.
+        """
+        data_path, meta_path = self._scores_paths(detector)
+        try:
+            with open(meta_path) as f:
+                meta = json.load(f)
+            if meta.get("version") != INDEX_VERSION or meta.get("byteorder") != sys.byteorder:
+                return None
+            if meta.get("settings") != settings:
+                return None
+            with open(data_path, "rb") as f:
+                if meta["frames"] == 0:
+                    return {**meta["probe"], 'scores': []}
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                    values = memoryview(mapped).cast('d')
+                    try:
+                        if len(values) != 2 * meta["frames"]:
+                            return None
+                        scores = list(zip(values[0::2].tolist(), values[1::2].tolist()))
+                    finally:
+                        values.release()
+        except (OSError, ValueError, KeyError):
+            return None
+
+        os.utime(self.dir)
+        return {**meta["probe"], 'scores': scores}
+
+    def save_scores(self, detector, detection, settings):
+        """Store a detection dict's scores and probe fields, with the detector settings they were computed with"""
+        data_path, meta_path = self._scores_paths(detector)
+        values = array('d', (value for pair in detection['scores'] for value in pair))
+        probe = {key: value for key, value in detection.items() if key != 'scores'}
+        try:
+            _write_atomic(data_path, values.tofile)
+            # The sidecar goes last: its presence marks the pair as complete
+            meta = {"version": INDEX_VERSION, "byteorder": sys.byteorder, "frames": len(detection['scores']), "probe": probe,
+                    "settings": settings}
+            _write_atomic(meta_path, lambda f: f.write(json.dumps(meta).encode()))
+        except OSError as e:
+            logger.error(f"❌ Could not store frame scores in {self.dir}: {e}")
+
+    def _frame_base(self, timestamp):
+        return os.path.join(self.frames_dir, f"{round(timestamp * 1000):010d}")
+
+    def load_frame(self, timestamp, path, view_key):
+        """
+        Materialise a stored frame at path
+
+        Returns:
+            Dict with phash and model_image (None when it was made with other
+            model view settings), or None if the frame is not stored
+        """
+        base = self._frame_base(timestamp)
+        try:
+            with open(f"{base}.json") as f:
+                meta = json.load(f)
+            if os.path.exists(path):
+                os.remove(path)
+            _link_or_copy(f"{base}.png", path)
+            model_image = None
+            if meta.get("view_key") == view_key and meta.get("mime"):
+                with open(f"{base}.view", "rb") as f:
+                    model_image = {'data': f.read(), 'mime': meta["mime"]}
+        except (OSError, ValueError):
+            return None
+        return {'phash': meta.get("phash"), 'model_image': model_image}
+
+    def add_frame(self, timestamp, path, info, view_key):
+        """Store an extracted frame (PNG at path plus its phash/model view info)"""
+        base = self._frame_base(timestamp)
+        if os.path.exists(f"{base}.json"):
+            return
+        try:
+            if os.path.exists(f"{base}.png"):
+                os.remove(f"{base}.png")
+            _link_or_copy(path, f"{base}.png")
+            model_image = info.get('model_image')
+            if model_image:
+                _write_atomic(f"{base}.view", lambda f: f.write(model_image['data']))
+            meta = {
+                "phash": info.get('phash'),
+                "mime": model_image['mime'] if model_image else None,
+                "view_key": view_key
+            }
+            _write_atomic(f"{base}.json", lambda f: f.write(json.dumps(meta).encode()))
+        except OSError as e:
+            logger.error(f"❌ Could not store frame {timestamp:.3f}s in {self.dir}: {e}")
+
+class ScoreIndex:
+    """Directory of VideoIndex entries, evicted by age and total size (least recently used first)"""
+
+    def __init__(self, root=SCORE_INDEX_DIR, max_bytes=SCORE_INDEX_MAX_BYTES, max_age=SCORE_INDEX_MAX_AGE):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.lock = threading.Lock()
+        self.last_eviction = 0.0
+        os.makedirs(self.root, exist_ok=True)
+
+    def open(self, video_hash):
+        """VideoIndex for a video's content hash, created on first use"""
+        # New entries add data; sweep at most once a minute
+        if time.time() - self.last_eviction > 60:
+            self.last_eviction = time.time()
+            self.evict()
+        return VideoIndex(os.path.join(self.root, video_hash))
+
+    def evict(self):
+        """Drop entries unused for max_age, then the least recently used until under max_bytes"""
+        with self.lock:
+            now = time.time()
+            entries = []
+            for entry in os.scandir(self.root):
+                if not entry.is_dir():
+                    continue
+                size = 0
+                for dirpath, _, filenames in os.walk(entry.path):
+                    for filename in filenames:
+                        try:
+                            size += os.stat(os.path.join(dirpath, filename)).st_size
+                        except OSError:
+                            pass
+                # Directory mtime is bumped whenever an entry's scores are reused
+                entries.append((entry.stat().st_mtime, size, entry.path))
+
+            entries.sort()
+            total = sum(size for _, size, _ in entries)
+            for last_used, size, path in entries:
+                if now - last_used <= self.max_age and total <= self.max_bytes:
+                    continue
+                shutil.rmtree(path, ignore_errors=True)
+                total -= size
+                logger.info(f"🧹 Evicted frame index {os.path.basename(path)[:12]}")
@@ -0,0 +1,524 @@
+import os
+import json
+import time
+import zlib
+import sqlite3
+import threading
+import logging
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+# Backend for job status/logs/results: sqlite (default, shared by all workers on the host), redis (shared across nodes) or memory
+JOB_STORE = os.getenv("JOB_STORE", "sqlite")
+JOB_STORE_PATH = os.getenv("JOB_STORE_PATH", os.path.join("data", "jobs.db"))
+JOB_STORE_REDIS_URL = os.getenv("JOB_STORE_REDIS_URL", os.getenv("REDIS_URL", "redis://localhost:6379/0"))
+# Jobs untouched for this many seconds are evicted with their logs and results
+JOB_TTL = int(os.getenv("JOB_TTL", 24 * 3600))
+# Log lines kept per job (oldest dropped first)
+JOB_LOG_LIMIT = int(os.getenv("JOB_LOG_LIMIT", 200))
+# Minimum seconds between eviction sweeps
+EVICTION_INTERVAL = 60
+
+# Status fields with their own columns; anything else lives in the JSON info column
+_COLUMNS = ("status", "progress", "error")
+
+class _Signal:
+    """Change counter for one job that stream readers block on"""
+
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.version = 0
+        self.watchers = 0
+
+class _Watch:
+    """A reader's view of a job's change counter"""
+
+    def __init__(self, signal):
+        self.signal = signal
+        self.version = signal.version
+
+    def wait(self, timeout):
+        """Block until the job changes or timeout passes; returns True if it changed"""
+        with self.signal.condition:
+            if self.signal.version == self.version:
+                self.signal.condition.wait(timeout)
+            changed = self.signal.version != self.version
+            self.version = self.signal.version
+        return changed
+
+class JobStore(ABC):
+    """
+    Storage for per-job status, capped logs, events and results
+
+    Status is a flat dict (status, progress, error and free-form extras such
+    as cache or video). The result is stored separately and only loaded when
+    asked for. Events are an append-only, numbered list per job (e.g. each
+    described scene) that stream readers replay from any point.
+
+    Writers in this process wake readers blocked in watch(); changes made by
+    other processes sharing the store are seen when the reader's wait times out.
+    """
+
+    def __init__(self, ttl=JOB_TTL, log_limit=JOB_LOG_LIMIT):
+        self.ttl = ttl
+        self.log_limit = log_limit
+        self.last_eviction = 0.0
+        self.signals = {}
+        self.signals_lock = threading.Lock()
+        self.listeners = []
+
+    @abstractmethod
+    def create(self, request_id, status="queued"):
+        """Register a new job, evicting expired ones now and then"""
+
+    @abstractmethod
+    def update(self, request_id, **fields):
+        """Merge fields into a job's status; a 'result' field is stored compactly on its own"""
+
+    @abstractmethod
+    def get(self, request_id, include_result=False):
+        """Status dict for a job (with 'result' when requested and present), or None"""
+
+    @abstractmethod
+    def delete(self, request_id):
+        """Remove a job with its logs, events and result"""
+
+    @abstractmethod
+    def append_log(self, request_id, entry):
+        """Add a log entry, dropping the oldest beyond log_limit; like any write it keeps the job from expiring"""
+
+    @abstractmethod
+    def get_logs(self, request_id, limit=10):
+        """Return (most recent `limit` log entries, total number of entries ever logged)"""
+
+    @abstractmethod
+    def append_event(self, request_id, event, data):
+        """Record an event (type name and JSON-serialisable data) for a job"""
+
+    @abstractmethod
+    def get_events(self, request_id, after=0):
+        """Events with an id greater than after, oldest first, as dicts with id, event and data"""
+
+    @abstractmethod
+    def evict_expired(self):
+        """Remove jobs not updated within ttl; returns the number removed"""
+
+    @contextmanager
+    def watch(self, request_id):
+        """Yield a watch whose wait(timeout) returns early when the job is updated in this process"""
+        with self.signals_lock:
+            signal = self.signals.setdefault(request_id, _Signal())
+            signal.watchers += 1
+        try:
+            yield _Watch(signal)
+        finally:
+            with self.signals_lock:
+                signal.watchers -= 1
+                if not signal.watchers:
+                    self.signals.pop(request_id, None)
+
+    def add_listener(self, callback):
+        """Call callback(request_id) after every change made in this process, on the thread that made it"""
+        self.listeners.append(callback)
+
+    def _notify(self, request_id):
+        with self.signals_lock:
+            signal = self.signals.get(request_id)
+        if signal is not None:
+            with signal.condition:
+                signal.version += 1
+                signal.condition.notify_all()
+        for listener in self.listeners:
+            listener(request_id)
+
+    def _maybe_evict(self):
+        now = time.time()
+        if now - self.last_eviction >= EVICTION_INTERVAL:
+            self.last_eviction = now
+            removed = self.evict_expired()
+            if removed:
+                logger.info(f"🧹 Evicted {removed} expired jobs")
+
+class MemoryJobStore(JobStore):
+    """Process-local store; state is lost on restart and not shared between workers"""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.jobs = {}
+        self.lock = threading.Lock()
+
+    def create(self, request_id, status="queued"):
+        self._maybe_evict()
+        with self.lock:
+            self.jobs[request_id] = {
+                "status": {"status": status, "progress": 0},
+                "result": None,
+                "logs": deque(maxlen=self.log_limit),
+                "total_logs": 0,
+                "events": [],
+                "updated_at": time.time()
+            }
+
+    def update(self, request_id, **fields):
+        with self.lock:
+            job = self.jobs.get(request_id)
+            if job is None:
+                return
+            if "result" in fields:
+                job["result"] = zlib.compress(json.dumps(fields.pop("result")).encode())
+            job["status"].update(fields)
+            job["updated_at"] = time.time()
+        self._notify(request_id)
+
+    def get(self, request_id, include_result=False):
+        with self.lock:
+            job = self.jobs.get(request_id)
+            if job is None:
+                return None
+            status = dict(job["status"])
+            if include_result and job["result"] is not None:
+                status["result"] = json.loads(zlib.decompress(job["result"]))
+            return status
+
+    def delete(self, request_id):
+        with self.lock:
+            self.jobs.pop(request_id, None)
+        self._notify(request_id)
+
+    def append_log(self, request_id, entry):
+        with self.lock:
+            job = self.jobs.get(request_id)
+            if job is not None:
+                job["logs"].append(entry)
+                job["total_logs"] += 1
+                job["updated_at"] = time.time()
+
+    def get_logs(self, request_id, limit=10):
+        with self.lock:
+            job = self.jobs.get(request_id)
+            if job is None:
+                return [], 0
+            return list(job["logs"])[-limit:], job["total_logs"]
+
+    def append_event(self, request_id, event, data):
+        with self.lock:
+            job = self.jobs.get(request_id)
+            if job is None:
+                return
+            job["events"].append({"id": len(job["events"]) + 1, "event": event, "data": data})
+            job["updated_at"] = time.time()
+        self._notify(request_id)
+
+    def get_events(self, request_id, after=0):
+        with self.lock:
+            job = self.jobs.get(request_id)
+            return list(job["events"][after:]) if job is not None else []
+
+    def evict_expired(self):
+        cutoff = time.time() - self.ttl
+        with self.lock:
+            expired = [request_id for request_id, job in self.jobs.items() if job["updated_at"] < cutoff]
+            for request_id in expired:
+                del self.jobs[request_id]
+        return len(expired)
+
+class SQLiteJobStore(JobStore):
+    """
+    SQLite-backed store, safe to share between processes on one host
+
+    Jobs are indexed by request_id, logs by (request_id, seq) so the ring
+    buffer trim is a single range delete, and results are zlib-compressed
+    JSON blobs.
+    """
+
+    def __init__(self, path=JOB_STORE_PATH, **kwargs):
+        super().__init__(**kwargs)
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False, timeout=30, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                request_id TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                progress INTEGER NOT NULL DEFAULT 0,
+                error TEXT,
+                info TEXT NOT NULL DEFAULT '{}',
+                result BLOB,
+                log_count INTEGER NOT NULL DEFAULT 0,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS jobs_updated_at ON jobs (updated_at);
+            CREATE TABLE IF NOT EXISTS logs (
+                request_id TEXT NOT NULL,
+                seq INTEGER NOT NULL,
+                timestamp TEXT NOT NULL,
+                level TEXT NOT NULL,
+                message TEXT NOT NULL,
+                PRIMARY KEY (request_id, seq)
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS events (
+                request_id TEXT NOT NULL,
+                seq INTEGER NOT NULL,
+                event TEXT NOT NULL,
+                data TEXT NOT NULL,
+                PRIMARY KEY (request_id, seq)
+            ) WITHOUT ROWID;
+        """)
+
+    def create(self, request_id, status="queued"):
+        self._maybe_evict()
+        now = time.time()
+        with self.lock:
+            self.db.execute(
+                "INSERT OR REPLACE INTO jobs (request_id, status, created_at, updated_at) VALUES (?, ?, ?, ?)",
+                (request_id, status, now, now)
+            )
+
+    def update(self, request_id, **fields):
+        assignments = []
+        values = []
+        if "result" in fields:
+            assignments.append("result = ?")
+            values.append(zlib.compress(json.dumps(fields.pop("result")).encode()))
+        for column in _COLUMNS:
+            if column in fields:
+                assignments.append(f"{column} = ?")
+                values.append(fields.pop(column))
+
+        with self.lock:
+            if fields:
+                # Extra fields are merged into the JSON info column inside the same transaction
+                self.db.execute("BEGIN IMMEDIATE")
+                try:
+                    row = self.db.execute("SELECT info FROM jobs WHERE request_id = ?", (request_id,)).fetchone()
+                    if row is None:
+                        self.db.execute("ROLLBACK")
+                        return
+                    info = json.loads(row[0])
+                    info.update(fields)
+                    self._update_row(request_id, assignments + ["info = ?"], values + [json.dumps(info)])
+                    self.db.execute("COMMIT")
+                except Exception:
+                    self.db.execute("ROLLBACK")
+                    raise
+            else:
+                self._update_row(request_id, assignments, values)
+        self._notify(request_id)
+
+    def _update_row(self, request_id, assignments, values):
+        self.db.execute(
+            f"UPDATE jobs SET {', '.join(assignments + ['updated_at = ?'])} WHERE request_id = ?",
+            values + [time.time(), request_id]
+        )
+
+    def get(self, request_id, include_result=False):
+        with self.lock:
+            row = self.db.execute(
+                f"SELECT status, progress, error, info{', result' if include_result else ''} FROM jobs WHERE request_id = ?",
+                (request_id,)
+            ).fetchone()
+        if row is None:
+            return None
+
+        status = {"status": row[0], "progress": row[1]}
+        if row[2] is not None:
+            status["error"] = row[2]
+        status.update(json.loads(row[3]))
+        if include_result and row[4] is not None:
+            status["result"] = json.loads(zlib.decompress(row[4]))
+        return status
+
+    def delete(self, request_id):
+        with self.lock:
+            self.db.execute("DELETE FROM jobs WHERE request_id = ?", (request_id,))
+            self.db.execute("DELETE FROM logs WHERE request_id = ?", (request_id,))
+            self.db.execute("DELETE FROM events WHERE request_id = ?", (request_id,))
+        self._notify(request_id)
+
+    def append_log(self, request_id, entry):
+        with self.lock:
+            self.db.execute("BEGIN IMMEDIATE")
+            try:
+                row = self.db.execute(
+                    "UPDATE jobs SET log_count = log_count + 1, updated_at = ? WHERE request_id = ? RETURNING log_count",
+                    (time.time(), request_id)
+                ).fetchone()
+                if row is not None:
+                    seq = row[0]
+                    self.db.execute(
+                        "INSERT INTO logs (request_id, seq, timestamp, level, message) VALUES (?, ?, ?, ?, ?)",
+                        (request_id, seq, entry["timestamp"], entry["level"], entry["message"])
+                    )
+                    self.db.execute("DELETE FROM logs WHERE request_id = ? AND seq <= ?", (request_id, seq - self.log_limit))
+                self.db.execute("COMMIT")
+            except Exception:
+                self.db.execute("ROLLBACK")
+                raise
+
+    def get_logs(self, request_id, limit=10):
+        with self.lock:
+            total = self.db.execute("SELECT log_count FROM jobs WHERE request_id = ?", (request_id,)).fetchone()
+            rows = self.db.execute(
+                "SELECT timestamp, level, message FROM logs WHERE request_id = ? ORDER BY seq DESC LIMIT ?",
+                (request_id, limit)
+            ).fetchall()
+        logs = [{"timestamp": timestamp, "level": level, "message": message} for timestamp, level, message in reversed(rows)]
+        return logs, total[0] if total else 0
+
+    def append_event(self, request_id, event, data):
+        with self.lock:
+            self.db.execute("BEGIN IMMEDIATE")
+            try:
+                if self.db.execute("UPDATE jobs SET updated_at = ? WHERE request_id = ?", (time.time(), request_id)).rowcount:
+                    self.db.execute(
+                        "INSERT INTO events (request_id, seq, event, data) "
+                        "SELECT ?, COALESCE(MAX(seq), 0) + 1, ?, ? FROM events WHERE request_id = ?",
+                        (request_id, event, json.dumps(data), request_id)
+                    )
+                self.db.execute("COMMIT")
+            except Exception:
+                self.db.execute("ROLLBACK")
+                raise
+        self._notify(request_id)
+
+    def get_events(self, request_id, after=0):
+        with self.lock:
+            rows = self.db.execute(
+                "SELECT seq, event, data FROM events WHERE request_id = ? AND seq > ? ORDER BY seq", (request_id, after)
+            ).fetchall()
+        return [{"id": seq, "event": event, "data": json.loads(data)} for seq, event, data in rows]
+
+    def evict_expired(self):
+        cutoff = time.time() - self.ttl
+        with self.lock:
+            self.db.execute("BEGIN IMMEDIATE")
+            try:
+                for table in ("logs", "events"):
+                    self.db.execute(
+                        f"DELETE FROM {table} WHERE request_id IN (SELECT request_id FROM jobs WHERE updated_at < ?)", (cutoff,)
+                    )
+                removed = self.db.execute("DELETE FROM jobs WHERE updated_at < ?", (cutoff,)).rowcount
+                self.db.execute("COMMIT")
+            except Exception:
+                self.db.execute("ROLLBACK")
+                raise
+        return removed
+
+class RedisJobStore(JobStore):
+    """
+    Store on a Redis-compatible server, shared by the API tier and workers on any node
+
+    Each job is a status hash (JSON-encoded field values), a compressed
+    result, a capped log list with a running count and an event list whose
+    length numbers the events. Every write refreshes the keys' expiry, so
+    Redis evicts jobs after ttl on its own.
+    """
+
+    def __init__(self, url=JOB_STORE_REDIS_URL, prefix="clipweaver:", **kwargs):
+        super().__init__(**kwargs)
+        # Imported on first use so redis stays optional for the sqlite and memory stores
+        import redis
+        self.redis = redis.Redis.from_url(url)
+        self.prefix = prefix
+
+    def _keys(self, request_id):
+        return {name: f"{self.prefix}{name}:{request_id}" for name in ("status", "result", "logs", "log_count", "events")}
+
+    def _touch(self, pipe, keys):
+        for key in keys.values():
+            pipe.expire(key, self.ttl)
+
+    def create(self, request_id, status="queued"):
+        keys = self._keys(request_id)
+        with self.redis.pipeline() as pipe:
+            pipe.delete(*keys.values())
+            pipe.hset(keys["status"], mapping={"status": json.dumps(status), "progress": json.dumps(0)})
+            pipe.set(keys["log_count"], 0)
+            self._touch(pipe, keys)
+            pipe.execute()
+
+    def update(self, request_id, **fields):
+        keys = self._keys(request_id)
+        if not self.redis.exists(keys["status"]):
+            return
+        with self.redis.pipeline() as pipe:
+            if "result" in fields:
+                pipe.set(keys["result"], zlib.compress(json.dumps(fields.pop("result")).encode()))
+            if fields:
+                pipe.hset(keys["status"], mapping={name: json.dumps(value) for name, value in fields.items()})
+            self._touch(pipe, keys)
+            pipe.execute()
+        self._notify(request_id)
+
+    def get(self, request_id, include_result=False):
+        keys = self._keys(request_id)
+        with self.redis.pipeline() as pipe:
+            pipe.hgetall(keys["status"])
+            if include_result:
+                pipe.get(keys["result"])
+            replies = pipe.execute()
+        if not replies[0]:
+            return None
+        status = {name.decode(): json.loads(value) for name, value in replies[0].items()}
+        if include_result and replies[1] is not None:
+            status["result"] = json.loads(zlib.decompress(replies[1]))
+        return status
+
+    def delete(self, request_id):
+        self.redis.delete(*self._keys(request_id).values())
+        self._notify(request_id)
+
+    def append_log(self, request_id, entry):
+        keys = self._keys(request_id)
+        if not self.redis.exists(keys["status"]):
+            return
+        with self.redis.pipeline() as pipe:
+            pipe.rpush(keys["logs"], json.dumps(entry))
+            pipe.ltrim(keys["logs"], -self.log_limit, -1)
+            pipe.incr(keys["log_count"])
+            self._touch(pipe, keys)
+            pipe.execute()
+
+    def get_logs(self, request_id, limit=10):
+        keys = self._keys(request_id)
+        with self.redis.pipeline() as pipe:
+            pipe.lrange(keys["logs"], -limit, -1)
+            pipe.get(keys["log_count"])
+            entries, total = pipe.execute()
+        return [json.loads(entry) for entry in entries], int(total or 0)
+
+    def append_event(self, request_id, event, data):
+        keys = self._keys(request_id)
+        if not self.redis.exists(keys["status"]):
+            return
+        with self.redis.pipeline() as pipe:
+            pipe.rpush(keys["events"], json.dumps({"event": event, "data": data}))
+            self._touch(pipe, keys)
+            pipe.execute()
+        self._notify(request_id)
+
+    def get_events(self, request_id, after=0):
+        entries = self.redis.lrange(self._keys(request_id)["events"], after, -1)
+        return [{"id": after + index + 1, **json.loads(entry)} for index, entry in enumerate(entries)]
+
+    def evict_expired(self):
+        # Keys expire in Redis itself
+        return 0
+
+def create_job_store():
+    """Build the job store selected by JOB_STORE"""
+    if JOB_STORE == "memory":
+        return MemoryJobStore()
+    if JOB_STORE == "redis":
+        return RedisJobStore()
+    if JOB_STORE != "sqlite":
+        logger.error(f"❌ Unknown JOB_STORE '{JOB_STORE}', using sqlite")
+    return SQLiteJobStore()
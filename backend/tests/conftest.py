@@ -0,0 +1,18 @@
+import os
+import tempfile
+
+# app.py configures its storage and clients from the environment at import time
+_root = tempfile.mkdtemp(prefix="clipweaver-tests-")
+for name, value in {
+    "JOB_STORE": "memory",
+    "JOB_BROKER": "local",
+    "OUTPUT_DIR": os.path.join(_root, "output"),
+    "RESULT_CACHE_DIR": os.path.join(_root, "cache", "results"),
+    "SCORE_INDEX_DIR": os.path.join(_root, "cache", "index"),
+    "OUTPUT_RETENTION_INTERVAL": "0",
+    "AZURE_OPENAI_ENDPOINT": "http://127.0.0.1:9",
+    "AZURE_OPENAI_KEY": "test",
+    "AZURE_OPENAI_API_VERSION": "2025-01-01-preview",
+    "AZURE_OPENAI_DEPLOYMENT_NAME": "test",
+}.items():
+    os.environ[name] = value
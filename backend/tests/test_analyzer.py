@@ -0,0 +1,90 @@
+import random
+import shutil
+import subprocess
+
+import pytest
+
+from analyzer import (
+    select_scene_boundaries, detect_scene_changes, list_keyframes, probe_video,
+    _detect_segmented, _segment_plan, _split_jpeg_stream, _split_webp_stream
+)
+
+FPS = 30
+DURATION = 30.0
+
+def score_curve(score_at):
+    """(pts_time, score) for every frame of a DURATION-second video"""
+    return [(frame / FPS, score_at(frame / FPS)) for frame in range(int(DURATION * FPS))]
+
+def test_flat_curve_is_divided_evenly():
+    boundaries = select_scene_boundaries(score_curve(lambda t: 0.0), DURATION, scene_threshold=0.06)
+    assert boundaries == [0.0, 10.0, 20.0, DURATION]
+
+def test_low_noise_curve_is_divided_evenly():
+    noise = random.Random(7)
+    boundaries = select_scene_boundaries(score_curve(lambda t: noise.uniform(0, 0.01)), DURATION, scene_threshold=0.06)
+    assert boundaries == [0.0, 10.0, 20.0, DURATION]
+
+def test_meaningful_change_below_threshold_is_used_for_splitting():
+    noise = random.Random(7)
+    curve = score_curve(lambda t: 0.04 if abs(t - 22) < 1e-9 else noise.uniform(0, 0.01))
+    boundaries = select_scene_boundaries(curve, DURATION, scene_threshold=0.06)
+    # The change at 22s splits the video; the remaining static scene is halved
+    assert boundaries == [0, 11.0, 22.0, DURATION]
+
+def test_cuts_above_threshold_are_kept():
+    curve = score_curve(lambda t: 0.5 if abs(t - 7) < 1e-9 else 0.0)
+    boundaries = select_scene_boundaries(curve, DURATION, scene_threshold=0.06, min_scenes=2)
+    assert boundaries == [0, 7.0, DURATION]
+
+def jpeg(entropy_data):
+    """Minimal JPEG marker layout: SOI, an APP0 segment, SOS with entropy-coded data, EOI"""
+    app0 = b'\xff\xe0' + (16).to_bytes(2, 'big') + b'JFIF\x00' + bytes(9)
+    sos = b'\xff\xda' + (8).to_bytes(2, 'big') + bytes(6)
+    return b'\xff\xd8' + app0 + sos + entropy_data + b'\xff\xd9'
+
+def webp(payload):
+    body = b'WEBP' + payload
+    return b'RIFF' + len(body).to_bytes(4, 'little') + body
+
+def test_split_jpeg_stream_skips_stuffed_bytes_and_restart_markers():
+    first = jpeg(b'\x12\xff\x00\x34\xff\xd0\x56')
+    second = jpeg(b'\xff\x00\xff\xd7')
+    assert _split_jpeg_stream(first + second) == [first, second]
+
+def test_split_jpeg_stream_drops_a_truncated_image():
+    whole = jpeg(b'\x01\x02')
+    assert _split_jpeg_stream(whole + jpeg(b'\x03\x04')[:-2]) == [whole]
+
+def test_split_jpeg_stream_ignores_riff_input():
+    assert _split_jpeg_stream(webp(b'VP8 ' + bytes(10))) == []
+
+def test_split_webp_stream_uses_riff_chunk_sizes():
+    first, second = webp(b'VP8 ' + b'\xff\xd9' * 5), webp(b'VP8L' + bytes(3))
+    assert _split_webp_stream(first + second) == [first, second]
+
+def test_segment_plan_with_a_late_first_keyframe():
+    # Video stream starting 1.5s after the container start, a keyframe every 2s
+    keyframes = [1.5 + 2 * n for n in range(10)]
+    plan = _segment_plan(21.5, keyframes, 3)
+    assert plan == [(0.0, 0.0, 5.5), (3.5, 5.5, 13.5), (11.5, 13.5, None)]
+    # Owned ranges cover the whole timeline and every later segment starts on a keyframe
+    assert [own_start for _, own_start, _ in plan[1:]] == [own_end for _, _, own_end in plan[:-1]]
+    assert all(decode_start in keyframes and decode_start < own_start for decode_start, own_start, _ in plan[1:])
+
+@pytest.mark.skipif(shutil.which("ffmpeg") is None, reason="needs ffmpeg")
+def test_segmented_scores_match_a_single_pass_when_video_starts_late(tmp_path):
+    # Scene changes every second; audio from 0s, video from 1.5s, so keyframes don't start at the container start
+    source, video = str(tmp_path / "source.mkv"), str(tmp_path / "late.mkv")
+    subprocess.run(["ffmpeg", "-v", "error", "-y", "-f", "lavfi", "-i", "testsrc=size=96x64:rate=25:duration=8",
+                    "-f", "lavfi", "-i", "sine=duration=10", "-g", "25", "-c:v", "libx264", "-c:a", "aac", source], check=True)
+    subprocess.run(["ffmpeg", "-v", "error", "-y", "-i", source, "-itsoffset", "1.5", "-i", source,
+                    "-map", "1:v", "-map", "0:a", "-c", "copy", video], check=True)
+    
+    keyframes = list_keyframes(video)
+    assert keyframes[0] == pytest.approx(1.5, abs=0.05)
+    
+    single = detect_scene_changes(video)['scores']
+    segmented = _detect_segmented(video, probe_video(video), 3)
+    assert single[0][0] == pytest.approx(keyframes[0])
+    assert [round(pts_time, 3) for pts_time, _ in segmented] == [round(pts_time, 3) for pts_time, _ in single]
@@ -0,0 +1,72 @@
+import os
+
+import pytest
+
+import app as pipeline
+
+@pytest.fixture
+def client():
+    return pipeline.app.test_client()
+
+def request_folders():
+    return os.listdir(pipeline.OUTPUT_DIR) if os.path.isdir(pipeline.OUTPUT_DIR) else []
+
+@pytest.mark.parametrize("fields, error", [
+    ({"scene_threshold": "high"}, "scene_threshold must be a number"),
+    ({"scene_threshold": "0"}, "scene_threshold must be greater than 0 and at most 1"),
+    ({"max_scenes": "ten"}, "max_scenes must be an integer"),
+    ({"max_scenes": "0"}, "max_scenes must be at least 1"),
+    ({"detector": "nope"}, "Unknown detector 'nope'"),
+])
+def test_invalid_options_are_rejected_before_ingest(client, fields, error):
+    before = request_folders()
+    response = client.post("/analyze", data={"video_url": "http://127.0.0.1:9/video.mp4", "async": "true", **fields})
+    assert response.status_code == 400
+    assert response.get_json()["error"].startswith(error)
+    # Nothing was downloaded, queued or left on disk
+    assert request_folders() == before
+    assert pipeline.job_store.jobs == {}
+
+def test_analysis_options_defaults():
+    assert pipeline.analysis_options({}) == {
+        "response_format": "markdown",
+        "detector": pipeline.DEFAULT_SCENE_DETECTOR,
+        "scene_threshold": 0.06,
+        "max_scenes": 10
+    }
+
+def test_job_finishes_when_scene_events_cannot_be_stored(monkeypatch, tmp_path):
+    from concurrent.futures import Future
+    
+    scene_dir = tmp_path / "job" / "scenes"
+    scene_dir.mkdir(parents=True)
+    video = tmp_path / "job" / "video.mp4"
+    video.write_bytes(b"not really a video")
+    scenes = [{"scene_num": n, "start": n * 2.0, "end": n * 2.0 + 2, "total_scenes": 2,
+               "screenshots": [{"position": "middle", "timestamp": n * 2.0 + 1, "path": str(scene_dir / f"{n}.jpg")}]}
+              for n in (1, 2)]
+    
+    def described(signature, describe, origin, fallback=None):
+        future = Future()
+        future.set_result(f"scene {origin['scene_num']}")
+        return future, None
+    
+    def broken_store(*args, **kwargs):
+        raise OSError("job store unavailable")
+    
+    monkeypatch.setattr(pipeline, "iter_scenes", lambda *args, **kwargs: iter(scenes))
+    monkeypatch.setattr(pipeline, "scene_signature", lambda scene: None)
+    monkeypatch.setattr(pipeline.frame_index, "describe", described)
+    monkeypatch.setattr(pipeline.result_cache, "put", lambda *args: None)
+    monkeypatch.setattr(pipeline.job_store, "append_event", broken_store)
+    
+    pipeline.job_store.create("store-failure")
+    try:
+        status = pipeline.process_video_async("store-failure", str(video), str(scene_dir), 0.06, 10, "json", "video.mp4", video.stat().st_size)
+        assert status == "completed"
+        job = pipeline.job_store.get("store-failure", include_result=True)
+        assert [scene["description"] for scene in job["result"]["scenes"]] == ["scene 1", "scene 2"]
+        logs, _ = pipeline.job_store.get_logs("store-failure", limit=50)
+        assert any("could not record progress" in entry["message"] for entry in logs)
+    finally:
+        pipeline.job_store.delete("store-failure")
@@ -0,0 +1,103 @@
+import os
+import asyncio
+import json
+
+import pytest
+
+import app as pipeline
+import asgi
+
+BOUNDARY = "clipweaver-test-boundary"
+
+def multipart(fields=(), files=()):
+    """multipart/form-data body with (name, value) fields and (name, filename, content) files"""
+    body = b""
+    for name, value in fields:
+        body += f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode()
+    for name, filename, content in files:
+        body += (f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'
+                 f'Content-Type: application/octet-stream\r\n\r\n').encode() + content + b"\r\n"
+    return body + f"--{BOUNDARY}--\r\n".encode()
+
+def post_analyze(body):
+    """(status, JSON body) of an /analyze request sent straight to the ASGI app"""
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "POST", "scheme": "http",
+        "path": "/analyze", "raw_path": b"/analyze", "query_string": b"", "root_path": "",
+        "headers": [(b"content-type", f"multipart/form-data; boundary={BOUNDARY}".encode()),
+                    (b"content-length", str(len(body)).encode())],
+        "client": ("127.0.0.1", 40000), "server": ("testserver", 80),
+    }
+    incoming = [{"type": "http.request", "body": body, "more_body": False}]
+    sent = []
+
+    async def receive():
+        return incoming.pop(0) if incoming else {"type": "http.disconnect"}
+
+    async def send(message):
+        sent.append(message)
+
+    asyncio.run(asgi.app(scope, receive, send))
+    start = next(message for message in sent if message["type"] == "http.response.start")
+    content = b"".join(message.get("body", b"") for message in sent if message["type"] == "http.response.body")
+    return start["status"], json.loads(content)
+
+@pytest.fixture
+def queued(monkeypatch):
+    """Stand-ins for the download and the job queue; records what was queued"""
+    jobs = []
+    monkeypatch.setattr(pipeline, "receive_video_url",
+                        lambda request_id, video_url, request_dir: ({"path": None, "size": 0, "sha256": None}, "video.mp4", None))
+    monkeypatch.setattr(pipeline, "queue_analysis", lambda request_id, *args: jobs.append((request_id, args)) or 1)
+    return jobs
+
+def test_blank_file_input_with_video_url_uses_the_url(queued):
+    # What a browser sends for a form whose file input was left empty
+    body = multipart(fields=[("video_url", "http://example.com/video.mp4"), ("async", "true")], files=[("video", "", b"")])
+    status, payload = post_analyze(body)
+    assert status == 202, payload
+    assert payload["status"] == "accepted"
+    assert queued[0][1][-1] == "http://example.com/video.mp4"
+
+def test_blank_file_input_alone_is_no_video(queued):
+    status, payload = post_analyze(multipart(fields=[("async", "true")], files=[("video", "", b"")]))
+    assert status == 400
+    assert payload["error"] == "Either video file or video_url must be provided"
+    assert queued == []
+
+def test_blank_file_input_matches_flask(queued):
+    body = multipart(fields=[("video_url", "http://example.com/video.mp4"), ("async", "true")], files=[("video", "", b"")])
+    response = pipeline.app.test_client().post("/analyze", data=body, content_type=f"multipart/form-data; boundary={BOUNDARY}")
+    assert response.status_code == post_analyze(body)[0] == 202
+
+def test_invalid_options_are_rejected_before_ingest(queued):
+    status, payload = post_analyze(multipart(fields=[("video_url", "http://example.com/video.mp4"), ("max_scenes", "many")]))
+    assert status == 400
+    assert payload["error"] == "max_scenes must be an integer"
+    assert queued == []
+
+def test_second_video_file_is_rejected(queued):
+    body = multipart(fields=[("async", "true")], files=[("video", "a.mp4", b"first"), ("video", "b.mp4", b"second")])
+    status, payload = post_analyze(body)
+    assert status == 400
+    assert payload["error"] == "Upload a single video file"
+    response = pipeline.app.test_client().post("/analyze", data=body, content_type=f"multipart/form-data; boundary={BOUNDARY}")
+    assert response.status_code == 400
+    assert response.get_json()["error"] == "Upload a single video file"
+    assert queued == []
+
+def test_blank_file_input_leaves_no_partial_upload(queued):
+    body = multipart(fields=[("video_url", "http://example.com/video.mp4"), ("async", "true")], files=[("video", "", b"")])
+    response = pipeline.app.test_client().post("/analyze", data=body, content_type=f"multipart/form-data; boundary={BOUNDARY}")
+    assert response.status_code == post_analyze(body)[0] == 202
+    leftovers = [name for _, _, names in os.walk(pipeline.OUTPUT_DIR) for name in names if name.startswith(".ingest-")]
+    assert leftovers == []
+
+@pytest.mark.parametrize("filename", ["clips/", "../"])
+def test_upload_filename_without_a_name_is_rejected(queued, filename):
+    body = multipart(fields=[("async", "true")], files=[("video", filename, b"\x00" * 16)])
+    status, payload = post_analyze(body)
+    assert (status, payload["error"]) == (400, "Invalid filename")
+    response = pipeline.app.test_client().post("/analyze", data=body, content_type=f"multipart/form-data; boundary={BOUNDARY}")
+    assert (response.status_code, response.get_json()["error"]) == (400, "Invalid filename")
+    assert queued == []
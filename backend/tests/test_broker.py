@@ -0,0 +1,104 @@
+import pytest
+
+import broker
+from jobs import QueueFullError
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def time(self):
+        return self.now
+
+    def monotonic(self):
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(broker, "time", clock)
+    return clock
+
+@pytest.fixture
+def queue(tmp_path, clock):
+    return broker.SQLiteBroker(path=str(tmp_path / "broker.db"), max_queued=3, visibility_timeout=60, max_attempts=2)
+
+def test_claims_are_handed_out_oldest_first(queue, clock):
+    for n in range(3):
+        assert queue.submit(f"job-{n}", {"n": n}) == n + 1
+        clock.now += 1
+    
+    lease = queue.claim("worker-a")
+    assert (lease.job_id, lease.payload, lease.attempt) == ("job-0", {"n": 0}, 1)
+    assert queue.state("job-0") == "running"
+    assert queue.position("job-0") is None
+    assert queue.position("job-2") == 2
+    assert queue.claim("worker-b").job_id == "job-1"
+    
+    queue.complete(lease)
+    assert queue.state("job-0") == "done"
+    assert queue.stats() == {"queued": 1, "running": 1, "workers": 0}
+
+def test_submit_refuses_jobs_beyond_max_queued(queue):
+    for n in range(3):
+        queue.submit(f"job-{n}", {})
+    with pytest.raises(QueueFullError):
+        queue.submit("job-3", {})
+    assert queue.state("job-3") is None
+
+def test_claim_on_an_empty_queue(queue):
+    assert queue.claim("worker-a") is None
+
+def test_expired_lease_is_reaped_back_to_the_front(queue, clock):
+    queue.submit("job-0", {})
+    clock.now += 1
+    queue.submit("job-1", {})
+    lease = queue.claim("worker-a")
+    
+    clock.now += 30
+    assert queue.heartbeat("worker-a", 2, ["job-0"]) == []
+    clock.now += 59
+    assert queue.reap() == []
+    
+    clock.now += 2
+    assert queue.reap() == [("job-0", 1, True)]
+    assert queue.position("job-0") == 1
+    # The lost worker's late heartbeat and completion no longer count
+    assert queue.heartbeat("worker-a", 2, ["job-0"]) == ["job-0"]
+    queue.complete(lease)
+    assert queue.state("job-0") == "queued"
+    
+    retry = queue.claim("worker-b")
+    assert (retry.job_id, retry.attempt) == ("job-0", 2)
+
+def test_jobs_fail_after_max_attempts(queue, clock):
+    queue.submit("job-0", {})
+    
+    # A failed run goes back to the queue while attempts remain
+    assert queue.fail(queue.claim("worker-a"), "boom") is True
+    assert queue.state("job-0") == "queued"
+    
+    # The last attempt's lease runs out: no attempts left, so the job fails for good
+    assert queue.claim("worker-a").attempt == 2
+    clock.now += 61
+    assert queue.reap() == [("job-0", 2, False)]
+    assert queue.state("job-0") == "failed"
+    assert queue.claim("worker-b") is None
+
+def test_last_failed_attempt_is_not_requeued(queue):
+    queue.submit("job-0", {})
+    queue.fail(queue.claim("worker-a"), "boom")
+    assert queue.fail(queue.claim("worker-a"), "boom again") is False
+    assert queue.state("job-0") == "failed"
+    assert queue.wait("job-0", timeout=0)
+
+def test_brokers_must_implement_the_whole_interface():
+    with pytest.raises(TypeError):
+        broker.Broker()
+    
+    class Partial(broker.Broker):
+        def submit(self, job_id, payload):
+            return 1
+    
+    with pytest.raises(TypeError):
+        Partial()
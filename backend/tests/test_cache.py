@@ -0,0 +1,40 @@
+import cache
+from cache import ResultCache
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def time(self):
+        return self.now
+
+def analysis(tmp_path):
+    scene_dir = tmp_path / "request" / "scenes"
+    scene_dir.mkdir(parents=True)
+    (scene_dir / "scene_001_middle.png").write_bytes(b"png")
+    scene = {"scene_num": 1, "start": 0.0, "end": 2.0, "total_scenes": 1,
+             "screenshots": [{"path": str(scene_dir / "scene_001_middle.png"), "timestamp": 1.0, "position": "middle"}]}
+    return [scene], ["A cat on a sofa"]
+
+def test_hits_materialise_screenshots(tmp_path):
+    results = ResultCache(root=str(tmp_path / "cache"))
+    key = ResultCache.make_key("abc", 0.06, 10, "gpt")
+    results.put(key, *analysis(tmp_path))
+    
+    scene_list, descriptions = results.get(key, str(tmp_path / "other" / "scenes"))
+    assert descriptions == ["A cat on a sofa"]
+    assert open(scene_list[0]["screenshots"][0]["path"], "rb").read() == b"png"
+    assert results.get(ResultCache.make_key("abc", 0.06, 10, "gpt", "numpy-fast"), str(tmp_path / "x")) is None
+
+def test_max_age_counts_from_creation_not_last_hit(tmp_path, monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(cache, "time", clock)
+    results = ResultCache(root=str(tmp_path / "cache"), max_age=100)
+    key = ResultCache.make_key("abc", 0.06, 10, "gpt")
+    results.put(key, *analysis(tmp_path))
+    
+    for _ in range(3):
+        clock.now += 30
+        assert results.get(key, str(tmp_path / "hit" / "scenes")) is not None
+    clock.now += 30
+    assert results.get(key, str(tmp_path / "late" / "scenes")) is None
@@ -0,0 +1,150 @@
+import openai
+import pytest
+
+import describer
+
+class FakeClock:
+    """Stands in for the time module: sleep() advances monotonic() instantly and records the waits"""
+
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+class FakeResponse:
+    def __init__(self, status_code, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+        self.request = None
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(describer, "time", clock)
+    return clock
+
+def test_token_bucket_allows_a_burst_then_paces_to_the_rate(clock):
+    bucket = describer.TokenBucket(rate_per_minute=60, capacity=3)
+    for _ in range(3):
+        bucket.acquire()
+    assert clock.sleeps == []
+    
+    bucket.acquire()
+    assert clock.sleeps == [pytest.approx(1.0)]
+
+def test_token_bucket_refills_up_to_capacity(clock):
+    bucket = describer.TokenBucket(rate_per_minute=60, capacity=2)
+    bucket.acquire()
+    bucket.acquire()
+    clock.now += 60
+    bucket.acquire()
+    bucket.acquire()
+    assert clock.sleeps == []
+    bucket.acquire()
+    assert sum(clock.sleeps) == pytest.approx(1.0)
+
+def test_token_bucket_pause_holds_back_callers(clock):
+    bucket = describer.TokenBucket(rate_per_minute=60, capacity=5)
+    bucket.pause(7.5)
+    bucket.pause(2.0)  # a shorter pause never cuts a longer one short
+    bucket.acquire()
+    assert sum(clock.sleeps) == pytest.approx(7.5)
+
+@pytest.mark.parametrize("headers, expected", [
+    ({"retry-after": "3"}, 3.0),
+    ({"retry-after": "0.5"}, 0.5),
+    ({"retry-after-ms": "1500", "retry-after": "9"}, 1.5),
+    ({"retry-after-ms": "soon", "retry-after": "9"}, 9.0),
+    ({"retry-after": "Thu, 01 Jan 1970 00:16:50 GMT"}, 10.0),  # HTTP date, 10s after the fake clock's now
+    ({"retry-after": "whenever"}, None),
+    ({}, None),
+])
+def test_retry_after_seconds(clock, headers, expected):
+    error = openai.RateLimitError("slow down", response=FakeResponse(429, headers), body=None)
+    assert describer._retry_after_seconds(error) == expected
+
+def test_retry_after_seconds_without_a_response():
+    assert describer._retry_after_seconds(ValueError("no response")) is None
+
+@pytest.mark.parametrize("error, retryable", [
+    (openai.RateLimitError("slow down", response=FakeResponse(429), body=None), True),
+    (openai.InternalServerError("oops", response=FakeResponse(500), body=None), True),
+    (openai.APIStatusError("unavailable", response=FakeResponse(503), body=None), True),
+    (openai.APIConnectionError(request=None), True),
+    (openai.BadRequestError("bad", response=FakeResponse(400), body=None), False),
+    (openai.AuthenticationError("key", response=FakeResponse(401), body=None), False),
+    (ValueError("not an API error"), False),
+])
+def test_is_retryable(error, retryable):
+    assert describer._is_retryable(error) is retryable
+
+@pytest.mark.parametrize("text, expected", [
+    ('{"scenes": [{"scene": 1, "description": "A cat"}, {"scene": 2, "description": " A dog "}]}', {1: "A cat", 2: "A dog"}),
+    ('Here you go:\n```json\n{"scenes": [{"scene": "2", "description": "A dog"}]}\n```', {2: "A dog"}),
+    ('{"scenes": [{"scene": 7, "description": "Not asked for"}, {"scene": 1, "description": ""}]}', {}),
+    ('{"scenes": [{"scene": null, "description": "x"}, "junk", {"scene": 1, "description": 3}]}', {}),
+    ('{"scenes": {"scene": 1}}', {}),
+    ('{"scenes": [', {}),
+    ("A cat, then a dog.", {}),
+    (None, {}),
+])
+def test_parse_batch_descriptions(text, expected):
+    assert describer.parse_batch_descriptions(text, {1, 2}) == expected
+
+class FakeCompletions:
+    """Chat completions that answer batched requests with a canned reply and single scenes by number"""
+
+    def __init__(self, batch_reply):
+        self.batch_reply = batch_reply
+        self.requests = []
+
+    def create(self, model, messages, max_tokens):
+        texts = [part["text"] for part in messages[1]["content"] if part["type"] == "text"]
+        self.requests.append(texts)
+        if len(texts) > 1:
+            if isinstance(self.batch_reply, Exception):
+                raise self.batch_reply
+            content = self.batch_reply
+        else:
+            content = f"single {texts[0].split('timeframe ')[1].split('s')[0]}"
+        message = type("Message", (), {"content": content})
+        return type("Response", (), {"choices": [type("Choice", (), {"message": message})], "usage": None})
+
+def scene(num):
+    return {"scene_num": num, "start": float(num), "end": num + 1.0,
+            "screenshots": [{"model_image": {"data": b"jpeg", "mime": "image/jpeg"}}]}
+
+def describe_batch(batch_reply):
+    completions = FakeCompletions(batch_reply)
+    client = type("Client", (), {"chat": type("Chat", (), {"completions": completions})})
+    scene_describer = describer.SceneDescriber(client, "test", concurrency=2, rate_limiter=describer.TokenBucket(60000, 100), max_retries=0)
+    try:
+        futures = scene_describer.submit_batch([scene(1), scene(2), scene(3)])
+        return [future.result(timeout=10) for future in futures], completions.requests
+    finally:
+        scene_describer.executor.shutdown()
+
+def test_batch_reply_is_split_per_scene():
+    reply = '{"scenes": [{"scene": 1, "description": "one"}, {"scene": 2, "description": "two"}, {"scene": 3, "description": "three"}]}'
+    descriptions, requests = describe_batch(reply)
+    assert descriptions == ["one", "two", "three"]
+    assert len(requests) == 1
+
+def test_scenes_missing_from_the_batch_reply_are_described_alone():
+    descriptions, requests = describe_batch('{"scenes": [{"scene": 2, "description": "two"}]}')
+    assert descriptions == ["single 1.0", "two", "single 3.0"]
+    assert len(requests) == 3
+
+def test_failed_batch_falls_back_to_one_request_per_scene():
+    descriptions, requests = describe_batch(openai.BadRequestError("too large", response=FakeResponse(400), body=None))
+    assert descriptions == ["single 1.0", "single 2.0", "single 3.0"]
+    assert len(requests) == 4
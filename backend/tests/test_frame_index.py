@@ -0,0 +1,62 @@
+from concurrent.futures import Future
+
+from frame_index import FrameIndex
+
+SIGNATURE = ("00000000000000ff", "0f0f0f0f0f0f0f0f", "ffffffffffffffff")
+NEAR_DUPLICATE = ("00000000000000fe", "0f0f0f0f0f0f0f0f", "ffffffffffffff7f")
+DIFFERENT = ("ffffffffffffff00", "f0f0f0f0f0f0f0f0", "0000000000000000")
+
+class Calls:
+    """Description requests made through describe(), each answered with a pending Future"""
+
+    def __init__(self):
+        self.futures = []
+
+    def submit(self):
+        future = Future()
+        self.futures.append(future)
+        return future
+
+def test_near_duplicates_share_one_request():
+    index, calls = FrameIndex(max_distance=2), Calls()
+    first, matched = index.describe(SIGNATURE, calls.submit, {"scene_num": 1})
+    assert matched is None
+    second, matched = index.describe(NEAR_DUPLICATE, calls.submit, {"scene_num": 2})
+    assert matched == {"scene_num": 1}
+    third, matched = index.describe(DIFFERENT, calls.submit, {"scene_num": 3})
+    assert matched is None
+    assert len(calls.futures) == 2
+    
+    calls.futures[0].set_result("A cat on a sofa")
+    assert second.result(timeout=1) == first.result() == "A cat on a sofa"
+
+def test_failed_shared_description_is_requested_again():
+    index, calls, fallback = FrameIndex(max_distance=2), Calls(), Calls()
+    first, _ = index.describe(SIGNATURE, calls.submit, {"scene_num": 1})
+    second, matched = index.describe(NEAR_DUPLICATE, calls.submit, {"scene_num": 2}, fallback=fallback.submit)
+    assert matched == {"scene_num": 1}
+    
+    calls.futures[0].set_exception(RuntimeError("rate limited"))
+    assert isinstance(first.exception(), RuntimeError)
+    assert not second.done()
+    assert len(fallback.futures) == 1
+    fallback.futures[0].set_result("A cat on a sofa")
+    assert second.result(timeout=1) == "A cat on a sofa"
+    
+    # The failed entry is gone, so the next match makes a request of its own
+    _, matched = index.describe(SIGNATURE, calls.submit, {"scene_num": 3})
+    assert matched is None
+
+def test_failed_fallback_fails_the_reusing_scene():
+    index, calls = FrameIndex(max_distance=2), Calls()
+    index.describe(SIGNATURE, calls.submit, {"scene_num": 1})
+    second, _ = index.describe(NEAR_DUPLICATE, calls.submit, {"scene_num": 2})
+    calls.futures[0].set_exception(RuntimeError("first"))
+    calls.futures[1].set_exception(RuntimeError("second"))
+    assert str(second.exception(timeout=1)) == "second"
+
+def test_scenes_without_a_signature_are_always_described():
+    index, calls = FrameIndex(), Calls()
+    index.describe(None, calls.submit, {"scene_num": 1})
+    index.describe(None, calls.submit, {"scene_num": 2})
+    assert len(calls.futures) == 2
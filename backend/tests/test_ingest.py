@@ -0,0 +1,94 @@
+import hashlib
+import struct
+
+import pytest
+
+from ingest import IngestError, IngestWriter, SNIFF_BYTES, is_streamable, sniff_container
+
+def box(name, payload=b""):
+    return struct.pack(">I4s", 8 + len(payload), name) + payload
+
+MP4 = box(b"ftyp", b"isom" + bytes(4)) + box(b"moov", bytes(32)) + box(b"mdat", bytes(64))
+
+@pytest.mark.parametrize("header, container", [
+    (MP4, "mp4"),
+    (box(b"ftyp", b"qt  " + bytes(4)), "mov"),
+    (box(b"mdat", bytes(16)), "mp4"),
+    (b"\x1a\x45\xdf\xa3" + bytes(8) + b"webm", "webm"),
+    (b"\x1a\x45\xdf\xa3" + bytes(8) + b"matroska", "matroska"),
+    (b"RIFF" + bytes(4) + b"AVI LIST", "avi"),
+    (b"RIFF" + bytes(4) + b"WAVEfmt ", None),
+    (b"\x00\x00\x01\xba" + bytes(12), "mpeg"),
+    ((b"\x47" + bytes(187)) * 2, "mpegts"),
+    (b"\x47" + bytes(187) + b"\x00", None),
+    (b"FLV\x01", "flv"),
+    (b"OggS\x00", "ogg"),
+    (b"\x30\x26\xb2\x75\x8e\x66\xcf\x11" + bytes(8), "asf"),
+    (b"<!DOCTYPE html>", None),
+])
+def test_sniff_container(header, container):
+    assert sniff_container(header) == container
+
+def reader(data):
+    return lambda offset, size: data[offset:offset + size]
+
+def test_is_streamable_only_when_moov_comes_first():
+    faststart = box(b"ftyp", b"isom" + bytes(4)) + box(b"moov", bytes(32)) + box(b"mdat", bytes(64))
+    moov_last = box(b"ftyp", b"isom" + bytes(4)) + box(b"mdat", bytes(64)) + box(b"moov", bytes(32))
+    assert is_streamable("mp4", reader(faststart))
+    assert not is_streamable("mp4", reader(moov_last))
+    assert not is_streamable("mov", reader(moov_last))
+
+def test_is_streamable_follows_64_bit_box_sizes():
+    large_free = struct.pack(">I4sQ", 1, b"free", 16 + 8) + bytes(8)
+    assert is_streamable("mp4", reader(box(b"ftyp") + large_free + box(b"moov")))
+
+def test_is_streamable_rejects_truncated_or_corrupt_headers():
+    assert not is_streamable("mp4", reader(box(b"ftyp")))
+    assert not is_streamable("mp4", reader(struct.pack(">I4s", 4, b"ftyp") + box(b"moov")))
+
+def test_other_containers_are_streamable():
+    assert is_streamable("webm", reader(b""))
+    assert is_streamable("mpegts", reader(b""))
+
+def test_writer_hashes_and_moves_the_video(tmp_path):
+    data = MP4 + bytes(SNIFF_BYTES)
+    writer = IngestWriter(str(tmp_path), max_bytes=0)
+    for start in range(0, len(data), 100):
+        writer.write(data[start:start + 100])
+    info = writer.finish(str(tmp_path / "video.mp4"))
+    assert info == {"path": str(tmp_path / "video.mp4"), "size": len(data),
+                    "sha256": hashlib.sha256(data).hexdigest(), "container": "mp4"}
+    assert (tmp_path / "video.mp4").read_bytes() == data
+    assert [path.name for path in tmp_path.iterdir()] == ["video.mp4"]
+
+def test_writer_rejects_oversized_videos_as_they_arrive(tmp_path):
+    writer = IngestWriter(str(tmp_path), max_bytes=len(MP4) + 10)
+    writer.write(MP4)
+    writer.write(bytes(10))
+    with pytest.raises(IngestError) as raised:
+        writer.write(b"\x00")
+    assert raised.value.status_code == 413
+    writer.discard()
+    assert list(tmp_path.iterdir()) == []
+
+def test_writer_rejects_unrecognized_containers(tmp_path):
+    writer = IngestWriter(str(tmp_path))
+    with pytest.raises(IngestError) as raised:
+        writer.write(b"<html>" + bytes(SNIFF_BYTES))
+    assert raised.value.status_code == 415
+    writer.discard()
+    
+    # Short inputs are sniffed when they are finished
+    writer = IngestWriter(str(tmp_path))
+    writer.write(b"<html>")
+    with pytest.raises(IngestError):
+        writer.finish(str(tmp_path / "video.mp4"))
+    writer.discard()
+    assert list(tmp_path.iterdir()) == []
+
+def test_writer_rejects_empty_videos(tmp_path):
+    writer = IngestWriter(str(tmp_path))
+    with pytest.raises(IngestError, match="Empty video"):
+        writer.finish(str(tmp_path / "video.mp4"))
+    writer.discard()
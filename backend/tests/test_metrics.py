@@ -0,0 +1,72 @@
+import pytest
+
+import metrics
+
+@pytest.fixture
+def registry(monkeypatch):
+    """Fresh registry that metrics created in the test register with"""
+    registry = metrics.Registry()
+    monkeypatch.setattr(metrics, "REGISTRY", registry)
+    return registry
+
+def test_histogram_buckets_are_cumulative(registry):
+    histogram = metrics.Histogram("test_seconds", "Test durations", ("stage",), buckets=(0.1, 1, 10))
+    for value in (0.05, 0.1, 0.5, 3, 30):
+        histogram.observe(value, stage="decode")
+    
+    assert histogram.render() == [
+        "# HELP test_seconds Test durations",
+        "# TYPE test_seconds histogram",
+        'test_seconds_bucket{stage="decode",le="0.1"} 2',
+        'test_seconds_bucket{stage="decode",le="1"} 3',
+        'test_seconds_bucket{stage="decode",le="10"} 4',
+        'test_seconds_bucket{stage="decode",le="+Inf"} 5',
+        'test_seconds_sum{stage="decode"} 33.65',
+        'test_seconds_count{stage="decode"} 5',
+    ]
+
+def test_histogram_label_sets_are_rendered_separately(registry):
+    histogram = metrics.Histogram("test_seconds", "Test durations", ("status",), buckets=(1.0,))
+    histogram.observe(2.0, status="error")
+    histogram.observe(0.5, status="completed")
+    
+    lines = histogram.render()[2:]
+    assert lines == [
+        'test_seconds_bucket{status="completed",le="1.0"} 1',
+        'test_seconds_bucket{status="completed",le="+Inf"} 1',
+        'test_seconds_sum{status="completed"} 0.5',
+        'test_seconds_count{status="completed"} 1',
+        'test_seconds_bucket{status="error",le="1.0"} 0',
+        'test_seconds_bucket{status="error",le="+Inf"} 1',
+        'test_seconds_sum{status="error"} 2.0',
+        'test_seconds_count{status="error"} 1',
+    ]
+
+def test_registry_renders_every_metric_in_order(registry):
+    requests = metrics.Counter("test_requests_total", "Requests by outcome", ("outcome",))
+    in_flight = metrics.Gauge("test_in_flight", "Requests in flight")
+    queued = metrics.Gauge("test_queued", "Queued jobs", function=lambda: 7)
+    requests.inc(outcome="success")
+    requests.inc(2, outcome="retry")
+    requests.inc(outcome="success")
+    in_flight.inc()
+    in_flight.inc()
+    in_flight.dec()
+    
+    assert registry.render() == "\n".join([
+        "# HELP test_requests_total Requests by outcome",
+        "# TYPE test_requests_total counter",
+        'test_requests_total{outcome="retry"} 2',
+        'test_requests_total{outcome="success"} 2',
+        "# HELP test_in_flight Requests in flight",
+        "# TYPE test_in_flight gauge",
+        "test_in_flight 1",
+        "# HELP test_queued Queued jobs",
+        "# TYPE test_queued gauge",
+        "test_queued 7",
+    ]) + "\n"
+
+def test_label_values_are_escaped(registry):
+    counter = metrics.Counter("test_total", "Escaping", ("reason",))
+    counter.inc(reason='bad "quote"\\\n')
+    assert counter.render()[-1] == 'test_total{reason="bad \\"quote\\"\\\\\\n"} 1'
@@ -0,0 +1,29 @@
+import numpy as np
+import pytest
+
+from numpy_detector import FrameScorer
+
+def frames(*levels):
+    """Flat gray 8x8 frames at the given pixel levels"""
+    return np.stack([np.full((8, 8), level, dtype=np.uint8) for level in levels])
+
+def test_static_frames_score_zero():
+    assert FrameScorer().score(frames(90, 90, 90)).tolist() == [0.0, 0.0, 0.0]
+
+def test_full_range_cut_scores_one():
+    assert FrameScorer().score(frames(0, 255))[1] == pytest.approx(1.0)
+
+def test_pixel_term_is_a_fraction_of_the_full_range():
+    # mafd 51/255 = 0.2 (as ffmpeg's scene filter measures it) averaged with a histogram distance of 1
+    assert FrameScorer().score(frames(0, 51))[1] == pytest.approx((0.2 + 1.0) / 2)
+
+def test_steady_change_is_damped():
+    # The same step every frame: mafd stays at 16/255 but barely changes, and the histograms keep moving
+    scores = FrameScorer().score(frames(0, 16, 32, 48, 64))
+    assert scores[2:].tolist() == pytest.approx([0.5, 0.5, 0.5])
+
+def test_scores_continue_across_batches():
+    whole = FrameScorer().score(frames(0, 40, 40, 200, 200, 10))
+    scorer = FrameScorer()
+    split = np.concatenate([scorer.score(frames(0, 40, 40)), scorer.score(frames(200, 200, 10))])
+    assert split.tolist() == pytest.approx(whole.tolist())
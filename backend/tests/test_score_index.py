@@ -0,0 +1,43 @@
+import json
+
+import numpy_detector
+from analyzer import scene_detector_settings
+from score_index import ScoreIndex
+
+DETECTION = {"duration": 4.0, "codec": "h264", "width": 640, "height": 360, "fps": 25.0,
+             "scores": [(0.0, 0.0), (0.04, 0.5), (0.08, 0.125)]}
+
+def test_scores_round_trip_with_matching_settings(tmp_path):
+    index = ScoreIndex(str(tmp_path)).open("abc123")
+    settings = {"width": 160, "height": 90, "pixel_format": "gray", "stride": 1}
+    index.save_scores("numpy-fast", DETECTION, settings)
+    assert index.load_scores("numpy-fast", dict(settings)) == DETECTION
+    assert index.load_scores("ffmpeg", {}) is None
+
+def test_scores_from_other_settings_are_a_miss(tmp_path):
+    index = ScoreIndex(str(tmp_path)).open("abc123")
+    index.save_scores("numpy-fast", DETECTION, {"width": 160, "height": 90, "pixel_format": "gray", "stride": 1})
+    assert index.load_scores("numpy-fast", {"width": 160, "height": 90, "pixel_format": "gray", "stride": 4}) is None
+    assert index.load_scores("numpy-fast", {"width": 160, "height": 90, "pixel_format": "gray", "keyframes_only": True}) is None
+
+def test_scores_stored_without_settings_are_a_miss(tmp_path):
+    index = ScoreIndex(str(tmp_path)).open("abc123")
+    index.save_scores("numpy-fast", DETECTION, {})
+    _, meta_path = index._scores_paths("numpy-fast")
+    with open(meta_path) as f:
+        meta = json.load(f)
+    del meta["settings"]
+    with open(meta_path, "w") as f:
+        json.dump(meta, f)
+    assert index.load_scores("numpy-fast", {}) is None
+
+def test_numpy_settings_follow_the_detector_configuration(monkeypatch):
+    baseline = scene_detector_settings("numpy-fast")
+    monkeypatch.setattr(numpy_detector, "NUMPY_DETECT_STRIDE", 3)
+    assert scene_detector_settings("numpy-fast") != baseline
+    
+    # Keyframe-only scoring needs a local file; a streamed source is sampled by stride instead
+    monkeypatch.setattr(numpy_detector, "NUMPY_DETECT_KEYFRAMES_ONLY", True)
+    assert scene_detector_settings("numpy-fast")["keyframes_only"] is True
+    assert scene_detector_settings("numpy-fast", source=object())["stride"] == 3
+    assert scene_detector_settings("ffmpeg") == {}
@@ -0,0 +1,126 @@
+import pytest
+
+import store
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def time(self):
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(store, "time", clock)
+    return clock
+
+@pytest.fixture(params=["memory", "sqlite"])
+def make_store(request, tmp_path):
+    """Factory for a fresh store of each local backend"""
+    def make(**kwargs):
+        if request.param == "memory":
+            return store.MemoryJobStore(**kwargs)
+        return store.SQLiteJobStore(path=str(tmp_path / "jobs.db"), **kwargs)
+    return make
+
+def log(message):
+    return {"timestamp": "2026-01-01T00:00:00", "level": "INFO", "message": message}
+
+def test_round_trip(make_store, clock):
+    jobs = make_store()
+    jobs.create("job")
+    assert jobs.get("job") == {"status": "queued", "progress": 0}
+    
+    result = {"status": "success", "scenes": [{"scene_number": 1, "description": "A cat"}]}
+    jobs.update("job", status="completed", progress=100, cache="miss", video={"width": 640}, result=result)
+    assert jobs.get("job") == {"status": "completed", "progress": 100, "cache": "miss", "video": {"width": 640}}
+    assert jobs.get("job", include_result=True)["result"] == result
+    
+    jobs.update("job", status="error", error="boom")
+    assert jobs.get("job")["error"] == "boom"
+    assert jobs.get("job")["cache"] == "miss"
+    
+    jobs.append_event("job", "scene", {"scene_number": 1})
+    jobs.append_event("job", "scene", {"scene_number": 2})
+    assert jobs.get_events("job") == [
+        {"id": 1, "event": "scene", "data": {"scene_number": 1}},
+        {"id": 2, "event": "scene", "data": {"scene_number": 2}},
+    ]
+    assert [event["id"] for event in jobs.get_events("job", after=1)] == [2]
+    
+    jobs.delete("job")
+    assert jobs.get("job") is None
+    assert jobs.get_logs("job") == ([], 0)
+    assert jobs.get_events("job") == []
+
+def test_unknown_jobs_are_ignored(make_store, clock):
+    jobs = make_store()
+    jobs.update("missing", status="processing")
+    jobs.append_log("missing", log("lost"))
+    jobs.append_event("missing", "scene", {})
+    assert jobs.get("missing") is None
+    assert jobs.get_logs("missing") == ([], 0)
+    assert jobs.get_events("missing") == []
+
+def test_logs_are_trimmed_to_the_limit(make_store, clock):
+    jobs = make_store(log_limit=3)
+    jobs.create("job")
+    for n in range(5):
+        jobs.append_log("job", log(f"line {n}"))
+    
+    logs, total = jobs.get_logs("job", limit=10)
+    assert [entry["message"] for entry in logs] == ["line 2", "line 3", "line 4"]
+    assert total == 5
+    logs, _ = jobs.get_logs("job", limit=2)
+    assert [entry["message"] for entry in logs] == ["line 3", "line 4"]
+
+def test_ttl_sweep_evicts_only_stale_jobs(make_store, clock):
+    jobs = make_store(ttl=60)
+    jobs.create("stale")
+    jobs.create("active")
+    jobs.append_log("stale", log("old"))
+    jobs.append_event("stale", "scene", {})
+    
+    clock.now += 45
+    jobs.update("active", progress=50)
+    clock.now += 30
+    
+    assert jobs.evict_expired() == 1
+    assert jobs.get("stale") is None
+    assert jobs.get_logs("stale") == ([], 0)
+    assert jobs.get_events("stale") == []
+    assert jobs.get("active")["progress"] == 50
+
+def test_create_sweeps_at_most_once_per_interval(make_store, clock):
+    jobs = make_store(ttl=60)
+    jobs.create("first")
+    clock.now += store.EVICTION_INTERVAL - 1
+    jobs.create("second")
+    assert jobs.get("first") is not None
+    
+    clock.now += 2 * store.EVICTION_INTERVAL
+    jobs.create("third")
+    assert jobs.get("first") is None
+    assert jobs.get("second") is None
+    assert jobs.get("third") is not None
+
+def test_logging_keeps_a_job_alive(make_store, clock):
+    jobs = make_store(ttl=60)
+    jobs.create("job")
+    clock.now += 45
+    jobs.append_log("job", log("still working"))
+    clock.now += 30
+    assert jobs.evict_expired() == 0
+    assert jobs.get("job") is not None
+
+def test_backends_must_implement_the_whole_interface():
+    with pytest.raises(TypeError):
+        store.JobStore()
+    
+    class Partial(store.JobStore):
+        def create(self, request_id, status="queued"):
+            pass
+    
+    with pytest.raises(TypeError):
+        Partial()
@@ -0,0 +1,111 @@
+import os
+import uuid
+import signal
+import socket
+import threading
+import logging
+
+from jobs import JOB_WORKERS
+from broker import BROKER_HEARTBEAT_INTERVAL, BROKER_POLL_INTERVAL
+
+logger = logging.getLogger(__name__)
+
+# Jobs one worker process runs at the same time
+WORKER_CONCURRENCY = int(os.getenv("WORKER_CONCURRENCY", JOB_WORKERS))
+
+class Worker:
+    """
+    Pulls jobs from a broker and runs them, heartbeating while they run
+
+    handler(lease) runs one attempt of a job and raises when the attempt
+    failed and should be retried. on_requeue(job_id, attempt, error,
+    requeued) is called for every failed attempt, whether the job failed
+    here or its lease expired on a worker that disappeared, so the caller
+    can update the job's status.
+    """
+
+    def __init__(self, broker, handler, on_requeue, concurrency=WORKER_CONCURRENCY, worker_id=None,
+                 heartbeat_interval=BROKER_HEARTBEAT_INTERVAL, poll_interval=BROKER_POLL_INTERVAL):
+        self.broker = broker
+        self.handler = handler
+        self.on_requeue = on_requeue
+        self.concurrency = max(1, concurrency)
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self.heartbeat_interval = heartbeat_interval
+        self.poll_interval = poll_interval
+        self.active = {}
+        self.lock = threading.Lock()
+        self.stopping = threading.Event()
+
+    def run(self):
+        """Work until stop() is called, then let running jobs finish"""
+        logger.info(f"👷 Worker {self.worker_id} started with {self.concurrency} slots")
+        self._heartbeat()
+        slots = [threading.Thread(target=self._slot, name=f"job-worker-{i}", daemon=True) for i in range(self.concurrency)]
+        for thread in slots:
+            thread.start()
+        while not self.stopping.wait(self.heartbeat_interval):
+            self._heartbeat()
+
+        logger.info(f"🛑 Worker {self.worker_id} stopping after {len(self.active)} running jobs")
+        for thread in slots:
+            while thread.is_alive():
+                # Keep leases alive while draining
+                thread.join(self.heartbeat_interval)
+                self._heartbeat()
+
+    def stop(self):
+        self.stopping.set()
+
+    def _heartbeat(self):
+        try:
+            with self.lock:
+                job_ids = list(self.active)
+            for job_id in self.broker.heartbeat(self.worker_id, self.concurrency, job_ids):
+                logger.warning(f"⚠️ Lost the lease on job {job_id}; another worker may run it again")
+            self._reap()
+        except Exception as e:
+            logger.error(f"❌ Heartbeat failed: {e}")
+
+    def _reap(self):
+        for job_id, attempt, requeued in self.broker.reap():
+            logger.warning(f"⚠️ Job {job_id} attempt {attempt} timed out on its worker")
+            self.on_requeue(job_id, attempt, "worker stopped responding", requeued)
+
+    def _slot(self):
+        while not self.stopping.is_set():
+            try:
+                lease = self.broker.claim(self.worker_id)
+            except Exception as e:
+                logger.error(f"❌ Claiming a job failed: {e}")
+                lease = None
+            if lease is None:
+                self.stopping.wait(self.poll_interval)
+                continue
+
+            with self.lock:
+                self.active[lease.job_id] = lease
+            try:
+                self.handler(lease)
+                self.broker.complete(lease)
+            except Exception as e:
+                logger.error(f"❌ Job {lease.job_id} attempt {lease.attempt} failed: {e}")
+                requeued = self.broker.fail(lease, str(e))
+                self.on_requeue(lease.job_id, lease.attempt, str(e), requeued)
+            finally:
+                with self.lock:
+                    self.active.pop(lease.job_id, None)
+
+def main():
+    # The app module holds the analysis pipeline and the shared job store, caches and describer
+    import app
+    if app.broker is None:
+        raise SystemExit("JOB_BROKER is 'local': jobs run inside the API process, there is nothing for a worker to pull")
+
+    worker = Worker(app.broker, app.run_queued_job, app.requeue_job)
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(signum, lambda *_: worker.stop())
+    worker.run()
+
+if __name__ == "__main__":
+    main()